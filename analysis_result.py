@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import time
+import uuid
+from typing import List
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Characters of leading text (prose, code fences) tolerated before the JSON object starts
+MAX_PREAMBLE_CHARS = 2000
+
+RESULT_FORMAT = """{
+    "overall_health": "string",
+    "potential_issues": ["string", ...],
+    "recommendations": ["string", ...],
+    "additional_insights": ["string", ...]
+}"""
+
+
+class AnalysisResult(BaseModel):
+    """
+    The network analysis requested from the agents.
+    """
+    overall_health: str
+    potential_issues: List[str]
+    recommendations: List[str]
+    additional_insights: List[str]
+
+
+class AnalysisParseError(ValueError):
+    """
+    Raised when a model reply does not contain a valid analysis result.
+    """
+
+
+class StreamingResultParser:
+    """
+    Incrementally scans model output for the analysis JSON object.
+
+    Text can be fed as it arrives; the parser fails as soon as the output cannot contain
+    a result (too much text before the object, or an unbalanced closing bracket) instead of
+    waiting for the whole reply, and validates the object once it is complete.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._preamble = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.result = None
+
+    def feed(self, chunk: str):
+        """
+        Feeds the next piece of output.
+
+        Returns:
+            AnalysisResult: The validated result once the JSON object is complete, otherwise None.
+
+        Raises:
+            AnalysisParseError: If the output is already known to be malformed.
+        """
+        if self.result is not None:
+            return self.result
+        for char in chunk:
+            if not self._started:
+                if char != '{':
+                    self._preamble += 1
+                    if self._preamble > MAX_PREAMBLE_CHARS:
+                        raise AnalysisParseError("no JSON object found at the start of the reply")
+                    continue
+                self._started = True
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth < 0:
+                    raise AnalysisParseError("unbalanced closing bracket in the JSON object")
+                if self._depth == 0:
+                    self.result = self._validate(''.join(self._buffer))
+                    return self.result
+        return None
+
+    def close(self) -> AnalysisResult:
+        """
+        Signals the end of the output and returns the result.
+
+        Raises:
+            AnalysisParseError: If no complete, valid result was found.
+        """
+        if self.result is None:
+            raise AnalysisParseError("the JSON object is incomplete" if self._started else "no JSON object found")
+        return self.result
+
+    @staticmethod
+    def _validate(text: str) -> AnalysisResult:
+        try:
+            return AnalysisResult.model_validate(json.loads(text))
+        except json.JSONDecodeError as e:
+            raise AnalysisParseError(f"invalid JSON: {e}") from e
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                               for error in e.errors())
+            raise AnalysisParseError(f"the JSON does not match the required format: {errors}") from e
+
+
+def parse_analysis_result(text: str) -> AnalysisResult:
+    """
+    Extracts and validates the analysis result from a model reply.
+
+    Raises:
+        AnalysisParseError: If the reply does not contain a valid result.
+    """
+    parser = StreamingResultParser()
+    parser.feed(text or '')
+    return parser.close()
+
+
+def repair_prompt(error: AnalysisParseError) -> str:
+    """
+    Builds the targeted follow-up asking the model to fix an unparseable reply.
+    """
+    return (
+        f"Your previous reply could not be used: {error}. Reply again with only the JSON object "
+        f"in exactly this format, with no other text:\n\n{RESULT_FORMAT}"
+    )
+
+
+def validate_with_repair(text: str, ask, max_repairs: int = None) -> AnalysisResult:
+    """
+    Validates a reply and, if it is malformed, asks for a corrected one.
+
+    Args:
+        text (str): The model reply.
+        ask (callable): Sends a follow-up prompt to the model and returns its reply text.
+        max_repairs (int): Maximum repair attempts, defaults to ANALYSIS_MAX_REPAIRS or 2.
+
+    Returns:
+        AnalysisResult: The validated result, or None if every attempt failed.
+    """
+    max_repairs = int(max_repairs if max_repairs is not None else os.getenv('ANALYSIS_MAX_REPAIRS', 2))
+    for attempt in range(max_repairs + 1):
+        try:
+            return parse_analysis_result(text)
+        except AnalysisParseError as e:
+            if attempt == max_repairs:
+                logger.error(f"Analysis result is still invalid after {max_repairs} repairs: {e}")
+                return None
+            logger.warning(f"Analysis result is invalid ({e}), asking for a repaired reply")
+            text = ask(f"{text}\n\n{repair_prompt(e)}")
+
+
+def make_validation_reply(max_repairs: int = None):
+    """
+    Returns a reply function for the agent that started the chat.
+
+    It validates each analysis as soon as it arrives: a valid result ends the chat, and a malformed
+    one is answered with a targeted repair prompt until max_repairs is reached.
+
+    Register it with config={'count': 0} to count the repairs per chat: agent.reset() restores
+    that config, so an agent reused for another chat gets max_repairs again.
+    """
+    max_repairs = int(max_repairs if max_repairs is not None else os.getenv('ANALYSIS_MAX_REPAIRS', 2))
+    default_attempts = {'count': 0}
+
+    def validation_reply(recipient, messages=None, sender=None, config=None):
+        attempts = config if config is not None else default_attempts
+        content = (messages or [{}])[-1].get('content')
+        try:
+            parse_analysis_result(content if isinstance(content, str) else '')
+            return True, None
+        except AnalysisParseError as e:
+            if attempts['count'] >= max_repairs:
+                logger.error(f"Analysis result is still invalid after {max_repairs} repairs: {e}")
+                return True, None
+            attempts['count'] += 1
+            logger.warning(f"Analysis result is invalid ({e}), asking for a repaired reply")
+            return True, repair_prompt(e)
+
+    return validation_reply
+
+
+def find_analysis_result(chat_history: list):
+    """
+    Returns the last valid analysis result in a chat history, or None.
+    """
+    for message in reversed(chat_history or []):
+        content = message.get('content')
+        if not isinstance(content, str):
+            continue
+        try:
+            return parse_analysis_result(content)
+        except AnalysisParseError:
+            continue
+    return None
+
+
+def save_analysis_result(directory: str, result: AnalysisResult, **metadata) -> str:
+    """
+    Writes the typed result next to the snapshot it was produced from.
+
+    Returns:
+        str: Path of the written file.
+    """
+    path = os.path.join(directory, 'analysis_result.json')
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'created': time.time(), **metadata, 'result': result.model_dump()}, f, indent=2)
+    os.replace(tmp_path, path)
+    logger.debug(f"Saved analysis result to {path}")
+    return path
@@ -0,0 +1,161 @@
+import logging
+
+import numpy as np
+
+from network_model import NetworkIndex, network_index, numeric_column
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (10, 50, 90)
+
+
+def _round(value, digits=1):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _group_percentiles(groups: dict, values: np.ndarray) -> dict:
+    """
+    Computes PERCENTILES of values per group of row positions, ignoring NaN.
+
+    The groups are padded into one NaN-filled matrix so all percentiles are computed with
+    vectorized operations instead of one np.percentile call per group.
+    """
+    if not groups:
+        return {}
+    matrix = np.full((len(groups), max(len(positions) for positions in groups.values())), np.nan)
+    for row, positions in enumerate(groups.values()):
+        matrix[row, :len(positions)] = values[positions]
+    # NaN sorts last, so each row starts with its valid values; interpolate linearly like np.percentile
+    matrix.sort(axis=1)
+    counts = (~np.isnan(matrix)).sum(axis=1)
+    rows = np.arange(len(groups))
+    positions = np.maximum(counts - 1, 0)[:, None] * (np.array(PERCENTILES) / 100)
+    lower = np.floor(positions).astype(int)
+    upper = np.ceil(positions).astype(int)
+    low_values = matrix[rows[:, None], lower]
+    percentiles = low_values + (matrix[rows[:, None], upper] - low_values) * (positions - lower)
+    return {
+        key: [_round(value) for value in percentiles[row]] if counts[row] else None
+        for row, key in enumerate(groups)
+    }
+
+
+def ap_client_statistics(index: NetworkIndex) -> list:
+    """
+    Aggregates wireless clients per access point.
+
+    Returns:
+        list: One row per AP with client count and p10/p50/p90 of signal, SNR and retry rate.
+    """
+    groups = index.client_positions_by_ap()
+    if not groups:
+        return []
+
+    clients = index.clients
+    signal = clients['signal']
+    snr = signal - clients['noise']
+    retries = clients['tx_retries']
+    attempts = clients['wifi_tx_attempts']
+    packets = clients['tx_packets']
+    denominator = np.where(attempts > 0, attempts, packets)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        retry_rate = np.where(denominator > 0, 100 * retries / denominator, np.nan)
+
+    signal_pct = _group_percentiles(groups, signal)
+    snr_pct = _group_percentiles(groups, snr)
+    retry_pct = _group_percentiles(groups, retry_rate)
+    return [
+        {
+            'ap_mac': mac,
+            'ap_name': (index.device(mac) or {}).get('name'),
+            'clients': len(positions),
+            'signal_dbm_p10_p50_p90': signal_pct[mac],
+            'snr_db_p10_p50_p90': snr_pct[mac],
+            'retry_pct_p10_p50_p90': retry_pct[mac],
+        }
+        for mac, positions in groups.items()
+    ]
+
+
+def channel_statistics(index: NetworkIndex) -> list:
+    """
+    Aggregates access point radios per band and channel from radio_table_stats.
+
+    Returns:
+        list: One row per (radio, channel) with AP count, clients and channel utilization.
+    """
+    on_channel = np.array([radio.channel is not None for radio in index.radios], dtype=bool)
+    if not on_channel.any():
+        return []
+
+    keys = np.array([f"{radio.radio or '?'}/{radio.channel}" for radio in index.radios])[on_channel]
+    clients = np.nan_to_num(index.radio_columns['num_sta'][on_channel])
+    utilization = index.radio_columns['cu_total'][on_channel]
+
+    unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    total_clients = np.bincount(inverse, weights=clients, minlength=len(unique_keys))
+    rows = []
+    for group_id, key in enumerate(unique_keys.tolist()):
+        group = utilization[inverse == group_id]
+        group = group[~np.isnan(group)]
+        radio, channel = key.split('/', 1)
+        rows.append({
+            'radio': radio,
+            'channel': int(channel) if channel.isdigit() else channel,
+            'aps': int(counts[group_id]),
+            'clients': int(total_clients[group_id]),
+            'utilization_mean_pct': _round(group.mean()) if group.size else None,
+            'utilization_peak_pct': _round(group.max()) if group.size else None,
+        })
+    return rows
+
+
+def hourly_statistics(historical_data: list) -> list:
+    """
+    Aggregates hourly site statistics by hour of day (UTC).
+
+    Returns:
+        list: One row per hour of day with mean and peak wireless clients and traffic.
+    """
+    records = [record for record in historical_data or [] if isinstance(record.get('time'), (int, float))]
+    if not records:
+        return []
+
+    hours = (numeric_column(records, 'time') // 3_600_000 % 24).astype(int)
+    wireless = numeric_column(records, 'wlan-num_sta')
+    clients = np.where(np.isnan(wireless), numeric_column(records, 'num_sta'), wireless)
+    traffic = numeric_column(records, 'wlan_bytes')
+
+    rows = []
+    for hour in np.unique(hours).tolist():
+        mask = hours == hour
+        hour_clients = clients[mask][~np.isnan(clients[mask])]
+        hour_traffic = traffic[mask][~np.isnan(traffic[mask])]
+        rows.append({
+            'hour_utc': hour,
+            'samples': int(mask.sum()),
+            'clients_mean': _round(hour_clients.mean()) if hour_clients.size else None,
+            'clients_peak': _round(hour_clients.max(), 0) if hour_clients.size else None,
+            'wlan_mbytes_mean': _round(hour_traffic.mean() / 1e6) if hour_traffic.size else None,
+        })
+    return rows
+
+
+def summarize_network(data: dict) -> dict:
+    """
+    Computes the compact statistics tables handed to the agents instead of raw client and history data.
+
+    Args:
+        data (dict): Loaded datasets keyed by name.
+
+    Returns:
+        dict: Tables of per-AP client, per-channel and per-hour statistics.
+    """
+    index = network_index(data)
+    summary = {
+        'ap_clients': ap_client_statistics(index),
+        'channels': channel_statistics(index),
+        'hourly': hourly_statistics(data.get('historical_data')),
+    }
+    logger.debug(f"Network summary computed: {', '.join(f'{k}={len(v)}' for k, v in summary.items())}")
+    return summary
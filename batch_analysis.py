@@ -0,0 +1,379 @@
+"""
+Batch analysis of many snapshots with shared agents, a bounded worker pool and LLM throttling.
+
+Analyzes the sites of a fleet collection or the stored snapshots (points in time) of one site
+within one process, e.g. for a nightly fleet-wide review:
+
+    python batch_analysis.py --fleet fleet_data --workers 4 --deadline 3600 --output batch.json
+    python batch_analysis.py --history path/to/data --last 24
+    python batch_analysis.py path/to/site_a path/to/site_b
+
+Or from Python:
+
+    results = BatchAnalyzer(max_workers=4).analyze({'hq': 'fleet_data/unifi_local/default'})
+
+Agents and their LLM clients are created once and reused by every analysis. LLM requests of
+all workers go through one LLMRateLimiter, which keeps them under LLM_MAX_RPM with at most
+LLM_MAX_CONCURRENCY in flight and pauses every worker when the API answers 429.
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from load_data import DataLoader
+from monitor_llm import LLMUsageMonitor
+from snapshot_io import find_dataset
+from snapshot_store import SnapshotStore, resolve_snapshot_directory
+from tracing import span, trace_run
+from unifi_ai_agents import check_llm_config, create_analysis_agent, create_group_chat, run_analysis
+
+logger = logging.getLogger(__name__)
+
+
+def _status_code(error):
+    response = getattr(error, 'response', None)
+    return getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+
+
+def _retry_after(error):
+    # Seconds the API asked to wait, from the Retry-After(-ms) headers of the 429 response
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    for name, scale in (('retry-after-ms', 1000), ('retry-after', 1)):
+        try:
+            return float(headers.get(name)) / scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class LLMRateLimiter:
+    """
+    Throttles the LLM requests of all threads of a batch.
+
+    Requests are spaced to stay under a requests-per-minute limit, and at most max_concurrent
+    are in flight. A 429 response pauses every thread for the Retry-After time (or an
+    exponential backoff) before the request is retried.
+    """
+
+    def __init__(self, requests_per_minute: float = None, max_concurrent: int = None, retries: int = None,
+                 backoff: float = None):
+        """
+        Initializes the limiter.
+
+        Args:
+            requests_per_minute (float): Request rate limit, defaults to LLM_MAX_RPM; 0 disables it.
+            max_concurrent (int): Requests in flight, defaults to LLM_MAX_CONCURRENCY or 8.
+            retries (int): Retries of a rate limited request, defaults to LLM_RATE_LIMIT_RETRIES or 5.
+            backoff (float): Base of the exponential backoff in seconds when the 429 response has
+                no Retry-After header, defaults to LLM_RATE_LIMIT_BACKOFF or 1.
+        """
+        self.requests_per_minute = float(requests_per_minute if requests_per_minute is not None
+                                         else os.getenv('LLM_MAX_RPM', 0))
+        self.max_concurrent = int(max_concurrent or os.getenv('LLM_MAX_CONCURRENCY', 8))
+        self.retries = int(retries if retries is not None else os.getenv('LLM_RATE_LIMIT_RETRIES', 5))
+        self.backoff = float(backoff if backoff is not None else os.getenv('LLM_RATE_LIMIT_BACKOFF', 1.0))
+        self.requests = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+        self._paused_until = 0.0
+
+    def _wait_for_turn(self) -> None:
+        interval = 60 / self.requests_per_minute if self.requests_per_minute > 0 else 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request, self._paused_until)
+            self._next_request = start + interval
+            self.requests += 1
+            self.wait_seconds += start - now
+        if start > now:
+            time.sleep(start - now)
+
+    def _pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.rate_limited += 1
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls function once it is this request's turn, retrying it while it is rate limited.
+        """
+        for attempt in range(self.retries + 1):
+            with self._slots:
+                self._wait_for_turn()
+                try:
+                    return function(*args, **kwargs)
+                except Exception as e:
+                    if _status_code(e) != 429 or attempt == self.retries:
+                        raise
+                    delay = _retry_after(e) or self.backoff * 2 ** attempt
+            logger.warning(f"LLM rate limit reached, pausing requests for {delay:.1f}s "
+                           f"(retry {attempt + 1}/{self.retries})")
+            self._pause(delay)
+
+    @contextmanager
+    def throttle(self):
+        """
+        Routes every autogen LLM request made inside the block through the limiter.
+        """
+        from autogen.oai.client import OpenAIWrapper
+
+        original = OpenAIWrapper.create
+        limiter = self
+
+        def create(wrapper_self, **config):
+            return limiter.call(original, wrapper_self, **config)
+
+        OpenAIWrapper.create = create
+        try:
+            yield self
+        finally:
+            OpenAIWrapper.create = original
+
+
+class AgentPool:
+    """
+    Agents shared by the analyses of a batch, so their LLM clients and connections are reused.
+
+    The single-prompt agents of the map, section, merge and repair steps keep no state between
+    calls and are shared by all threads, one per model tier. Group chats keep the conversation,
+    so each is used by one analysis at a time and reset before it is reused.
+    """
+
+    def __init__(self):
+        self._agents = {}
+        self._lock = threading.Lock()
+        self._idle_group_chats = queue.SimpleQueue()
+
+    def analysis_agent(self, name: str = "Assistant", role: str = "recommendations"):
+        # Same signature as create_analysis_agent; the agent is named after its tier, not the caller
+        with self._lock:
+            agent = self._agents.get(role)
+            if agent is None:
+                agent = self._agents[role] = create_analysis_agent(f"{role.title()}_Agent", role)
+            return agent
+
+    @contextmanager
+    def group_chat(self):
+        """
+        Yields the user proxy and GroupChatManager of an idle group chat, or of a new one.
+        """
+        try:
+            user_proxy, group_chat_manager = self._idle_group_chats.get_nowait()
+        except queue.Empty:
+            user_proxy, group_chat_manager = create_group_chat()
+        else:
+            # Forget the previous analysis: messages, reply counters and repair attempts
+            group_chat_manager.groupchat.reset()
+            for agent in (group_chat_manager, *group_chat_manager.groupchat.agents):
+                agent.reset()
+        try:
+            yield user_proxy, group_chat_manager
+        finally:
+            self._idle_group_chats.put((user_proxy, group_chat_manager))
+
+
+def fleet_snapshots(output_dir: str) -> dict:
+    """
+    Finds the site directories of a fleet collection (<output_dir>/<controller>/<site>).
+
+    Returns:
+        dict: Site data directories keyed by controller/site.
+    """
+    sites = {}
+    for controller in sorted(os.listdir(output_dir)):
+        controller_dir = os.path.join(output_dir, controller)
+        if not os.path.isdir(controller_dir):
+            continue
+        for site in sorted(os.listdir(controller_dir)):
+            site_dir = os.path.join(controller_dir, site)
+            if SnapshotStore(site_dir).latest_id() or find_dataset(site_dir, 'device_config'):
+                sites[f"{controller}/{site}"] = site_dir
+    return sites
+
+
+def snapshot_history(directory: str, last: int = None) -> dict:
+    """
+    Lists the stored snapshots of a data directory, oldest first.
+
+    Args:
+        directory (str): Data directory holding the snapshots directory.
+        last (int): Only the newest this many snapshots.
+
+    Returns:
+        dict: Snapshot directories keyed by snapshot id.
+    """
+    store = SnapshotStore(directory)
+    snapshot_ids = store.snapshots()
+    if last:
+        snapshot_ids = snapshot_ids[-last:]
+    return {snapshot_id: store.path(snapshot_id) for snapshot_id in snapshot_ids}
+
+
+class BatchAnalyzer:
+    """
+    Runs many snapshots (sites of a fleet or points in time of a site) through the agents.
+
+    Snapshots are analyzed by a bounded pool of workers, each in the ANALYSIS_MODE configured
+    for single runs, with one AgentPool and one LLMRateLimiter shared by all of them.
+    """
+
+    def __init__(self, max_workers: int = None, rate_limiter: LLMRateLimiter = None, deadline: float = None):
+        """
+        Initializes the analyzer.
+
+        Args:
+            max_workers (int): Snapshots analyzed concurrently, defaults to BATCH_MAX_WORKERS or 4.
+            rate_limiter (LLMRateLimiter): Throttling of the LLM requests, configured from the
+                environment by default.
+            deadline (float): Seconds after the start of a batch after which no further snapshot
+                is started; the remaining ones are reported as skipped. No deadline by default.
+        """
+        self.max_workers = max_workers or int(os.getenv('BATCH_MAX_WORKERS', 4))
+        self.rate_limiter = rate_limiter or LLMRateLimiter()
+        self.deadline = deadline
+        self.agents = AgentPool()
+        self.monitor = LLMUsageMonitor()
+
+    def _analyze_one(self, name: str, directory: str, batch_started: float, submitted: float,
+                     duplicate_of: str = None) -> dict:
+        started = time.perf_counter()
+        timing = {'queued': started - submitted}
+        item = {'name': name, 'directory': directory, 'snapshot': None, 'status': 'failed',
+                'result': None, 'error': None, 'timing': timing}
+        if duplicate_of is not None:
+            item['status'] = 'skipped'
+            item['error'] = f"Same snapshot as {duplicate_of}"
+        elif self.deadline is not None and started - batch_started > self.deadline:
+            item['status'] = 'skipped'
+            item['error'] = f"Not started within the {self.deadline:g}s deadline"
+        if item['status'] == 'skipped':
+            item['timing'] = {'queued': round(timing['queued'], 3)}
+            return item
+
+        with span('batch_item', item=name):
+            try:
+                data_loader = DataLoader(directory)
+                data = data_loader.load_all_data(exit_on_error=False)
+                item['snapshot'] = data_loader.snapshot_directory
+                loaded = time.perf_counter()
+                timing['load'] = loaded - started
+                item['result'] = run_analysis(data_loader, data, agents=self.agents)
+                timing['analysis'] = time.perf_counter() - loaded
+                item['status'] = 'ok'
+            except Exception as e:
+                logger.error(f"Analysis of {name} failed: {e}")
+                item['error'] = f"{type(e).__name__}: {e}"
+        timing['total'] = time.perf_counter() - started
+        item['timing'] = {stage: round(seconds, 3) for stage, seconds in timing.items()}
+        logger.info(f"Analysis of {name}: {item['status']} in {item['timing']['total']:.2f}s")
+        return item
+
+    def analyze(self, snapshots) -> dict:
+        """
+        Analyzes the snapshots.
+
+        Args:
+            snapshots (dict | list): Data or snapshot directories, keyed by the name to report
+                them under (e.g. controller/site or snapshot id); a list is keyed by directory.
+
+        Each snapshot's analysis result and baseline are saved in its own snapshot directory (see
+        run_analysis), so items never write the same files; a snapshot listed twice is analyzed
+        once and its other entries are skipped.
+
+        Returns:
+            dict: 'items' in the given order, each with its status (ok, failed or skipped),
+            analysis result, error and timing in seconds (queued, load, analysis, total), and a
+            'summary' with the counts, wall time, throughput, LLM usage and rate limiting.
+        """
+        if not isinstance(snapshots, dict):
+            snapshots = {directory: directory for directory in snapshots}
+        limiter = self.rate_limiter
+        requests, rate_limited, wait_seconds = limiter.requests, limiter.rate_limited, limiter.wait_seconds
+        calls = len(self.monitor.calls)
+        first_names = {}
+        duplicates = {}
+        for name, directory in snapshots.items():
+            first = first_names.setdefault(os.path.realpath(resolve_snapshot_directory(directory)), name)
+            if first != name:
+                duplicates[name] = first
+
+        with self.monitor.instrument(), limiter.throttle(), span('batch', items=len(snapshots)), \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            started = time.perf_counter()
+            futures = [executor.submit(self._analyze_one, name, directory, started, time.perf_counter(),
+                                       duplicates.get(name))
+                       for name, directory in snapshots.items()]
+            items = [future.result() for future in futures]
+        wall = time.perf_counter() - started
+
+        batch_calls = self.monitor.calls[calls:]
+        totals = [item['timing']['total'] for item in items if item['status'] != 'skipped']
+        succeeded = sum(item['status'] == 'ok' for item in items)
+        summary = {
+            'items': len(items),
+            'succeeded': succeeded,
+            'failed': sum(item['status'] == 'failed' for item in items),
+            'skipped': sum(item['status'] == 'skipped' for item in items),
+            'workers': self.max_workers,
+            'wall_seconds': round(wall, 3),
+            'throughput_per_minute': round(succeeded / wall * 60, 2) if wall else None,
+            'item_seconds': {'mean': round(sum(totals) / len(totals), 3) if totals else None,
+                             'max': max(totals) if totals else None},
+            'llm_calls': len(batch_calls),
+            'llm_tokens': sum(call['prompt_tokens'] + call['completion_tokens'] for call in batch_calls),
+            'llm_cost': sum(call['cost'] for call in batch_calls),
+            'llm_requests': limiter.requests - requests,
+            'rate_limited': limiter.rate_limited - rate_limited,
+            'throttle_seconds': round(limiter.wait_seconds - wait_seconds, 3),
+        }
+        logger.info(f"Batch of {len(items)} snapshots: {summary['succeeded']} ok, {summary['failed']} failed, "
+                    f"{summary['skipped']} skipped in {wall:.1f}s; {summary['llm_calls']} LLM calls, "
+                    f"{summary['rate_limited']} rate limited")
+        return {'summary': summary, 'items': items}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze many snapshots with shared agents.")
+    parser.add_argument('directories', nargs='*', help="data or snapshot directories to analyze")
+    parser.add_argument('--fleet', help="analyze every site of a fleet collection output directory")
+    parser.add_argument('--history', help="analyze the stored snapshots of a data directory")
+    parser.add_argument('--last', type=int, help="with --history, only the newest N snapshots")
+    parser.add_argument('--workers', type=int, help="snapshots analyzed concurrently")
+    parser.add_argument('--rpm', type=float, help="LLM requests per minute, overrides LLM_MAX_RPM")
+    parser.add_argument('--deadline', type=float, help="seconds after which no further snapshot is started")
+    parser.add_argument('--trace', help="write a trace of the batch to this file")
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    check_llm_config()
+
+    snapshots = {directory: directory for directory in args.directories}
+    if args.fleet:
+        snapshots.update(fleet_snapshots(args.fleet))
+    if args.history:
+        snapshots.update(snapshot_history(args.history, args.last))
+    if not snapshots:
+        parser.error("no snapshots given, pass directories, --fleet or --history")
+
+    analyzer = BatchAnalyzer(args.workers, LLMRateLimiter(requests_per_minute=args.rpm), args.deadline)
+    with trace_run("batch", path=args.trace):
+        results = analyzer.analyze(snapshots)
+
+    print(json.dumps(results['summary'], indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
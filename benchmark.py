@@ -0,0 +1,153 @@
+"""
+Benchmarks collection, loading and prompt building against the local mock controller.
+
+For each site size the suite measures collection wall time, the memory allocated while
+loading the snapshot, channel planning time, prompt build time and prompt size in tokens:
+
+    python benchmark.py --sizes small medium --latency 0.02 --output bench.json
+    python benchmark.py --compare bench.json
+
+With --compare the run fails (exit code 1) when a metric is worse than the baseline by more
+than --tolerance.
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from channel_planner import plan_channels
+from load_data import DataLoader
+from mock_controller import MockController, generate_site
+from response_cache import ResponseCache
+from test_connection import DataCollector
+
+logger = logging.getLogger(__name__)
+
+# Access points and clients per site size
+BENCHMARK_SIZES = {
+    'small': (3, 50),
+    'medium': (50, 1_000),
+    'large': (500, 10_000),
+    'xlarge': (2_000, 40_000),
+}
+
+METRICS = ('collect_seconds', 'load_peak_mb', 'plan_seconds', 'prompt_seconds', 'prompt_tokens')
+
+
+def benchmark_site(num_aps: int, num_clients: int, latency: float = 0.0, repeat: int = 3,
+                   token_budget: int = None, model: str = None) -> dict:
+    """
+    Collects a synthetic site from a mock controller, then loads it and builds the prompt.
+
+    Args:
+        num_aps (int): Access points of the site.
+        num_clients (int): Clients of the site.
+        latency (float): Seconds the mock controller adds to every response.
+        repeat (int): Runs per measurement; the median is reported.
+        token_budget (int): Prompt token budget, defaults to PROMPT_TOKEN_BUDGET or the model default.
+        model (str): Model the prompt is built for, defaults to MODEL_AGENT.
+
+    Returns:
+        dict: The measured metrics plus the site size and request count.
+    """
+    controller = MockController({'default': generate_site(num_aps, num_clients)}, latency=latency)
+    with controller, tempfile.TemporaryDirectory() as directory:
+        collect_times = []
+        for _ in range(repeat):
+            # No response cache or stored session: every run fetches everything from the controller
+            collector = DataCollector(base_url=controller.url, username='admin', password='admin',
+                                      site='default', output_dir=directory, cache=ResponseCache(ttl=0),
+                                      history_db='')
+            collector.session_store = None
+            started = time.perf_counter()
+            collector.collect_data()
+            collect_times.append(time.perf_counter() - started)
+
+        loader = DataLoader(directory)
+        peaks = []
+        for _ in range(repeat):
+            tracemalloc.start()
+            data = loader.load_all_data(exit_on_error=False)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        plan_times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            plan_channels(data)
+            plan_times.append(time.perf_counter() - started)
+
+        prompt_times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            loader.create_prompt(data, token_budget=token_budget, model=model)
+            prompt_times.append(time.perf_counter() - started)
+
+        return {
+            'aps': num_aps,
+            'clients': num_clients,
+            'requests': controller.request_count // repeat,
+            'collect_seconds': round(statistics.median(collect_times), 4),
+            'load_peak_mb': round(statistics.median(peaks) / 1024 / 1024, 2),
+            'plan_seconds': round(statistics.median(plan_times), 4),
+            'prompt_seconds': round(statistics.median(prompt_times), 4),
+            'prompt_tokens': loader.last_prompt_report['total'],
+            'prompt_budget': loader.last_prompt_report['budget'],
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Lists the metrics that regressed by more than tolerance (a fraction) against a baseline run.
+    """
+    regressions = []
+    for size, metrics in results.items():
+        previous = baseline.get(size)
+        if not previous:
+            continue
+        for metric in METRICS:
+            before, after = previous.get(metric), metrics.get(metric)
+            if before and after is not None and after > before * (1 + tolerance):
+                regressions.append(f"{size} {metric}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark collection, loading and prompt building.")
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=BENCHMARK_SIZES)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the mock controller adds per response")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--token-budget', type=int)
+    parser.add_argument('--model')
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--compare', help="results file of a previous run to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = {}
+    for size in args.sizes:
+        num_aps, num_clients = BENCHMARK_SIZES[size]
+        logger.info(f"Benchmarking {size} site ({num_aps} APs, {num_clients} clients)")
+        results[size] = benchmark_site(num_aps, num_clients, args.latency, args.repeat, args.token_budget, args.model)
+
+    print(f"{'size':<8} {'aps':>6} {'clients':>8} {'requests':>9} {'collect s':>10} {'load MB':>8} "
+          f"{'plan s':>7} {'prompt s':>9} {'tokens':>8}")
+    for size, r in results.items():
+        print(f"{size:<8} {r['aps']:>6} {r['clients']:>8} {r['requests']:>9} {r['collect_seconds']:>10} "
+              f"{r['load_peak_mb']:>8} {r['plan_seconds']:>7} {r['prompt_seconds']:>9} {r['prompt_tokens']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,400 @@
+"""
+Local channel and transmit power planner.
+
+Builds an interference model of the site from the spectrum scans (rf_environment) and the
+neighbor observations of each AP (device_config), then assigns a channel to every radio of
+each band (2.4, 5 and 6 GHz) and lowers transmit power where co-channel neighbors remain:
+
+    python channel_planner.py --data-dir path/to/snapshot --dfs
+
+The plan is sent to the agents for explanation only, so the channels in the report are
+deterministic instead of being proposed by the LLM.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from network_model import NetworkIndex, network_index
+
+logger = logging.getLogger(__name__)
+
+# 20 MHz channels planned per band; the 5 GHz DFS channels are only used when allowed
+BAND_CHANNELS = {
+    'ng': (1, 6, 11),
+    'na': (36, 40, 44, 48, 149, 153, 157, 161, 165),
+    '6e': tuple(range(1, 234, 4)),
+}
+DFS_CHANNELS = (52, 56, 60, 64, 100, 104, 108, 112, 116, 120, 124, 128, 132, 136, 140, 144)
+# Center frequency (MHz) of channel 0 per band, and the lower edges wide channels are aligned to
+BAND_BASE_FREQUENCY = {'ng': 2407, 'na': 5000, '6e': 5950}
+BAND_ALIGNMENT = {'na': (5170, 5735), '6e': (5945,)}
+DEFAULT_WIDTH = {'ng': 20, 'na': 40, '6e': 80}
+# Extra path loss (dB) of the higher bands relative to the neighbor observations
+BAND_ATTENUATION = {'ng': 0, 'na': 6, '6e': 8}
+
+# Neighbor signal (dBm) mapped linearly to a coupling weight of 0 (or less) to 1 (or more)
+NEIGHBOR_SIGNAL_RANGE = (-90, -50)
+# Cost of moving a radio, so equally good plans keep the current channels
+CHANGE_PENALTY = 0.05
+# Co-channel coupling after planning from which transmit power is lowered
+POWER_THRESHOLDS = ((1.0, 'low'), (0.5, 'medium'))
+POWER_LEVELS = {'low': 0, 'medium': 1, 'high': 2, 'auto': 2, 'custom': 2}
+
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _width(radio) -> int:
+    """
+    Returns the channel width (MHz) of a radio; 2.4 GHz radios are planned at 20 MHz.
+    """
+    if radio.radio == 'ng':
+        return 20
+    digits = ''.join(character for character in str(radio.width or '') if character.isdigit())
+    width = int(digits) if digits else DEFAULT_WIDTH[radio.radio]
+    return width if width in (20, 40, 80, 160, 320) else DEFAULT_WIDTH[radio.radio]
+
+
+def channel_span(band: str, channel: int, width: int) -> tuple:
+    """
+    Returns the frequency range (MHz) occupied by a radio on a primary channel and width.
+    """
+    center = BAND_BASE_FREQUENCY[band] + 5 * channel
+    if band == 'ng' or width <= 20:
+        return center - 10, center + 10
+    base = max((edge for edge in BAND_ALIGNMENT[band] if edge <= center - 10), default=BAND_ALIGNMENT[band][0])
+    low = base + (center - 10 - base) // width * width
+    return low, low + width
+
+
+def candidate_channels(band: str, width: int, allow_dfs: bool = False) -> list:
+    """
+    Lists the primary channels of the channels of a width a radio may be moved to.
+
+    Wide channels are only candidates when all of their 20 MHz channels are usable.
+    """
+    allowed = set(BAND_CHANNELS[band])
+    if band == 'na' and allow_dfs:
+        allowed.update(DFS_CHANNELS)
+    if band == 'ng' or width <= 20:
+        return sorted(allowed)
+    blocks = {}
+    for channel in sorted(allowed):
+        blocks.setdefault(channel_span(band, channel, width), []).append(channel)
+    return [channels[0] for channels in blocks.values() if len(channels) == width // 20]
+
+
+def _spectrum_entries(scan):
+    """
+    Yields the per-channel entries of an AP's spectrum scan, however the controller nested them.
+    """
+    for item in scan if isinstance(scan, list) else [scan]:
+        if not isinstance(item, dict):
+            continue
+        if 'spectrum_table' in item:
+            yield from item['spectrum_table'] or []
+        elif 'channel' in item:
+            yield item
+
+
+def _signal_dbm(entry: dict):
+    if _number(entry.get('signal')):
+        return entry['signal']
+    if _number(entry.get('rssi')):
+        # UniFi reports rssi as dB above a -95 dBm noise floor
+        return entry['rssi'] - 95 if entry['rssi'] > 0 else entry['rssi']
+    return None
+
+
+def neighbor_signals(index: NetworkIndex) -> np.ndarray:
+    """
+    Builds the AP-to-AP signal matrix (dBm, -inf when unseen) from the neighbor observations.
+
+    Each AP record may list the APs it hears under 'neighbors', by 'mac' or by 'bssid' (matched
+    against the BSSIDs in the vap_table). Observations are symmetric: the strongest direction wins.
+    """
+    positions = {mac: position for position, mac in enumerate(index.access_points)}
+    for mac, ap in index.access_points.items():
+        for vap in ap.record.get('vap_table') or []:
+            if vap.get('bssid'):
+                positions.setdefault(vap['bssid'], positions[mac])
+
+    signals = np.full((len(index.access_points),) * 2, -np.inf)
+    for row, ap in enumerate(index.access_points.values()):
+        for entry in ap.record.get('neighbors') or []:
+            column = positions.get(entry.get('mac'), positions.get(entry.get('bssid')))
+            signal = _signal_dbm(entry)
+            if column is not None and column != row and signal is not None:
+                signals[row, column] = max(signals[row, column], signal)
+    return np.maximum(signals, signals.T)
+
+
+def spectrum_measurements(index: NetworkIndex) -> dict:
+    """
+    Collects the interference (or utilization) each AP's spectrum scan reports per channel.
+
+    Returns:
+        dict: Per band, the AP positions, center frequencies (MHz) and values between 0 and 1 as arrays.
+    """
+    measurements = {band: ([], [], []) for band in BAND_CHANNELS}
+    for row, ap in enumerate(index.access_points.values()):
+        for entry in _spectrum_entries(ap.scan):
+            channel = entry.get('channel')
+            band = entry.get('radio') or ('ng' if _number(channel) and channel <= 14 else 'na')
+            value = entry.get('interference') if _number(entry.get('interference')) else entry.get('utilization')
+            if band in measurements and _number(channel) and _number(value):
+                rows, frequencies, values = measurements[band]
+                rows.append(row)
+                frequencies.append(BAND_BASE_FREQUENCY[band] + 5 * channel)
+                values.append(min(max(value, 0), 100) / 100)
+    return {band: tuple(np.array(column) for column in columns) for band, columns in measurements.items()}
+
+
+def _external_interference(measurements: tuple, num_aps: int, spans: np.ndarray) -> np.ndarray:
+    """
+    Averages the measurements of each AP over the 20 MHz channels inside every candidate span.
+
+    Candidates an AP did not scan get its average over the band, so unmeasured channels are
+    neither preferred nor avoided.
+
+    Returns:
+        np.ndarray: Interference between 0 and 1 per AP and candidate, 0 for APs without a scan.
+    """
+    rows, frequencies, values = measurements
+    shape = (num_aps, len(spans))
+    if not len(rows):
+        return np.zeros(shape)
+    inside = (frequencies[:, None] > spans[:, 0]) & (frequencies[:, None] < spans[:, 1])
+    totals, counts = np.zeros(shape), np.zeros(shape)
+    np.add.at(totals, rows, inside * values[:, None])
+    np.add.at(counts, rows, inside)
+    scanned = np.bincount(rows, minlength=num_aps)
+    band_mean = np.divide(np.bincount(rows, values, minlength=num_aps), scanned,
+                          out=np.zeros(num_aps), where=scanned > 0)
+    return np.divide(totals, counts, out=np.repeat(band_mean[:, None], len(spans), axis=1), where=counts > 0)
+
+
+def _overlap(spans: np.ndarray) -> np.ndarray:
+    """
+    Returns the share of the narrower channel that each pair of candidate spans overlaps.
+    """
+    low, high = spans[:, 0], spans[:, 1]
+    shared = np.minimum(high[:, None], high) - np.maximum(low[:, None], low)
+    return np.clip(shared, 0, None) / np.minimum((high - low)[:, None], high - low)
+
+
+def _greedy(unary: np.ndarray, weights: np.ndarray, overlap: np.ndarray) -> np.ndarray:
+    """
+    Assigns the most coupled radios first, each to its cheapest channel given those already placed.
+    """
+    assignment = np.zeros(len(unary), dtype=int)
+    interference = np.zeros_like(unary)
+    for radio in np.argsort(-weights.sum(axis=1), kind='stable'):
+        choice = int((unary[radio] + interference[radio]).argmin())
+        assignment[radio] = choice
+        interference += weights[:, radio, None] * overlap[choice]
+    return assignment
+
+
+def _local_search(unary: np.ndarray, weights: np.ndarray, overlap: np.ndarray, assignment: np.ndarray,
+                  max_moves: int) -> tuple:
+    """
+    Repeatedly applies the single channel move that lowers the total cost the most.
+
+    interference[i, c] is the co-channel cost radio i would have on candidate c; it is updated
+    with one rank-1 correction per move instead of being recomputed.
+
+    Returns:
+        tuple: The improved assignment and its interference matrix.
+    """
+    assignment = assignment.copy()
+    rows = np.arange(len(assignment))
+    interference = weights @ overlap[assignment]
+    for _ in range(max_moves):
+        total = unary + interference
+        best = total.argmin(axis=1)
+        gain = total[rows, assignment] - total[rows, best]
+        radio = int(gain.argmax())
+        if not gain[radio] > 1e-9:
+            break
+        previous, assignment[radio] = assignment[radio], best[radio]
+        interference += weights[:, radio, None] * (overlap[assignment[radio]] - overlap[previous])
+    return assignment, interference
+
+
+def _plan_band(index: NetworkIndex, band: str, signals: np.ndarray, measurements: tuple, allow_dfs: bool) -> tuple:
+    """
+    Plans the channels and transmit power of all radios of one band.
+
+    Returns:
+        tuple: The assignment rows and the band summary, or None when the band has no radios.
+    """
+    ap_rows = {mac: row for row, mac in enumerate(index.access_points)}
+    radios = [radio for radio in index.radios if radio.radio == band and _number(radio.channel) and radio.channel > 0]
+    if not radios:
+        return None
+
+    # Candidates are identified by their span; current channels are added so their cost is known
+    widths = np.array([_width(radio) for radio in radios])
+    candidates = {}
+    for width in np.unique(widths).tolist():
+        for channel in candidate_channels(band, width, allow_dfs):
+            candidates.setdefault(channel_span(band, channel, width), (channel, width, True))
+    current_spans = [channel_span(band, radio.channel, width) for radio, width in zip(radios, widths.tolist())]
+    for radio, width, span in zip(radios, widths.tolist(), current_spans):
+        candidates.setdefault(span, (radio.channel, width, False))
+    positions_by_span = {span: position for position, span in enumerate(candidates)}
+    current = np.array([positions_by_span[span] for span in current_spans])
+    spans = np.array(list(candidates), dtype=float)
+    primary_channels = [channel for channel, _, _ in candidates.values()]
+    candidate_widths = np.array([width for _, width, _ in candidates.values()])
+    usable = np.array([usable for _, _, usable in candidates.values()])
+
+    rows = np.arange(len(radios))
+    positions = np.array([ap_rows[radio.ap_mac] for radio in radios])
+    allowed = (candidate_widths == widths[:, None]) & usable
+    # A radio whose width has no usable channel (e.g. 160 MHz without DFS) stays where it is
+    allowed[rows, current] |= ~allowed.any(axis=1)
+    external = _external_interference(measurements, len(index.access_points), spans)[positions]
+    unary = np.where(allowed, external + CHANGE_PENALTY * (np.arange(len(spans)) != current[:, None]), np.inf)
+
+    measured = np.isfinite(signals).any()
+    if measured:
+        band_signals = signals[positions][:, positions] - BAND_ATTENUATION[band]
+        # Radios of the same AP on the same band always interfere
+        band_signals[positions[:, None] == positions] = NEIGHBOR_SIGNAL_RANGE[1]
+        low, high = NEIGHBOR_SIGNAL_RANGE
+        weights = np.clip((band_signals - low) / (high - low), 0, None)
+    else:
+        # Without neighbor data every AP may hear every other: spread the radios evenly
+        weights = np.ones((len(radios), len(radios))) / max(len(radios) - 1, 1)
+    np.fill_diagonal(weights, 0)
+    overlap = _overlap(spans)
+
+    def objective(assignment):
+        return unary[rows, assignment].sum() + 0.5 * (weights * overlap[assignment][:, assignment]).sum()
+
+    max_moves = 20 * len(radios)
+    solutions = [_local_search(unary, weights, overlap, start, max_moves)
+                 for start in (_greedy(unary, weights, overlap), current)]
+    assignment, interference = min(solutions, key=lambda solution: objective(solution[0]))
+
+    cost_before = external[rows, current] + (weights * overlap[current][:, current]).sum(axis=1)
+    cost_after = external[rows, assignment] + interference[rows, assignment]
+    coupling = interference[rows, assignment]
+    assignments = []
+    for row, radio in enumerate(radios):
+        planned = assignment[row]
+        channel = radio.channel if planned == current[row] else primary_channels[planned]
+        power = radio.tx_power_mode
+        if measured:
+            level = next((level for threshold, level in POWER_THRESHOLDS if coupling[row] >= threshold), None)
+            if level and POWER_LEVELS[level] < POWER_LEVELS.get(power, 2):
+                power = level
+        assignments.append({
+            'ap_name': index.access_points[radio.ap_mac].name,
+            'ap_mac': radio.ap_mac,
+            'radio': band,
+            'width': int(widths[row]),
+            'channel': radio.channel,
+            'proposed_channel': channel,
+            'tx_power_mode': radio.tx_power_mode,
+            'proposed_tx_power_mode': power,
+            'interference': round(float(cost_before[row]), 3),
+            'proposed_interference': round(float(cost_after[row]), 3),
+        })
+
+    summary = {
+        'radios': len(radios),
+        'channel_changes': sum(row['proposed_channel'] != row['channel'] for row in assignments),
+        'power_changes': sum(row['proposed_tx_power_mode'] != row['tx_power_mode'] for row in assignments),
+        'interference': round(float(cost_before.sum()), 3),
+        'proposed_interference': round(float(cost_after.sum()), 3),
+    }
+    return assignments, summary
+
+
+def plan_channels(data: dict, allow_dfs: bool = None) -> dict:
+    """
+    Computes a channel and transmit power plan for every AP radio of a snapshot.
+
+    For each band the planner minimizes the external interference measured by the spectrum
+    scans on the chosen channels plus the overlap between neighboring radios, weighted by how
+    strongly the APs hear each other. A greedy assignment and the current plan are both
+    improved by local search and the better result is kept; radios still sharing a channel
+    with close neighbors get a lower transmit power.
+
+    Args:
+        data (dict): Loaded datasets keyed by name.
+        allow_dfs (bool): Plan the 5 GHz DFS channels, defaults to CHANNEL_PLAN_DFS.
+
+    Returns:
+        dict: 'summary' with per-band costs and change counts, and one 'assignments' row per radio.
+    """
+    if allow_dfs is None:
+        allow_dfs = os.getenv('CHANNEL_PLAN_DFS', '0') == '1'
+    started = time.perf_counter()
+    index = network_index(data)
+    signals = neighbor_signals(index)
+    measurements = spectrum_measurements(index)
+
+    assignments, bands = [], {}
+    for band in BAND_CHANNELS:
+        planned = _plan_band(index, band, signals, measurements[band], allow_dfs)
+        if planned:
+            assignments.extend(planned[0])
+            bands[band] = planned[1]
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Channel plan for {len(index.access_points)} APs computed in {elapsed * 1000:.0f} ms")
+    return {
+        'summary': {
+            'access_points': len(index.access_points),
+            'neighbor_data': bool(np.isfinite(signals).any()),
+            'dfs_allowed': allow_dfs,
+            'bands': bands,
+            'solve_ms': round(elapsed * 1000, 1),
+        },
+        'assignments': assignments,
+    }
+
+
+def channel_plan_dataset(data: dict):
+    """
+    Returns the plan as sent to the agents (the summary and the radios that change), or None
+    when planning is disabled with CHANNEL_PLAN=0 or the snapshot has no AP radios.
+    """
+    if os.getenv('CHANNEL_PLAN', '1') == '0':
+        return None
+    plan = plan_channels(data)
+    if not plan['assignments']:
+        return None
+    changes = [row for row in plan['assignments'] if row['proposed_channel'] != row['channel']
+               or row['proposed_tx_power_mode'] != row['tx_power_mode']]
+    # The solver timing is dropped: it changes on every run, so it would defeat the LLM cache
+    summary = {key: value for key, value in plan['summary'].items() if key != 'solve_ms'}
+    return {'summary': summary, 'changes': changes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute a channel and transmit power plan for a snapshot.")
+    parser.add_argument('--data-dir', help="snapshot directory, defaults to the script directory")
+    parser.add_argument('--dfs', action='store_true', help="also plan the 5 GHz DFS channels")
+    parser.add_argument('--output', help="write the plan as JSON instead of printing it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from load_data import DataLoader
+
+    plan = plan_channels(DataLoader(args.data_dir).load_all_data(), allow_dfs=args.dfs or None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(plan, f, indent=2)
+    else:
+        print(json.dumps(plan, indent=2))
@@ -0,0 +1,156 @@
+"""
+Command line interface.
+
+    python cli.py collect                  collect a snapshot from the controller
+    python cli.py build-prompt -o -        build the analysis prompt without calling the LLM
+    python cli.py analyze [--collect]      analyze the snapshot (optionally collecting it first)
+    python cli.py report -o report.html    render the saved analysis result
+
+Each command checks only the settings it needs and imports only the modules it uses, so
+collection jobs don't pay for loading autogen. --trace FILE records how long each stage,
+controller request and LLM call took.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from tracing import trace_run
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+COLLECT_SETTINGS = ('CONTROLLER_URL', 'USERNAME', 'PASSWORD', 'SITE_ID')
+MODEL_SETTINGS = ('MODEL_TRIAGE', 'MODEL_SUMMARY', 'MODEL_RECOMMENDATIONS')
+
+
+def missing_settings(args) -> list:
+    """
+    Returns the environment settings the command needs but that are not set.
+    """
+    required = []
+    if args.command == 'collect' or getattr(args, 'collect', False):
+        required.extend(COLLECT_SETTINGS)
+    if args.command == 'analyze' and os.getenv('LLM_BACKEND') != 'fake':
+        required.append('OPENAI_API_KEY')
+        # MODEL_AGENT is only needed for the tiers that don't have their own model
+        if not all(os.getenv(name) for name in MODEL_SETTINGS):
+            required.append('MODEL_AGENT')
+    return [name for name in required if not os.getenv(name)]
+
+
+def collect(args) -> int:
+    from test_connection import DataCollector
+
+    started = time.perf_counter()
+    collector = DataCollector(output_dir=args.data_dir)
+    collector.collect_data()
+    logger.info(f"Collected snapshot into {collector.snapshot_directory} in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+def _load(data_dir):
+    from load_data import DataLoader
+
+    data_loader = DataLoader(data_dir)
+    try:
+        return data_loader, data_loader.load_all_data(exit_on_error=False)
+    except ValueError as e:
+        logger.error(f"Cannot load the snapshot in {data_dir}: {e}")
+        return data_loader, None
+
+
+def build_prompt(args) -> int:
+    data_loader, data = _load(args.data_dir)
+    if data is None:
+        return 1
+    prompt = data_loader.create_prompt(data, token_budget=args.token_budget, model=args.model)
+    if args.output == '-':
+        sys.stdout.write(prompt)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(prompt)
+        logger.info(f"Prompt written to {args.output}")
+    return 0
+
+
+def analyze(args) -> int:
+    if args.collect and collect(args):
+        return 1
+    data_loader, data = _load(args.data_dir)
+    if data is None:
+        return 1
+    from unifi_ai_agents import analyze as run, print_recommendations_to_file
+
+    result = run(data_loader, data)
+    print_recommendations_to_file(result)
+    return 0 if isinstance(result, dict) else 1
+
+
+def report(args) -> int:
+    from report_writer import ReportWriter
+    from snapshot_store import resolve_snapshot_directory
+
+    # Results are saved in the directory of the analyzed snapshot
+    directory = resolve_snapshot_directory(args.data_dir)
+    path = os.path.join(directory, 'analysis_result.json')
+    if not os.path.exists(path):
+        logger.error(f"No analysis result in {directory}, run the analyze command first")
+        return 1
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    with ReportWriter(args.output) as writer:
+        writer.result(saved['result'])
+    return 0
+
+
+COMMANDS = {'collect': collect, 'build-prompt': build_prompt, 'analyze': analyze, 'report': report}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='unifi-tuner', description="Collect and analyze UniFi network data.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log debug messages")
+    parser.add_argument('--trace', help="write a trace of the stages, requests and LLM calls to this file "
+                                        "(.json, or .otlp.json for OpenTelemetry), defaults to TRACE_FILE")
+    parser.add_argument('--profile', action='store_true', help="also profile the command with cProfile")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, help):
+        command = subparsers.add_parser(name, help=help)
+        command.add_argument('--data-dir', default=DEFAULT_DATA_DIRECTORY, help="snapshot directory")
+        return command
+
+    add_command('collect', "collect a snapshot from the controller")
+    command = add_command('build-prompt', "build the analysis prompt without calling the LLM")
+    command.add_argument('-o', '--output', default='-', help="file to write the prompt to, '-' for stdout")
+    command.add_argument('--token-budget', type=int)
+    command.add_argument('--model')
+    command = add_command('analyze', "analyze the snapshot")
+    command.add_argument('--collect', action='store_true', help="collect a fresh snapshot first")
+    command = add_command('report', "render the saved analysis result")
+    command.add_argument('-o', '--output', default='-',
+                         help="report file (.md, .json or .html), '-' for Markdown on stdout")
+    return parser
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    missing = missing_settings(args)
+    if missing:
+        parser.error(f"{args.command} requires {', '.join(missing)} (set them in .env or the environment)")
+    with trace_run(args.command, path=args.trace, profile=args.profile or None):
+        return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Continuous monitoring mode.
+
+Collects a snapshot every DAEMON_COLLECT_INTERVAL seconds and runs cheap local anomaly
+checks on it. The LLM analysis only runs when a check trips on an anomaly that was not
+present at the last analysis, when the snapshot changed significantly, or when
+DAEMON_ANALYSIS_INTERVAL seconds have passed since the last analysis.
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import uuid
+
+from analytics import summarize_network
+from load_data import DataLoader
+from snapshot_diff import diff_snapshots
+from snapshot_store import SnapshotStore
+from test_connection import DataCollector
+
+logger = logging.getLogger(__name__)
+
+# Absolute thresholds checked on every snapshot, overridable from .env
+DEFAULT_ANOMALY_THRESHOLDS = {
+    'retry_pct': 15,          # median client retry rate on an AP
+    'utilization_pct': 80,    # channel utilization of a radio
+    'min_snr_db': 15,         # 10th percentile client SNR on an AP
+}
+
+# Time of the last analysis and the anomalies it covered, saved next to the analyzed snapshot
+ANOMALIES_FILE = 'anomalies.json'
+
+
+def check_thresholds(data: dict, thresholds: dict = None) -> dict:
+    """
+    Runs the absolute threshold checks on a snapshot.
+
+    Returns:
+        dict: Human-readable anomaly descriptions keyed by check and device, e.g.
+            'retry_pct:<ap mac>'. The keys identify an anomaly across snapshots while
+            the measured values in the descriptions change.
+    """
+    thresholds = {**DEFAULT_ANOMALY_THRESHOLDS, **(thresholds or {})}
+    summary = summarize_network(data)
+    anomalies = {}
+    for ap in summary['ap_clients']:
+        name = ap['ap_name'] or ap['ap_mac']
+        retry = ap['retry_pct_p10_p50_p90']
+        if retry and retry[1] is not None and retry[1] > thresholds['retry_pct']:
+            anomalies[f"retry_pct:{ap['ap_mac']}"] = f"{name}: median retry rate {retry[1]}%"
+        snr = ap['snr_db_p10_p50_p90']
+        if snr and snr[0] is not None and snr[0] < thresholds['min_snr_db']:
+            anomalies[f"min_snr_db:{ap['ap_mac']}"] = f"{name}: low client SNR ({snr[0]} dB at p10)"
+    for channel in summary['channels']:
+        peak = channel['utilization_peak_pct']
+        if peak is not None and peak > thresholds['utilization_pct']:
+            anomalies[f"utilization_pct:{channel['radio']}:{channel['channel']}"] = (
+                f"{channel['radio']} channel {channel['channel']}: utilization {peak}%")
+    return anomalies
+
+
+class NetworkMonitorDaemon:
+    """
+    Runs scheduled collections and triggers analyses only when needed.
+    """
+
+    def __init__(self, collect_interval: float = None, analysis_interval: float = None, thresholds: dict = None):
+        """
+        Initializes the daemon.
+
+        Args:
+            collect_interval (float): Seconds between collections, defaults to DAEMON_COLLECT_INTERVAL or 300.
+            analysis_interval (float): Seconds between scheduled analyses, defaults to
+                DAEMON_ANALYSIS_INTERVAL or 24 hours.
+            thresholds (dict): Overrides for DEFAULT_ANOMALY_THRESHOLDS.
+        """
+        self.collect_interval = float(collect_interval or os.getenv('DAEMON_COLLECT_INTERVAL', 300))
+        self.analysis_interval = float(analysis_interval or os.getenv('DAEMON_ANALYSIS_INTERVAL', 24 * 60 * 60))
+        self.thresholds = thresholds or {
+            'retry_pct': float(os.getenv('ANOMALY_RETRY_PCT', DEFAULT_ANOMALY_THRESHOLDS['retry_pct'])),
+            'utilization_pct': float(os.getenv('ANOMALY_UTILIZATION_PCT',
+                                               DEFAULT_ANOMALY_THRESHOLDS['utilization_pct'])),
+            'min_snr_db': float(os.getenv('ANOMALY_MIN_SNR_DB', DEFAULT_ANOMALY_THRESHOLDS['min_snr_db'])),
+        }
+        self.data_loader = DataLoader()
+        self.collector = DataCollector(output_dir=self.data_loader.data_directory)
+        self.previous = None
+        self.last_analysis = None
+        # Keys of the threshold anomalies already covered by an analysis, see check_thresholds
+        self.analyzed_anomalies = set()
+        self._load_analyzed_anomalies()
+        self._stop = threading.Event()
+
+    def stop(self, *args) -> None:
+        logger.info("Stopping monitoring daemon")
+        self._stop.set()
+
+    def _anomalies_path(self) -> str:
+        # Kept with the baseline snapshot, which is the analyzed one unless BASELINE_DIR is set
+        baseline_dir = SnapshotStore(self.data_loader.data_directory).baseline()
+        return os.path.join(baseline_dir or self.data_loader.snapshot_directory, ANOMALIES_FILE)
+
+    def _load_analyzed_anomalies(self) -> None:
+        # A restart resumes from the baseline snapshot, so known anomalies don't trigger again
+        path = self._anomalies_path()
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.analyzed_anomalies = set(state['anomalies'])
+        self.last_analysis = time.monotonic() - max(time.time() - state['analyzed_at'], 0)
+        logger.info(f"Resuming after the analysis saved in {path}: "
+                    f"{len(self.analyzed_anomalies)} known anomalies")
+
+    def _save_analyzed_anomalies(self) -> None:
+        path = self._anomalies_path()
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'analyzed_at': time.time(), 'anomalies': sorted(self.analyzed_anomalies)}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def run_once(self) -> None:
+        """
+        Collects one snapshot, checks it and analyzes it if a new anomaly or a significant
+        change was detected, or an analysis is due.
+        """
+        self.collector.collect_data()
+        data = self.data_loader.load_all_data(exit_on_error=False)
+        current = check_thresholds(data, self.thresholds)
+        changes = diff_snapshots(self.previous, data)['significant'] if self.previous is not None else []
+        self.previous = data
+
+        # Anomalies that cleared are forgotten, so they trigger again if they come back
+        self.analyzed_anomalies &= current.keys()
+        anomalies = [description for key, description in current.items()
+                     if key not in self.analyzed_anomalies] + changes
+
+        due = self.last_analysis is None or time.monotonic() - self.last_analysis >= self.analysis_interval
+        if not anomalies and not due:
+            if current:
+                logger.info(f"Snapshot collected, anomalies already analyzed: {'; '.join(current.values())}")
+            else:
+                logger.info("Snapshot collected, no anomalies detected")
+            return
+
+        if anomalies:
+            logger.info(f"Anomalies detected, running analysis: {'; '.join(anomalies)}")
+        else:
+            logger.info("Scheduled analysis is due")
+        # Imported here so collection-only cycles don't pay for loading the agent stack
+        from unifi_ai_agents import analyze
+        result = analyze(self.data_loader, data)
+        self.last_analysis = time.monotonic()
+        self.analyzed_anomalies = set(current)
+        self._save_analyzed_anomalies()
+        logger.info(f"Analysis completed:\n{result}")
+
+    def run(self) -> None:
+        """
+        Runs collections at a fixed interval until stopped (SIGINT/SIGTERM).
+        """
+        logger.info(f"Monitoring daemon started: collecting every {self.collect_interval:.0f}s, "
+                    f"analyzing at least every {self.analysis_interval:.0f}s")
+        next_run = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Monitoring cycle failed: {e}")
+            # Keep a fixed cadence; skip missed slots instead of running them back to back
+            next_run = max(next_run + self.collect_interval, time.monotonic())
+            self._stop.wait(next_run - time.monotonic())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    daemon = NetworkMonitorDaemon()
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
@@ -0,0 +1,223 @@
+"""
+Local OpenAI-compatible chat completions endpoint returning canned analyses.
+
+Used to load test and profile the agent workflow without calling (or paying for) the real
+API. Set LLM_BACKEND=fake to point every agent at it; a server is started in-process unless
+FAKE_LLM_URL names one that is already running:
+
+    python fake_llm.py --port 8766 --latency 0.5
+    LLM_BACKEND=fake FAKE_LLM_URL=http://127.0.0.1:8766/v1 python unifi_ai_agents.py
+
+Replies are deterministic: the JSON format requested by the prompt (site analysis, access
+point or section analysis) is filled in with fixed content.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+FAKE_MODEL = 'fake-llm'
+
+SITE_ANALYSIS = {
+    'overall_health': 'fair',
+    'potential_issues': ['High retry rates on 2.4 GHz radios', 'Overlapping 5 GHz channels on neighboring APs'],
+    'recommendations': ['Move 2.4 GHz radios to channels 1, 6 and 11', 'Enable WPA3 transition mode on the Home SSID'],
+    'additional_insights': ['Client load peaks in the evening'],
+}
+
+PARTIAL_ANALYSIS = {
+    'health': 'fair',
+    'issues': ['High retry rate'],
+    'recommendations': ['Lower transmit power on the 2.4 GHz radio'],
+    'insights': ['Most clients use 5 GHz'],
+}
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def canned_reply(prompt: str) -> str:
+    """
+    Returns a deterministic reply in the format the prompt asks for.
+    """
+    match = re.search(r'"(access_point|section)":\s*"([^"]*)"', prompt)
+    if match:
+        return json.dumps({match.group(1): match.group(2), **PARTIAL_ANALYSIS})
+    if '"overall_health"' in prompt:
+        return json.dumps(SITE_ANALYSIS)
+    return "The network is in fair health; the main recommendations concern 2.4 GHz channel planning and WPA3."
+
+
+class FakeLLMServer:
+    """
+    Threaded HTTP server implementing POST /v1/chat/completions.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, prompt_tokens: int = None,
+                 completion_tokens: int = None, host: str = '127.0.0.1', port: int = 0, rate_limit: int = 0):
+        """
+        Initializes the server.
+
+        Args:
+            latency (float): Seconds added to every completion.
+            jitter (float): Maximum random seconds added on top of the latency.
+            prompt_tokens (int): Reported prompt tokens, estimated from the messages by default.
+            completion_tokens (int): Reported completion tokens, estimated from the reply by default.
+            host (str): Address to listen on.
+            port (int): Port to listen on, 0 picks a free port.
+            rate_limit (int): Requests answered per second; further requests get a 429 response
+                with Retry-After, like a rate limited API. 0 disables the limit.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.rate_limit = rate_limit
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'FakeLLMServer':
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Fake LLM listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _over_rate_limit(self) -> bool:
+        # Sliding one second window of the accepted requests
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0] >= 1:
+                self._window.popleft()
+            if len(self._window) >= self.rate_limit:
+                self.rate_limited_count += 1
+                return True
+            self._window.append(now)
+        return False
+
+    def complete(self, request: dict) -> dict:
+        with self._lock:
+            self.request_count += 1
+        messages = request.get('messages') or []
+        prompt = next((message.get('content') for message in reversed(messages)
+                       if message.get('role') == 'user' and isinstance(message.get('content'), str)), '')
+        content = canned_reply(prompt)
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        prompt_tokens = self.prompt_tokens or sum(_estimate_tokens(str(message.get('content') or ''))
+                                                  for message in messages)
+        completion_tokens = self.completion_tokens or _estimate_tokens(content)
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model') or FAKE_MODEL,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                headers = {}
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    status, body = 404, {'error': {'message': f"Unknown path {self.path}"}}
+                elif server._over_rate_limit():
+                    status, headers = 429, {'Retry-After': '1'}
+                    body = {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}}
+                else:
+                    status, body = 200, server.complete(request)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+_shared_server = None
+_shared_lock = threading.Lock()
+
+
+def fake_llm_url() -> str:
+    """
+    Returns FAKE_LLM_URL, or the URL of a fake server started in this process on first use.
+
+    The in-process server is configured with FAKE_LLM_LATENCY and FAKE_LLM_JITTER (seconds)
+    and FAKE_LLM_RATE_LIMIT (requests per second).
+    """
+    global _shared_server
+    if os.getenv('FAKE_LLM_URL'):
+        return os.getenv('FAKE_LLM_URL')
+    with _shared_lock:
+        if _shared_server is None:
+            _shared_server = FakeLLMServer(
+                latency=float(os.getenv('FAKE_LLM_LATENCY', 0)),
+                jitter=float(os.getenv('FAKE_LLM_JITTER', 0)),
+                rate_limit=int(os.getenv('FAKE_LLM_RATE_LIMIT', 0)),
+            ).start()
+    return _shared_server.url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible LLM endpoint.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every completion")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--prompt-tokens', type=int, help="fixed prompt tokens to report")
+    parser.add_argument('--completion-tokens', type=int, help="fixed completion tokens to report")
+    parser.add_argument('--rate-limit', type=int, default=0, help="requests per second before answering 429")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    fake = FakeLLMServer(args.latency, args.jitter, args.prompt_tokens, args.completion_tokens,
+                         args.host, args.port, args.rate_limit)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.server.server_close()
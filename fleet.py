@@ -0,0 +1,138 @@
+"""
+Fleet collection across many controllers and sites.
+
+The fleet file lists the controllers to collect from:
+
+    {
+        "output_dir": "fleet_data",
+        "max_controllers": 4,
+        "controllers": [
+            {
+                "url": "https://10.0.0.1",
+                "username_env": "SITE_A_USERNAME",
+                "password_env": "SITE_A_PASSWORD",
+                "sites": ["default", "branch1"],
+                "max_concurrency": 2
+            }
+        ]
+    }
+
+Credentials are read from the environment variables named by username_env/password_env
+(falling back to USERNAME/PASSWORD). Each controller is logged into once and the session
+is shared by all of its sites.
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from history_store import HistoryStore
+from test_connection import DataCollector
+
+logger = logging.getLogger(__name__)
+
+
+def controller_slug(url: str) -> str:
+    """
+    Returns a filesystem-safe directory name for a controller URL.
+    """
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', re.sub(r'^https?://', '', url)).strip('_')
+
+
+def site_directory(output_dir: str, controller_url: str, site: str) -> str:
+    """
+    Returns the directory holding a site's snapshot, for use as a DataLoader data directory.
+    """
+    return os.path.join(output_dir, controller_slug(controller_url), site)
+
+
+def load_fleet_config(path: str) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def collect_controller(controller: dict, output_dir: str) -> dict:
+    """
+    Collects every site of one controller with a single authenticated session.
+
+    Returns:
+        dict: 'ok' or the error message, keyed by site.
+    """
+    url = controller['url']
+    sites = controller['sites']
+    max_concurrency = int(controller.get('max_concurrency', 2))
+    primary = DataCollector(
+        base_url=url,
+        username=os.getenv(controller.get('username_env', 'USERNAME')),
+        password=os.getenv(controller.get('password_env', 'PASSWORD')),
+        site=sites[0],
+        # Only the per-site collectors below keep a history store
+        history_db='',
+    )
+    history_db = os.getenv('HISTORY_DB')
+    # One connection pool for the controller, sized for all of its concurrently collected sites
+    primary.pool_size = primary.max_workers * max_concurrency
+    try:
+        primary.connect()
+    except Exception as e:
+        logger.error(f"Login to {url} failed: {e}")
+        return {site: f"login failed: {e}" for site in sites}
+
+    def collect_site(site):
+        directory = site_directory(output_dir, url, site)
+        os.makedirs(directory, exist_ok=True)
+        collector = primary.for_site(site, directory)
+        if history_db:
+            # Site names repeat across controllers, so each site keeps its own history store
+            collector.history_store = HistoryStore(os.path.join(directory, os.path.basename(history_db)))
+        started = time.perf_counter()
+        try:
+            collector.collect_data()
+        finally:
+            if collector.history_store:
+                collector.history_store.close()
+        logger.info(f"Collected {url} site {site} in {time.perf_counter() - started:.2f}s")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {site: executor.submit(collect_site, site) for site in sites}
+        for site, future in futures.items():
+            try:
+                future.result()
+                results[site] = 'ok'
+            except Exception as e:
+                logger.error(f"Collection of {url} site {site} failed: {e}")
+                results[site] = str(e)
+    return results
+
+
+def collect_fleet(config: dict) -> dict:
+    """
+    Collects all controllers of a fleet in parallel.
+
+    Args:
+        config (dict): Fleet configuration, see the module documentation.
+
+    Returns:
+        dict: Per-site results keyed by controller URL, then by site.
+    """
+    output_dir = config.get('output_dir', 'fleet_data')
+    controllers = config['controllers']
+    max_controllers = int(config.get('max_controllers', os.getenv('FLEET_MAX_CONTROLLERS', 4)))
+    with ThreadPoolExecutor(max_workers=max_controllers) as executor:
+        futures = {controller['url']: executor.submit(collect_controller, controller, output_dir)
+                   for controller in controllers}
+        return {url: future.result() for url, future in futures.items()}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv('FLEET_CONFIG', 'fleet.json')
+    results = collect_fleet(load_fleet_config(config_path))
+    failed = [(url, site) for url, sites in results.items() for site, result in sites.items() if result != 'ok']
+    logger.info(f"Fleet collection finished, {len(failed)} site(s) failed")
+    sys.exit(1 if failed else 0)
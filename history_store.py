@@ -0,0 +1,87 @@
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# hourly.site buckets are one hour wide; bucket timestamps are in milliseconds
+HOUR_MS = 60 * 60 * 1000
+
+
+class HistoryStore:
+    """
+    A local SQLite time-series store for hourly site statistics.
+
+    Records are kept as compact JSON keyed by site and bucket time, so repeated
+    collections only need to append the hours that are missing.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens (and creates if needed) the store at the given path.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hourly ("
+            " site TEXT NOT NULL,"
+            " time INTEGER NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (site, time)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def last_timestamp(self, site: str):
+        """
+        Returns the most recent bucket time (ms) stored for a site, or None if empty.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(time) FROM hourly WHERE site = ?", (site,)).fetchone()
+        return row[0]
+
+    def append(self, site: str, records: list) -> int:
+        """
+        Inserts hourly records, replacing any bucket that was already stored.
+
+        Args:
+            site (str): Site the records belong to.
+            records (list): hourly.site records, each carrying a 'time' field in ms.
+
+        Returns:
+            int: Number of records written.
+        """
+        rows = [(site, int(record['time']), json.dumps(record, separators=(',', ':')))
+                for record in records if record.get('time') is not None]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO hourly (site, time, data) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+        logger.debug(f"Stored {len(rows)} hourly records for site {site}")
+        return len(rows)
+
+    def read_range(self, site: str, start: int = None, end: int = None) -> list:
+        """
+        Returns the stored records for a site between start and end (ms, inclusive), oldest first.
+        """
+        query = "SELECT data FROM hourly WHERE site = ?"
+        params = [site]
+        if start is not None:
+            query += " AND time >= ?"
+            params.append(int(start))
+        if end is not None:
+            query += " AND time <= ?"
+            params.append(int(end))
+        query += " ORDER BY time"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Fields that change on every snapshot without affecting the analysis; their values are
+# masked before hashing so that otherwise identical prompts share a cache entry.
+VOLATILE_FIELDS = re.compile(
+    r'"((?:[\w-]*_)?uptime|last_seen|first_seen|assoc_time|latest_assoc_time|time|timestamp|'
+    r'(?:[\w-]*[_-])?(?:tx|rx)_bytes(?:-r)?|bytes(?:-r)?)":-?[\d.eE+-]+'
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a prompt for hashing: masks volatile counters and collapses whitespace.
+    """
+    prompt = VOLATILE_FIELDS.sub(lambda match: f'"{match.group(1)}":0', prompt)
+    return ' '.join(prompt.split())
+
+
+class LLMResponseCache:
+    """
+    A persistent, content-addressed cache of analysis results.
+
+    Entries are keyed by a hash of the model, the agents' system messages and the
+    normalized prompt, and are evicted by age and total size.
+    """
+
+    def __init__(self, directory: str = None, max_age: float = None, max_bytes: int = None):
+        """
+        Initializes the cache.
+
+        Args:
+            directory (str): Directory holding cache entries, defaults to LLM_CACHE_DIR or .llm_cache.
+            max_age (float): Seconds an entry stays valid, defaults to LLM_CACHE_MAX_AGE or 24 hours.
+            max_bytes (int): Maximum total size of the cache, defaults to LLM_CACHE_MAX_BYTES or 50 MB.
+        """
+        self.directory = directory or os.getenv('LLM_CACHE_DIR', '.llm_cache')
+        self.max_age = float(max_age or os.getenv('LLM_CACHE_MAX_AGE', 24 * 60 * 60))
+        self.max_bytes = int(max_bytes or os.getenv('LLM_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, system_messages: list, prompt: str) -> str:
+        """
+        Returns the content hash identifying an analysis request.
+        """
+        payload = json.dumps([model, system_messages, normalize_prompt(prompt)], separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        """
+        Returns the cached result for a key, or None if it is missing or too old.
+        """
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable LLM cache entry {path}: {e}")
+            return None
+        logger.info(f"LLM cache hit for {key[:12]}")
+        return entry['result']
+
+    def set(self, key: str, result, model: str = None) -> None:
+        """
+        Stores a result and evicts expired entries and the oldest entries beyond max_bytes.
+        """
+        path = self._path(key)
+        # Concurrent analyses (e.g. a batch) may store the same key at once
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'created': time.time(), 'model': model, 'result': result}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        # Entries may be evicted by another thread or process at the same time; those are skipped
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.max_age:
+                    os.remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.debug(f"Evicted LLM cache entry {path}")
@@ -1,66 +1,158 @@
 import logging
 import json
 import os
+from history_store import HistoryStore
+from snapshot_io import find_dataset, iter_records, load_dataset
+from prompt_builder import PromptBuilder
+from analytics import summarize_network
+from channel_planner import channel_plan_dataset
+from network_model import Snapshot
+from snapshot_store import resolve_snapshot_directory
+from tracing import span, traced
+
+# Descriptions of the data sections that can appear in the analysis prompt
+DATASET_DESCRIPTIONS = {
+    'device_config': "Contains configuration details of all network devices.",
+    'performance_data': "Includes daily site performance statistics.",
+    'wifi_scans': "Contains WLAN configuration data.",
+    'rf_environment': "Provides RF environment data for access points.",
+    'client_devices': "Lists all client devices connected to the network.",
+    'historical_data': "Contains hourly site statistics for the past 7 days.",
+    'channel_utilization': "Provides channel utilization data.",
+    'access_point_analyses': "Map-step analysis results keyed by access point MAC, with the AP name.",
+    'section_analyses': "Focused analyses of network performance, RF environment and security.",
+    'network_changes': ("Changes since the previous analysis: devices and clients by MAC, WLANs by id and "
+                        "health by subsystem, with the changes that triggered this re-analysis."),
+    'previous_analysis': "The analysis and recommendations produced for the previous snapshot.",
+    'network_statistics': ("Precomputed statistics: per-AP client counts with signal, SNR and retry-rate "
+                           "percentiles (p10/p50/p90), per-channel AP/client counts and utilization, and "
+                           "wireless clients per hour of day."),
+    'channel_plan': ("Channel and transmit power changes computed locally from the spectrum scans and AP "
+                     "neighbor data, with the interference score of each radio before and after."),
+}
+
+# Added to the instructions when the prompt contains a channel plan
+CHANNEL_PLAN_NOTE = """
+            The channel_plan was computed by a local optimizer. Do not propose other channels or transmit
+            power levels: explain the planned changes and the issues they address, using the device names.
+"""
+
+# Recommendation examples of the analysis prompt when no channel plan is sent
+RECOMMENDATION_GUIDANCE = """            Please provide very specific recommendations for imporving network performane and security.  For example if high 
+            retry rates are detected, please recommend a new channel or new settings for the access points.  If low SNR is detected,
+            please recommend a new channel or new settings for the access points.  If high client device is detected, please recommend
+            a new channel or new settings for the access points.  
+"""
+
+# Replaces RECOMMENDATION_GUIDANCE when a channel plan is sent, so the prompt does not ask for new channels
+CHANNEL_PLAN_GUIDANCE = """            Please provide very specific recommendations for improving network performance and security.  For example if high
+            retry rates, low SNR or high client counts are detected, point to the planned channel and transmit power changes
+            that address them, or recommend other settings for the access points.
+"""
+
+# Raw datasets replaced by network_statistics when pre-aggregation is enabled
+AGGREGATED_DATASETS = ('client_devices', 'historical_data')
+
 
 class DataLoader:
     """
     A class to load JSON data files and construct analysis prompts for UniFi networks.
     """
 
-    def __init__(self):
+    def __init__(self, data_directory: str = None):
         """
         Initializes the DataLoader by setting the data directory to the script's directory.
+
+        Args:
+            data_directory (str): Directory to load data from instead, e.g. a fleet site directory.
         """
-        self.data_directory = os.path.dirname(os.path.abspath(__file__))
+        self.data_directory = data_directory or os.path.dirname(os.path.abspath(__file__))
+        # The latest complete snapshot under data_directory/snapshots, or data_directory itself for
+        # datasets written in place; re-resolved on every load_all_data()
+        self.snapshot_directory = resolve_snapshot_directory(self.data_directory)
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.setLevel(logging.DEBUG)
         self._configure_logging()
+        self.last_prompt_report = None
+        # Reports of the prompts built concurrently, keyed by 'section:<name>' or 'access_point:<mac>'
+        self.prompt_reports = {}
 
     def _configure_logging(self):
         """
         Configures logging to display DEBUG messages in the console.
+
+        Messages propagate to the root logger, so only the root gets a handler (unless the
+        application configured one); a handler on this logger as well printed every line twice.
         """
-        if not self.logger.handlers:
+        if not logging.getLogger().handlers:
             logging.basicConfig(
                 level=logging.DEBUG,
                 format='%(asctime)s - %(levelname)s - %(message)s'
             )
-            handler = logging.StreamHandler()
-            handler.setLevel(logging.DEBUG)
-            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+
+    def _resolve_file(self, filename: str) -> str:
+        """
+        Finds the newest on-disk variant (.json, .jsonl, optionally .gz/.zst) of a dataset file.
+        """
+        name = filename.split('.', 1)[0]
+        return find_dataset(self.snapshot_directory, name) or os.path.join(self.snapshot_directory, filename)
 
     def load_json_file(self, filename: str) -> dict:
         """
         Loads a JSON file and returns its content.
 
+        Compact variants written by the collector (minified JSON, JSON Lines, gzip or zstd)
+        are picked up automatically, falling back to the plain JSON file.
+
         Args:
             filename (str): Name of the JSON file to load.
 
         Returns:
             dict: Parsed JSON data if successful, None otherwise.
         """
-        file_path = os.path.join(self.data_directory, filename)
+        file_path = self._resolve_file(filename)
         self.logger.debug(f"Attempting to load file: {filename} from {file_path}")
 
-        try:
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-            self.logger.debug(f"Successfully loaded {filename}")
-            return data
-        except FileNotFoundError:
-            self.logger.error(f"File not found: {filename}")
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Error decoding JSON from {filename}: {e}")
-        return None
+        with span('load_dataset', dataset=filename.split('.', 1)[0]) as load_span:
+            try:
+                data = load_dataset(file_path)
+                load_span.set(bytes=os.path.getsize(file_path))
+                self.logger.debug(f"Successfully loaded {filename}")
+                return data
+            except FileNotFoundError:
+                self.logger.error(f"File not found: {filename}")
+            except json.JSONDecodeError as e:
+                self.logger.error(f"Error decoding JSON from {filename}: {e}")
+            return None
+
+    def iter_records(self, filename: str):
+        """
+        Lazily yields the records of a data file without loading it all into memory.
+
+        Args:
+            filename (str): Name of the data file, e.g. 'client_devices.json'.
+
+        Yields:
+            Records of a list dataset, or (key, value) tuples of a dict dataset.
+        """
+        file_path = self._resolve_file(filename)
+        self.logger.debug(f"Streaming records from {file_path}")
+        yield from iter_records(file_path)
 
-    def load_all_data(self) -> dict:
+    @traced('load')
+    def load_all_data(self, exit_on_error: bool = True) -> dict:
         """
-        Loads all required JSON data files.
+        Loads all required JSON data files from the latest snapshot.
+
+        The snapshot is resolved once per call, so all files come from the same collection even
+        if a new snapshot is published while loading.
+
+        Args:
+            exit_on_error (bool): Exit the process when a file is missing or invalid; when False
+                a ValueError is raised instead, for long-running callers.
 
         Returns:
-            dict: Dictionary containing all loaded data.
+            Snapshot: Dictionary containing all loaded data, with a shared NetworkIndex built on first use.
         """
         filenames = [
             'device_config.json',
@@ -72,7 +164,8 @@ class DataLoader:
             'channel_utilization.json'
         ]
 
-        data = {}
+        self.snapshot_directory = resolve_snapshot_directory(self.data_directory)
+        data = Snapshot()
         for filename in filenames:
             loaded_data = self.load_json_file(filename)
             data_key = filename.replace('.json', '')
@@ -80,41 +173,231 @@ class DataLoader:
 
         if not all(data.values()):
             self.logger.error("One or more JSON files could not be loaded. Please check the file paths and contents.")
+            if not exit_on_error:
+                raise ValueError("One or more JSON files could not be loaded.")
             exit(1)
 
         return data
 
-    def create_prompt(self, data: dict) -> str:
+    def load_history_range(self, start: int = None, end: int = None, site: str = None, db_path: str = None) -> list:
+        """
+        Loads hourly site statistics for a time range from the local history store.
+
+        Args:
+            start (int): Start of the range in milliseconds since the epoch, inclusive.
+            end (int): End of the range in milliseconds since the epoch, inclusive.
+            site (str): Site to read, defaults to SITE_ID.
+            db_path (str): History store path, defaults to HISTORY_DB.
+
+        Returns:
+            list: Hourly records ordered by time, or an empty list if no store is configured.
+        """
+        db_path = db_path or os.getenv('HISTORY_DB')
+        site = site or os.getenv('SITE_ID')
+        if not db_path or not os.path.exists(db_path):
+            self.logger.error("History store not found. Set HISTORY_DB to enable incremental history.")
+            return []
+
+        store = HistoryStore(db_path)
+        try:
+            records = store.read_range(site, start, end)
+        finally:
+            store.close()
+        self.logger.debug(f"Loaded {len(records)} historical records for site {site}")
+        return records
+
+    def prepare_prompt_data(self, data: dict, aggregate: bool = None, channel_plan: bool = False) -> dict:
+        """
+        Selects the datasets sent to the agents.
+
+        With pre-aggregation enabled (PROMPT_AGGREGATES, on by default) the raw client and
+        historical records are replaced by the compact network_statistics tables.
+
+        Args:
+            data (dict): Dictionary containing all loaded JSON data.
+            aggregate (bool): Overrides PROMPT_AGGREGATES.
+            channel_plan (bool): Add the locally computed channel plan (unless CHANNEL_PLAN=0);
+                only meaningful for the whole site.
+
+        Returns:
+            dict: Datasets to render into the prompt.
+        """
+        if aggregate is None:
+            aggregate = os.getenv('PROMPT_AGGREGATES', '1') != '0'
+        prompt_data = data
+        if aggregate:
+            prompt_data = {name: value for name, value in data.items() if name not in AGGREGATED_DATASETS}
+            with span('network_statistics'):
+                prompt_data['network_statistics'] = summarize_network(data)
+
+        if channel_plan:
+            with span('channel_plan'):
+                plan = channel_plan_dataset(data)
+            if plan:
+                prompt_data = {**prompt_data, 'channel_plan': plan}
+        return prompt_data
+
+    @traced('prompt')
+    def create_prompt(self, data: dict, token_budget: int = None, model: str = None, aggregate: bool = None) -> str:
         """
         Constructs the analysis prompt using the loaded JSON data.
 
+        The datasets are pruned to the fields the analysis uses and truncated to fit the
+        token budget of the model. The tokens used per section are logged and kept in
+        last_prompt_report.
+
         Args:
             data (dict): Dictionary containing all loaded JSON data.
+            token_budget (int): Maximum prompt tokens, defaults to PROMPT_TOKEN_BUDGET or
+                a share of the model's context window.
+            model (str): Model the prompt is built for, defaults to MODEL_AGENT.
+            aggregate (bool): Send precomputed statistics instead of raw client and historical data.
 
         Returns:
             str: Formatted prompt string.
         """
-        prompt = f"""
+        data = self.prepare_prompt_data(data, aggregate, channel_plan=True)
+        file_list = self._file_list(data)
+        header = f"""
             Analyze the UniFi network data and provide optimization recommendations based on the following context:
 
             Network Context:
             - This is a UniFi network with 100s of total devices, including 3 access points.
             - We want to optimize the network's performance.
             - The following data files are available for analysis:
-            1. device_config.json: Contains configuration details of all network devices.
-            2. performance_data.json: Includes daily site performance statistics.
-            3. wifi_scans.json: Contains WLAN configuration data.
-            4. rf_environment.json: Provides RF environment data for access points.
-            5. client_devices.json: Lists all client devices connected to the network.
-            6. historical_data.json: Contains hourly site statistics for the past 7 days.
-            7. channel_utilization.json: Provides channel utilization data.
-            
-            Please provide very specific recommendations for imporving network performane and security.  For example if high 
-            retry rates are detected, please recommend a new channel or new settings for the access points.  If low SNR is detected,
-            please recommend a new channel or new settings for the access points.  If high client device is detected, please recommend
-            a new channel or new settings for the access points.  
+{file_list}
             
+{self._recommendation_guidance(data)}            
             When providing recommendations please use device names so the engineers can easily understand the recommendations.
+{self._channel_plan_note(data)}
+            Please provide a comprehensive analysis of the network in the following JSON format:
+
+            {{
+                "overall_health": "string",
+                "potential_issues": ["string", ...],
+                "recommendations": ["string", ...],
+                "additional_insights": ["string", ...]
+            }}
+            Here are the data files:
+
+"""
+        prompt = self._render_prompt(header, data, token_budget, model)
+        self.logger.debug("Prompt created successfully.")
+        return prompt
+
+    @staticmethod
+    def _recommendation_guidance(data: dict) -> str:
+        return CHANNEL_PLAN_GUIDANCE if 'channel_plan' in data else RECOMMENDATION_GUIDANCE
+
+    @staticmethod
+    def _channel_plan_note(data: dict) -> str:
+        return CHANNEL_PLAN_NOTE if 'channel_plan' in data else ''
+
+    @staticmethod
+    def _file_list(data: dict) -> str:
+        return "\n".join(
+            f"            {index}. {name}.json: {DATASET_DESCRIPTIONS.get(name, '')}"
+            for index, name in enumerate(data, start=1)
+        )
+
+    def _render_prompt(self, header: str, data: dict, token_budget: int = None, model: str = None,
+                       name: str = None) -> str:
+        """
+        Appends the data sections to a prompt header within the token budget.
+
+        The token report is kept in last_prompt_report, or in prompt_reports under name for the
+        prompts built concurrently from worker threads (one per section or access point).
+        """
+        with span('render_prompt') as render_span:
+            builder = PromptBuilder(
+                model=model or os.getenv('MODEL_AGENT'),
+                token_budget=token_budget or int(os.getenv('PROMPT_TOKEN_BUDGET', 0)) or None,
+            )
+            sections, report = builder.build_sections(data, reserved_tokens=builder.count_tokens(header))
+            prompt = header + sections + "\n"
+            render_span.set(tokens=report['total'], budget=report['budget'], bytes=len(prompt.encode()))
+        if name is None:
+            self.last_prompt_report = report
+        else:
+            self.prompt_reports[name] = report
+        label = f"Prompt {name}" if name else "Prompt"
+        self.logger.info(f"{label} uses {report['total']} of {report['budget']} tokens: {report['sections']}")
+        if report['truncated']:
+            self.logger.warning(f"Records dropped to fit the token budget: {report['truncated']}")
+        return prompt
+
+    def create_ap_prompt(self, ap_name: str, shard: dict, token_budget: int = None, model: str = None) -> str:
+        """
+        Constructs the map-step prompt analyzing a single access point.
+
+        Args:
+            ap_name (str): Name (or MAC) of the access point.
+            shard (dict): Datasets restricted to the access point and its clients, plus its rows
+                of the channel plan when one was computed.
+            token_budget (int): Maximum prompt tokens.
+            model (str): Model the prompt is built for.
+
+        Returns:
+            str: Formatted prompt string.
+        """
+        data = self.prepare_prompt_data(shard)
+        if 'channel_plan' in data:
+            recommendation = "Point to its planned channel and transmit power changes that address them, " \
+                             "or recommend other setting changes for it."
+        else:
+            recommendation = "Recommend specific channel, transmit power or setting changes for it."
+        header = f"""
+            Analyze the UniFi access point "{ap_name}" using the data below and identify issues that
+            affect its performance, such as high retry rates, low SNR, high channel utilization or
+            too many clients. {recommendation}
+{self._channel_plan_note(data)}
+            The following data files are available for analysis:
+{self._file_list(data)}
+
+            Reply only with JSON in the following format:
+
+            {{
+                "access_point": "{ap_name}",
+                "health": "string",
+                "issues": ["string", ...],
+                "recommendations": ["string", ...],
+                "insights": ["string", ...]
+            }}
+            Here are the data files:
+
+"""
+        mac = (shard.get('device_config') or [{}])[0].get('mac') or ap_name
+        return self._render_prompt(header, data, token_budget, model, name=f'access_point:{mac}')
+
+    def create_reduce_prompt(self, ap_results: dict, site_data: dict, token_budget: int = None,
+                             model: str = None, results_name: str = 'access_point_analyses') -> str:
+        """
+        Constructs the reduce-step prompt merging partial analyses into the site-wide report.
+
+        Args:
+            ap_results (dict): Partial analyses keyed by access point MAC (each with the AP name and
+                the analysis text), or analysis text keyed by analysis area name.
+            site_data (dict): Site-wide datasets (performance, WLAN configuration, statistics).
+            token_budget (int): Maximum prompt tokens.
+            model (str): Model the prompt is built for.
+            results_name (str): 'access_point_analyses' for per-AP results or 'section_analyses'
+                for per-area results.
+
+        Returns:
+            str: Formatted prompt string.
+        """
+        data = {results_name: ap_results, **site_data}
+        scope = "each access point" if results_name == 'access_point_analyses' else \
+            "the performance, RF environment and security"
+        header = f"""
+            Below are independent analyses of {scope} of a UniFi network, followed by
+            site-wide data. Merge them into a single analysis of the whole network. Resolve conflicts
+            between them (for example two neighbouring APs moved to the same channel),
+            remove duplicates and keep device names so the engineers can easily understand the
+            recommendations.
+{self._channel_plan_note(data)}
+            The following data files are available for analysis:
+{self._file_list(data)}
 
             Please provide a comprehensive analysis of the network in the following JSON format:
 
@@ -126,29 +409,84 @@ class DataLoader:
             }}
             Here are the data files:
 
-                <<<device_config.json>>>
-                {json.dumps(data['device_config'], separators=(',', ':'))}
+"""
+        return self._render_prompt(header, data, token_budget, model)
+
+    def create_section_prompt(self, section: str, focus: str, data: dict, token_budget: int = None,
+                              model: str = None) -> str:
+        """
+        Constructs a prompt analyzing one area of the network (e.g. performance, RF or security).
+
+        Args:
+            section (str): Name of the analysis area.
+            focus (str): What the analysis of this area should look at.
+            data (dict): Datasets relevant to the area.
+            token_budget (int): Maximum prompt tokens.
+            model (str): Model the prompt is built for.
 
-                <<<performance_data.json>>>
-                {json.dumps(data['performance_data'], separators=(',', ':'))}
+        Returns:
+            str: Formatted prompt string.
+        """
+        data = self.prepare_prompt_data(data)
+        header = f"""
+            Analyze the {section} of a UniFi network using the data below. Focus on {focus}.
+            Be specific and use device names so the engineers can easily understand the findings.
+{self._channel_plan_note(data)}
+            The following data files are available for analysis:
+{self._file_list(data)}
 
-                <<<wifi_scans.json>>>
-                {json.dumps(data['wifi_scans'], separators=(',', ':'))}
+            Reply only with JSON in the following format:
 
-                <<<rf_environment.json>>>
-                {json.dumps(data['rf_environment'], separators=(',', ':'))}
+            {{
+                "section": "{section}",
+                "health": "string",
+                "issues": ["string", ...],
+                "recommendations": ["string", ...],
+                "insights": ["string", ...]
+            }}
+            Here are the data files:
 
-                <<<client_devices.json>>>
-                {json.dumps(data['client_devices'], separators=(',', ':'))}
+"""
+        return self._render_prompt(header, data, token_budget, model, name=f'section:{section}')
 
-                <<<historical_data.json>>>
-                {json.dumps(data['historical_data'], separators=(',', ':'))}
+    def create_delta_prompt(self, diff: dict, previous_analysis, token_budget: int = None,
+                            model: str = None) -> str:
+        """
+        Constructs a re-analysis prompt containing only what changed since the previous analysis.
 
-                <<<channel_utilization.json>>>
-                {json.dumps(data['channel_utilization'], separators=(',', ':'))}
+        Args:
+            diff (dict): Result of snapshot_diff.diff_snapshots.
+            previous_analysis: The previous analysis result.
+            token_budget (int): Maximum prompt tokens.
+            model (str): Model the prompt is built for.
 
-            """
-        self.logger.debug("Prompt created successfully.")
+        Returns:
+            str: Formatted prompt string.
+        """
+        data = {'network_changes': diff, 'previous_analysis': previous_analysis}
+        header = f"""
+            The UniFi network was analyzed before. Below are the previous analysis and the changes
+            detected in the network since then. Update the analysis: keep previous recommendations that
+            still apply, drop the ones the changes resolved and add recommendations for new issues.
+
+            When providing recommendations please use device names so the engineers can easily understand the recommendations.
+
+            The following data files are available for analysis:
+{self._file_list(data)}
+
+            Please provide the updated analysis of the network in the following JSON format:
+
+            {{
+                "overall_health": "string",
+                "potential_issues": ["string", ...],
+                "recommendations": ["string", ...],
+                "additional_insights": ["string", ...]
+            }}
+            Here are the data files:
+
+"""
+        prompt = self._render_prompt(header, data, token_budget, model)
+        self.logger.debug("Delta prompt created successfully.")
         return prompt
 
     def generate_prompt(self) -> str:
@@ -0,0 +1,163 @@
+"""
+Load test of the agent workflow against the fake LLM backend.
+
+Runs N analyses with a bounded number in flight and reports throughput, per-run latency and
+the latency of each LLM stage:
+
+    python loadtest.py --runs 20 --concurrency 4 --mode sections --latency 0.2
+    python loadtest.py --runs 10 --data-dir path/to/snapshot --output loadtest.json
+
+With --latency 0 the measured time is the orchestration overhead itself (prompt building,
+agents, validation and HTTP round trips). Set LLM_BACKEND to something other than 'fake' to
+run against the configured API instead.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_controller import DATASET_ENDPOINTS, generate_site
+from snapshot_io import write_dataset
+
+logger = logging.getLogger(__name__)
+
+
+def write_synthetic_snapshot(directory: str, num_aps: int, num_clients: int) -> None:
+    """
+    Writes a synthetic site snapshot in the layout produced by DataCollector.
+    """
+    responses = generate_site(num_aps, num_clients)
+    end = int(time.time())
+    for name, endpoint in DATASET_ENDPOINTS.items():
+        data = responses[endpoint]
+        # The hourly report is generated for the requested window, here the last 7 days
+        write_dataset(directory, name, data({'start': end - 7 * 86400, 'end': end}) if callable(data) else data)
+    write_dataset(directory, 'rf_environment', {
+        endpoint.rsplit('/', 1)[1]: data for endpoint, data in responses.items()
+        if endpoint.startswith('stat/spectrum-scan/')
+    })
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 4)
+
+
+def _latency_summary(values: list) -> dict:
+    return {'mean': round(sum(values) / len(values), 4) if values else None,
+            'p50': percentile(values, 50), 'p95': percentile(values, 95), 'max': percentile(values, 100)}
+
+
+def run_load_test(snapshot_dir: str, runs: int = 10, concurrency: int = 4) -> dict:
+    """
+    Runs concurrent analyses of a snapshot and measures them.
+
+    Every run works on its own copy of the snapshot so baselines and results don't collide.
+
+    Args:
+        snapshot_dir (str): Directory holding the collected datasets.
+        runs (int): Number of analyses.
+        concurrency (int): Maximum analyses in flight.
+
+    Returns:
+        dict: Throughput, per-run stage latencies, LLM latencies per stage and failures.
+    """
+    # Imported here so the environment set up by the caller is in place first
+    from load_data import DataLoader
+    from monitor_llm import LLMUsageMonitor
+    from unifi_ai_agents import run_analysis
+
+    work_dir = tempfile.mkdtemp(prefix='loadtest_')
+
+    def run(index):
+        run_dir = shutil.copytree(snapshot_dir, os.path.join(work_dir, f"run_{index}"))
+        started = time.perf_counter()
+        data_loader = DataLoader(run_dir)
+        data = data_loader.load_all_data(exit_on_error=False)
+        loaded = time.perf_counter()
+        run_analysis(data_loader, data)
+        finished = time.perf_counter()
+        return {'load': loaded - started, 'analysis': finished - loaded, 'total': finished - started}
+
+    monitor = LLMUsageMonitor()
+    timings, failures = [], []
+    started = time.perf_counter()
+    try:
+        with monitor.instrument(), ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run, index) for index in range(runs)]
+            for future in futures:
+                try:
+                    timings.append(future.result())
+                except Exception as e:
+                    logger.error(f"Analysis run failed: {e}")
+                    failures.append(str(e))
+        wall = time.perf_counter() - started
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Per-AP and per-section agents carry the AP or section in their name; group them by role
+    llm_stages = {}
+    for call in monitor.calls:
+        stage = re.sub(r'_[0-9a-f]{12}$', '', call['stage'] or 'unknown')
+        llm_stages.setdefault(stage, []).append(call['latency'])
+
+    totals = monitor.totals()
+    return {
+        'runs': runs,
+        'concurrency': concurrency,
+        'failed': len(failures),
+        'wall_seconds': round(wall, 3),
+        'throughput_per_minute': round(len(timings) / wall * 60, 2) if wall else None,
+        'run_seconds': {stage: _latency_summary([timing[stage] for timing in timings])
+                        for stage in ('load', 'analysis', 'total')},
+        'llm_calls': totals['calls'],
+        'llm_calls_per_run': round(totals['calls'] / runs, 2) if runs else None,
+        'llm_tokens': totals['prompt_tokens'] + totals['completion_tokens'],
+        'llm_stages': {stage: {'calls': len(latencies), **_latency_summary(latencies)}
+                       for stage, latencies in llm_stages.items()},
+        'errors': failures[:10],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the agent workflow.")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mode', choices=('groupchat', 'mapreduce', 'sections'),
+                        default=os.getenv('ANALYSIS_MODE', 'groupchat'))
+    parser.add_argument('--data-dir', help="snapshot to analyze, a synthetic site is generated by default")
+    parser.add_argument('--aps', type=int, default=10, help="access points of the synthetic site")
+    parser.add_argument('--clients', type=int, default=200, help="clients of the synthetic site")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the fake LLM adds per completion")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    os.environ.setdefault('LLM_BACKEND', 'fake')
+    os.environ['FAKE_LLM_LATENCY'] = str(args.latency)
+    os.environ['FAKE_LLM_JITTER'] = str(args.jitter)
+    os.environ['ANALYSIS_MODE'] = args.mode
+    # Every run must reach the LLM, so cached results are not reused
+    os.environ['LLM_CACHE_BYPASS'] = '1'
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        if args.data_dir:
+            snapshot_dir = args.data_dir
+        else:
+            write_synthetic_snapshot(snapshot_dir, args.aps, args.clients)
+        results = run_load_test(snapshot_dir, args.runs, args.concurrency)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
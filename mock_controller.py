@@ -0,0 +1,365 @@
+"""
+Local stand-in for a UniFi OS controller.
+
+Serves the login and proxy/network/api/s/{site}/... endpoints used by DataCollector from
+synthetic data of any size, or replays a previously collected snapshot directory:
+
+    python mock_controller.py --aps 50 --clients 2000 --latency 0.05
+    python mock_controller.py --replay fleet_data/10.0.0.1/default
+
+Point CONTROLLER_URL at the printed address; the credentials are admin/admin unless
+--username/--password are given.
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from snapshot_io import find_dataset, load_dataset
+from snapshot_store import resolve_snapshot_directory
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/proxy/network/api/s/'
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Collected dataset name for each endpoint, used to replay a snapshot directory
+DATASET_ENDPOINTS = {
+    'device_config': 'stat/device',
+    'performance_data': 'stat/report/daily.site',
+    'wifi_scans': 'rest/wlanconf',
+    'client_devices': 'stat/sta',
+    'historical_data': 'stat/report/hourly.site',
+    'channel_utilization': 'stat/health',
+}
+
+CHANNELS = {'ng': (1, 6, 11), 'na': (36, 40, 44, 48, 149, 153, 157, 161), '6e': (5, 21, 37, 53, 69, 85)}
+RADIO_NAMES = {'ng': 'wifi0', 'na': 'wifi1', '6e': 'wifi2'}
+# Synthetic APs are laid out on a grid; each lists the APs within NEIGHBOR_CELLS grid cells it hears
+AP_SPACING_M = 15
+NEIGHBOR_CELLS = 3
+
+
+def _mac(prefix: int, index: int) -> str:
+    return f"{prefix:02x}:00:{(index >> 24) & 255:02x}:{(index >> 16) & 255:02x}:{(index >> 8) & 255:02x}:{index & 255:02x}"
+
+
+def _radio(rng, radio, num_sta):
+    channel = rng.choice(CHANNELS[radio])
+    width = {'ng': 20, 'na': 80, '6e': 160}[radio]
+    tx_packets = rng.randint(10_000, 5_000_000)
+    config = {'name': RADIO_NAMES[radio], 'radio': radio, 'channel': channel, 'ht': width,
+              'tx_power_mode': rng.choice(('auto', 'medium', 'high')), 'tx_power': rng.randint(10, 23),
+              'min_rssi_enabled': False}
+    stats = {'name': config['name'], 'radio': radio, 'channel': channel, 'cu_total': rng.randint(5, 95),
+             'cu_self_rx': rng.randint(0, 30), 'cu_self_tx': rng.randint(0, 30), 'num_sta': num_sta,
+             'satisfaction': rng.randint(60, 100), 'tx_packets': tx_packets,
+             'tx_retries': int(tx_packets * rng.uniform(0.01, 0.3)), 'tx_power': config['tx_power']}
+    return config, stats
+
+
+def _neighbors(rng, ap_macs: list) -> list:
+    """
+    Places the APs on a grid and returns, per AP, the APs it hears with a distance-based signal.
+    """
+    columns = math.isqrt(max(len(ap_macs) - 1, 0)) + 1
+    positions = [((index % columns) * AP_SPACING_M + rng.uniform(-3, 3),
+                  (index // columns) * AP_SPACING_M + rng.uniform(-3, 3)) for index in range(len(ap_macs))]
+    neighbors = []
+    for index, (x, y) in enumerate(positions):
+        row, column = divmod(index, columns)
+        heard = []
+        for other_row in range(row - NEIGHBOR_CELLS, row + NEIGHBOR_CELLS + 1):
+            for other_column in range(max(column - NEIGHBOR_CELLS, 0), min(column + NEIGHBOR_CELLS + 1, columns)):
+                other = other_row * columns + other_column
+                if other_row < 0 or other == index or other >= len(ap_macs):
+                    continue
+                distance = math.hypot(x - positions[other][0], y - positions[other][1])
+                signal = round(-35 - 30 * math.log10(max(distance, 1)))
+                if signal >= -85:
+                    heard.append({'mac': ap_macs[other], 'signal': signal})
+        neighbors.append(heard)
+    return neighbors
+
+
+def generate_site(num_aps: int = 3, num_clients: int = 50, seed: int = 0) -> dict:
+    """
+    Generates synthetic responses for every endpoint of one site.
+
+    Args:
+        num_aps (int): Number of access points.
+        num_clients (int): Number of clients; about a tenth are wired.
+        seed (int): Random seed, the same seed always produces the same site.
+
+    Returns:
+        dict: Response data keyed by endpoint path. The hourly report is a callable taking the
+        request parameters, and spectrum scans are keyed by 'stat/spectrum-scan/{mac}'.
+    """
+    rng = random.Random(seed)
+    ap_macs = [_mac(0x02, index) for index in range(num_aps)]
+    clients = []
+    for index in range(num_clients):
+        client = {'mac': _mac(0x06, index), 'hostname': f"client-{index}", 'uptime': rng.randint(60, 864_000),
+                  'tx_packets': rng.randint(1_000, 1_000_000), 'satisfaction': rng.randint(40, 100)}
+        if rng.random() < 0.1:
+            client['is_wired'] = True
+        else:
+            radio = rng.choice(('ng', 'na', 'na', '6e'))
+            signal = rng.randint(-85, -35)
+            attempts = rng.randint(1_000, 1_000_000)
+            client.update({
+                'is_wired': False, 'ap_mac': rng.choice(ap_macs), 'essid': rng.choice(('Home', 'IoT', 'Guest')),
+                'radio': radio, 'channel': rng.choice(CHANNELS[radio]),
+                'radio_proto': {'ng': 'ng', 'na': 'ac', '6e': 'ax'}[radio], 'signal': signal, 'rssi': signal + 95,
+                'noise': -95, 'tx_rate': rng.choice((6_000, 54_000, 144_000, 433_000, 866_000, 1_201_000)),
+                'rx_rate': rng.choice((6_000, 54_000, 144_000, 433_000, 866_000)),
+                'wifi_tx_attempts': attempts, 'tx_retries': int(attempts * rng.uniform(0, 0.35)),
+            })
+        clients.append(client)
+
+    stations = {}
+    for client in clients:
+        if client.get('ap_mac'):
+            stations[client['ap_mac']] = stations.get(client['ap_mac'], 0) + 1
+    devices = [
+        {'name': 'Gateway', 'mac': _mac(0x0a, 0), 'model': 'UDM-Pro', 'type': 'udm', 'version': '4.0.6',
+         'ip': '192.168.1.1', 'state': 1, 'uptime': 1_000_000},
+        {'name': 'Switch', 'mac': _mac(0x0a, 1), 'model': 'USW-24-PoE', 'type': 'usw', 'version': '7.0.50',
+         'ip': '192.168.1.2', 'state': 1, 'uptime': 1_000_000},
+    ]
+    spectrum = {}
+    neighbors = _neighbors(rng, ap_macs)
+    for index, mac in enumerate(ap_macs):
+        radios = [_radio(rng, radio, stations.get(mac, 0) // 3) for radio in ('ng', 'na', '6e')]
+        devices.append({
+            'name': f"AP-{index}", 'mac': mac, 'model': 'U6-Pro', 'type': 'uap', 'version': '6.6.77',
+            'ip': f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}", 'state': 1,
+            'uptime': rng.randint(3_600, 10_000_000), 'num_sta': stations.get(mac, 0),
+            'satisfaction': rng.randint(60, 100),
+            'radio_table': [config for config, _ in radios], 'radio_table_stats': [stats for _, stats in radios],
+            'neighbors': neighbors[index],
+        })
+        spectrum[f"stat/spectrum-scan/{mac}"] = [{
+            'spectrum_table': [
+                {'radio': radio, 'channel': channel, 'utilization': rng.randint(0, 100),
+                 'interference': rng.randint(0, 60), 'interference_type': rng.choice(('', 'wifi', 'non-wifi'))}
+                for radio, channels in CHANNELS.items() for channel in channels
+            ]
+        }]
+
+    now = int(time.time() * 1000) // HOUR_MS * HOUR_MS
+
+    def hourly(params):
+        # Hourly buckets between the requested start and end (seconds), like the controller report
+        end = int(params.get('end', now // 1000)) * 1000
+        start = int(params.get('start', (end - 7 * DAY_MS) // 1000)) * 1000
+        records = []
+        for bucket in range(-(-start // HOUR_MS) * HOUR_MS, end, HOUR_MS):
+            hour = bucket // HOUR_MS % 24
+            active = int(num_clients * (0.3 + 0.7 * abs(12 - hour) / 12))
+            records.append({
+                'time': bucket, 'num_sta': active, 'wlan-num_sta': active, 'lan-num_sta': num_clients // 10,
+                'wlan_bytes': active * 5_000_000, 'wan-tx_bytes': active * 1_000_000,
+                'wan-rx_bytes': active * 8_000_000, 'latency_avg': 10 + hour,
+            })
+        return records
+
+    return {
+        'stat/device': devices,
+        'stat/sta': clients,
+        'stat/report/daily.site': [
+            {'time': now - day * DAY_MS, 'num_sta': num_clients, 'wlan-num_sta': num_clients - num_clients // 10,
+             'lan-num_sta': num_clients // 10, 'wlan_bytes': num_clients * 100_000_000,
+             'wan-tx_bytes': num_clients * 20_000_000, 'wan-rx_bytes': num_clients * 160_000_000,
+             'latency_avg': rng.randint(5, 40)}
+            for day in range(30)
+        ],
+        'stat/report/hourly.site': hourly,
+        'rest/wlanconf': [
+            {'_id': uuid.UUID(int=rng.getrandbits(128)).hex[:24], 'name': name, 'enabled': True,
+             'security': 'wpapsk', 'wpa_mode': 'wpa2', 'wpa3_support': name == 'Home', 'is_guest': name == 'Guest',
+             'hide_ssid': False, 'pmf_mode': 'optional', 'fast_roaming_enabled': name == 'Home',
+             'bss_transition': True, 'wlan_band': 'both'}
+            for name in ('Home', 'IoT', 'Guest')
+        ],
+        'stat/health': [
+            {'subsystem': 'wlan', 'status': 'ok', 'num_ap': num_aps, 'num_adopted': num_aps,
+             'num_disconnected': 0, 'num_user': num_clients, 'num_guest': 0,
+             'tx_bytes-r': num_clients * 1_000, 'rx_bytes-r': num_clients * 8_000},
+            {'subsystem': 'wan', 'status': 'ok', 'latency': 12},
+            {'subsystem': 'lan', 'status': 'ok', 'num_sw': 1, 'num_user': num_clients // 10},
+        ],
+        **spectrum,
+    }
+
+
+def load_recording(directory: str) -> dict:
+    """
+    Builds the endpoint responses of one site from a collected snapshot directory, or from the
+    latest snapshot of a data directory.
+    """
+    directory = resolve_snapshot_directory(directory)
+    responses = {}
+    for name, endpoint in DATASET_ENDPOINTS.items():
+        path = find_dataset(directory, name)
+        if path:
+            responses[endpoint] = load_dataset(path)
+    path = find_dataset(directory, 'rf_environment')
+    for mac, scan in (load_dataset(path) if path else {}).items():
+        responses[f"stat/spectrum-scan/{mac}"] = scan
+    return responses
+
+
+class MockController:
+    """
+    Threaded HTTP server answering like a UniFi OS controller.
+
+    Login sets a TOKEN cookie and returns an X-CSRF-Token header; API requests without both
+    are answered with 401, so session reuse and re-authentication behave as against a real
+    controller.
+    """
+
+    def __init__(self, sites: dict = None, latency: float = 0.0, jitter: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0, username: str = 'admin', password: str = 'admin'):
+        """
+        Initializes the controller.
+
+        Args:
+            sites (dict): Endpoint responses keyed by site name, defaults to a small synthetic 'default' site.
+            latency (float): Seconds added to every response.
+            jitter (float): Maximum random seconds added on top of the latency.
+            host (str): Address to listen on.
+            port (int): Port to listen on, 0 picks a free port.
+            username (str): Accepted login username.
+            password (str): Accepted login password.
+        """
+        self.sites = sites if sites is not None else {'default': generate_site()}
+        self.latency = latency
+        self.jitter = jitter
+        self.credentials = (username, password)
+        self.token = None
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockController':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Mock controller listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def expire_sessions(self) -> None:
+        # Invalidate the current login, the next API request gets a 401
+        self.token = None
+
+    def _respond(self, path: str, query: dict, cookie: str, csrf: str):
+        with self._lock:
+            self.request_count += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if not self.token or f"TOKEN={self.token}" not in (cookie or '') or csrf != f"csrf-{self.token}":
+            return 401, {'meta': {'rc': 'error', 'msg': 'api.err.LoginRequired'}, 'data': []}
+        if not path.startswith(API_PREFIX):
+            return 404, {'meta': {'rc': 'error', 'msg': 'api.err.NotFound'}, 'data': []}
+        site, _, endpoint = path[len(API_PREFIX):].partition('/')
+        responses = self.sites.get(site)
+        if responses is None or endpoint not in responses:
+            return 404, {'meta': {'rc': 'error', 'msg': 'api.err.NotFound'}, 'data': []}
+        data = responses[endpoint]
+        if callable(data):
+            data = data({key: values[0] for key, values in query.items()})
+        return 200, {'meta': {'rc': 'ok'}, 'data': data}
+
+    def _handler(self):
+        controller = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except json.JSONDecodeError:
+                    body = {}
+                if urlparse(self.path).path != '/api/auth/login':
+                    return self._send(404, {})
+                if (body.get('username'), body.get('password')) != controller.credentials:
+                    return self._send(401, {'code': 'AUTHENTICATION_FAILED_INVALID_CREDENTIALS'})
+                controller.token = uuid.uuid4().hex
+                self._send(200, {'username': body['username']}, {
+                    'Set-Cookie': f"TOKEN={controller.token}; Path=/; HttpOnly",
+                    'X-CSRF-Token': f"csrf-{controller.token}",
+                })
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = controller._respond(url.path, parse_qs(url.query), self.headers.get('Cookie'),
+                                                   self.headers.get('X-CSRF-Token'))
+                self._send(status, body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock UniFi controller.")
+    parser.add_argument('--aps', type=int, default=3, help="access points of the synthetic site")
+    parser.add_argument('--clients', type=int, default=50, help="clients of the synthetic site")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help="snapshot directory to serve instead of synthetic data")
+    parser.add_argument('--site', default='default')
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    responses = load_recording(args.replay) if args.replay else generate_site(args.aps, args.clients, args.seed)
+    controller = MockController({args.site: responses}, args.latency, args.jitter, args.host, args.port,
+                                args.username, args.password)
+    controller.start()
+    try:
+        controller._thread.join()
+    except KeyboardInterrupt:
+        controller.stop()
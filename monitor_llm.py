@@ -1,32 +1,261 @@
 #this helper class will monitor the LLM for taken usage and estimate the cost
 
-import openai
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Default prices in USD per million tokens; override with a JSON file via LLM_PRICE_TABLE
+# in the same format: {"model": {"prompt": 2.5, "completion": 10.0}, ...}
+DEFAULT_PRICE_TABLE = {
+    "gpt-4o": {"prompt": 2.50, "completion": 10.00},
+    "gpt-4o-mini": {"prompt": 0.15, "completion": 0.60},
+    "gpt-4-turbo": {"prompt": 10.00, "completion": 30.00},
+    "gpt-4": {"prompt": 30.00, "completion": 60.00},
+    "gpt-3.5-turbo": {"prompt": 0.50, "completion": 1.50},
+}
+
+REPORT_FIELDS = ["timestamp", "stage", "agent", "model", "prompt_tokens", "completion_tokens",
+                 "latency", "cost", "cached"]
+
+
+# Monitors inside instrument() and the autogen methods patched for them: (owner, name) ->
+# (original, patched). The patches are installed with the first active monitor and removed
+# with the last one.
+_patch_lock = threading.Lock()
+_active_monitors = []
+_patches = {}
+# Set while a patched call runs, so stacked patches (see _remove_patches) record it once
+_dispatching = threading.local()
+
+
+def _monitors():
+    with _patch_lock:
+        return list(_active_monitors)
+
+
+def _wrap_create(original):
+    def create(wrapper_self, **config):
+        monitors = _monitors()
+        if not monitors or getattr(_dispatching, "active", False):
+            return original(wrapper_self, **config)
+        agent = getattr(config.get("agent"), "name", None)
+        stage = next((monitor.current_stage() for monitor in monitors if monitor.current_stage()), None)
+        # Request payload size: the text of the messages sent
+        request_bytes = sum(len(str(message.get("content") or "").encode())
+                            for message in config.get("messages") or [] if isinstance(message, dict))
+        with span("llm", kind="client", stage=stage or agent, agent=agent, bytes=request_bytes) as llm_span:
+            started = time.perf_counter()
+            _dispatching.active = True
+            try:
+                response = original(wrapper_self, **config)
+            finally:
+                _dispatching.active = False
+            latency = time.perf_counter() - started
+            usage = getattr(response, "usage", None)
+            model = getattr(response, "model", None) or config.get("model")
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            cached = bool(getattr(response, "is_cached", False))
+            llm_span.set(model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                         cached=cached)
+        for monitor in monitors:
+            monitor.record_call(model, prompt_tokens, completion_tokens, latency=latency, agent=agent,
+                                cached=cached)
+        return response
+    return create
+
+
+def _wrap_stage(stage_name):
+    def wrap(original):
+        def method(*args, **kwargs):
+            with ExitStack() as stack:
+                for monitor in _monitors():
+                    stack.enter_context(monitor.stage(stage_name))
+                return original(*args, **kwargs)
+        return method
+    return wrap
+
+
+def _install_patches():
+    # Called under _patch_lock by the first active monitor
+    from autogen import ConversableAgent, GroupChat
+    from autogen.oai.client import OpenAIWrapper
+
+    for owner, name, wrapper in ((OpenAIWrapper, "create", _wrap_create),
+                                 (GroupChat, "select_speaker", _wrap_stage("speaker_selection")),
+                                 (ConversableAgent, "_reflection_with_llm", _wrap_stage("summary"))):
+        current = getattr(owner, name, None)
+        if current is None:
+            logger.warning(f"Cannot instrument {owner.__name__}.{name}, it does not exist in this autogen version")
+            continue
+        if (owner, name) in _patches and current is _patches[(owner, name)][1]:
+            continue
+        _patches[(owner, name)] = (current, wrapper(current))
+        setattr(owner, name, _patches[(owner, name)][1])
+
+
+def _remove_patches():
+    # Called under _patch_lock by the last active monitor. A method patched again on top of ours
+    # (e.g. by a batch throttle) is left alone: its owner restores our patch, which then only
+    # passes calls through until the next monitor reuses it.
+    for (owner, name), (original, patched) in list(_patches.items()):
+        if getattr(owner, name) is patched:
+            setattr(owner, name, original)
+            del _patches[(owner, name)]
+
+
+def load_price_table(path=None):
+    if not path:
+        return dict(DEFAULT_PRICE_TABLE)
+    with open(path, "r") as f:
+        return json.load(f)
+
 
 class LLMUsageMonitor:
-    def __init__(self, api_key):
+    def __init__(self, api_key=None, price_table=None):
         self.api_key = api_key
-        self.client = openai.OpenAI(api_key=self.api_key)
-        
+        self.prices = price_table if price_table is not None else load_price_table(os.getenv("LLM_PRICE_TABLE"))
+        self.calls = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _price(self, model):
+        # Dated model names (e.g. gpt-4o-2024-08-06) use the price of the longest matching prefix
+        if model in self.prices:
+            return self.prices[model]
+        matches = [name for name in self.prices if model and model.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else {}
+
     def estimate_cost(self, model, prompt_tokens, completion_tokens):
         # Estimate cost based on model and token usage
-        cost_per_million_prompt_tokens = {
-            "gpt-4o": 100,    
-        }
-        cost_per_million_completion_tokens = {
-            "gpt-4o": 300,
-        }
-        
-        prompt_cost = (prompt_tokens / 1_000_000) * cost_per_million_prompt_tokens.get(model, 0)
-        completion_cost = (completion_tokens / 1_000_000) * cost_per_million_completion_tokens.get(model, 0)
-        
+        price = self._price(model)
+        prompt_cost = (prompt_tokens / 1_000_000) * price.get("prompt", 0)
+        completion_cost = (completion_tokens / 1_000_000) * price.get("completion", 0)
+
         total_cost = prompt_cost + completion_cost
         return total_cost
-    
+
     def monitor_usage(self, model, prompt_tokens, completion_tokens):
         # Monitor usage and estimate cost
-        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
-        print(f"Estimated cost: ${cost:.2f}")
+        cost = self.record_call(model, prompt_tokens, completion_tokens)
+        logger.info(f"Estimated cost: ${cost:.4f}")
+        return cost
+
+    def record_call(self, model, prompt_tokens, completion_tokens, latency=0.0, agent=None, stage=None, cached=False):
+        cost = 0.0 if cached else self.estimate_cost(model, prompt_tokens, completion_tokens)
+        call = {
+            "timestamp": time.time(),
+            "stage": stage or self.current_stage() or agent,
+            "agent": agent,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": round(latency, 3),
+            "cost": cost,
+            "cached": cached,
+        }
+        with self._lock:
+            self.calls.append(call)
+        logger.debug(f"LLM call: {call}")
+        return cost
+
+    def current_stage(self):
+        stages = getattr(self._local, "stages", None)
+        return stages[-1] if stages else None
+
+    @contextmanager
+    def stage(self, name):
+        # Label every LLM call made by this thread inside the block
+        stages = getattr(self._local, "stages", None)
+        if stages is None:
+            stages = self._local.stages = []
+        stages.append(name)
+        try:
+            yield
+        finally:
+            stages.pop()
+
+    @contextmanager
+    def instrument(self):
+        """
+        Records token usage and latency of every autogen LLM call made inside the block,
+        labelling speaker selection and reflection_with_llm summary calls with their stage.
+
+        The autogen methods are patched once while any monitor is instrumenting and every call is
+        recorded by each active monitor, so overlapping blocks (concurrent analyses, a batch next
+        to a daemon analysis) may end in any order.
+        """
+        with _patch_lock:
+            if not _active_monitors:
+                _install_patches()
+            _active_monitors.append(self)
+        try:
+            yield self
+        finally:
+            with _patch_lock:
+                _active_monitors.remove(self)
+                if not _active_monitors:
+                    _remove_patches()
+
+    def totals(self):
+        with self._lock:
+            calls = list(self.calls)
+        totals = {
+            "calls": len(calls),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in calls),
+            "latency": round(sum(call["latency"] for call in calls), 3),
+            "cost": sum(call["cost"] for call in calls),
+            "by_stage": {},
+            "by_model": {},
+        }
+        for call in calls:
+            for group, key in (("by_stage", call["stage"] or "unknown"), ("by_model", call["model"] or "unknown")):
+                entry = totals[group].setdefault(key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                       "latency": 0.0, "cost": 0.0})
+                entry["calls"] += 1
+                entry["prompt_tokens"] += call["prompt_tokens"]
+                entry["completion_tokens"] += call["completion_tokens"]
+                entry["latency"] = round(entry["latency"] + call["latency"], 3)
+                entry["cost"] += call["cost"]
+        return totals
+
+    def write_report(self, path):
+        # Write the per-call records as CSV, or the calls plus totals as JSON
+        with self._lock:
+            calls = list(self.calls)
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(calls)
+        else:
+            with open(path, "w") as f:
+                json.dump({"totals": self.totals(), "calls": calls}, f, indent=2)
+        logger.info(f"LLM usage report written to {path}")
+
+    def log_summary(self):
+        totals = self.totals()
+        logger.info(
+            f"LLM usage: {totals['calls']} calls, {totals['prompt_tokens']} prompt + "
+            f"{totals['completion_tokens']} completion tokens, {totals['latency']:.2f}s, "
+            f"estimated cost ${totals['cost']:.4f}"
+        )
+        for stage, entry in totals["by_stage"].items():
+            logger.info(f"  {stage}: {entry['calls']} calls, {entry['prompt_tokens'] + entry['completion_tokens']} "
+                        f"tokens, {entry['latency']:.2f}s, ${entry['cost']:.4f}")
 
 # Example usage
 if __name__ == "__main__":
-    api_key = "your_openai_api_key"
+    logging.basicConfig(level=logging.INFO)
+    monitor = LLMUsageMonitor()
+    monitor.monitor_usage("gpt-4o", 12000, 800)
+    monitor.log_summary()
@@ -0,0 +1,217 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Numeric client fields kept as array columns for local analytics
+CLIENT_COLUMNS = ('signal', 'noise', 'tx_retries', 'wifi_tx_attempts', 'tx_packets', 'channel')
+# Numeric radio attributes kept as array columns, keyed by column name
+RADIO_COLUMNS = {'channel': 'channel', 'num_sta': 'num_sta', 'cu_total': 'utilization', 'tx_power': 'tx_power'}
+
+
+def numeric_column(records: list, field: str) -> np.ndarray:
+    """
+    Extracts a numeric field from a list of records as a float array, with NaN for missing values.
+    """
+    return np.array([record.get(field) if isinstance(record.get(field), (int, float)) else np.nan
+                     for record in records], dtype=float)
+
+
+def _attribute_column(objects: list, attribute: str) -> np.ndarray:
+    values = (getattr(obj, attribute) for obj in objects)
+    return np.array([value if isinstance(value, (int, float)) else np.nan for value in values], dtype=float)
+
+
+def _positions_by_key(keys: np.ndarray) -> dict:
+    """
+    Groups row positions by key value, skipping empty keys.
+    """
+    if not keys.size:
+        return {}
+    order = np.argsort(keys, kind='stable')
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    return {key: positions for key, positions in zip(unique_keys.tolist(), np.split(order, starts[1:])) if key != ''}
+
+
+class Radio:
+    """
+    One radio of an access point, merged from radio_table and radio_table_stats.
+    """
+    __slots__ = ('ap_mac', 'name', 'radio', 'channel', 'width', 'tx_power_mode', 'tx_power', 'utilization', 'num_sta')
+
+    def __init__(self, ap_mac, config, stats):
+        self.ap_mac = ap_mac
+        self.name = stats.get('name') or config.get('name')
+        self.radio = stats.get('radio') or config.get('radio')
+        self.channel = stats.get('channel', config.get('channel'))
+        self.width = config.get('ht')
+        self.tx_power_mode = config.get('tx_power_mode')
+        self.tx_power = stats.get('tx_power', config.get('tx_power'))
+        self.utilization = stats.get('cu_total')
+        self.num_sta = stats.get('num_sta')
+
+
+class AccessPoint:
+    """
+    An access point with its radios and spectrum scan; record is the raw device entry.
+    """
+    __slots__ = ('mac', 'name', 'model', 'radios', 'scan', 'record')
+
+    def __init__(self, record, scan=None):
+        self.mac = record['mac']
+        self.name = record.get('name')
+        self.model = record.get('model')
+        self.record = record
+        self.scan = scan
+        configs = {config.get('name'): config for config in record.get('radio_table') or []}
+        self.radios = [Radio(self.mac, configs.get(stats.get('name'), {}), stats)
+                       for stats in record.get('radio_table_stats') or []]
+
+
+class NetworkIndex:
+    """
+    Indexed, column-oriented view of a snapshot's devices and clients.
+
+    Clients are kept as NumPy columns plus position indexes by MAC, AP, SSID and channel, so
+    joins (client to AP, AP to spectrum scan, SSID to clients) are lookups instead of scans
+    over the raw records. The raw records are referenced, not copied.
+    """
+
+    def __init__(self, data: dict):
+        """
+        Builds the index.
+
+        Args:
+            data (dict): Loaded datasets keyed by name.
+        """
+        devices = [device for device in data.get('device_config') or [] if device.get('mac')]
+        rf_environment = data.get('rf_environment') or {}
+        self.devices = {device['mac']: device for device in devices}
+        self.access_points = {device['mac']: AccessPoint(device, rf_environment.get(device['mac']))
+                              for device in devices if device.get('type') == 'uap'}
+        self.radios = [radio for ap in self.access_points.values() for radio in ap.radios]
+        self.radio_columns = {column: _attribute_column(self.radios, attribute)
+                              for column, attribute in RADIO_COLUMNS.items()}
+        self._radios_by_channel = {}
+        for radio in self.radios:
+            if radio.channel is not None:
+                self._radios_by_channel.setdefault((radio.radio, radio.channel), []).append(radio)
+
+        self.client_records = data.get('client_devices') or []
+        self.clients = {field: numeric_column(self.client_records, field) for field in CLIENT_COLUMNS}
+        self.clients['ap_mac'] = np.array([client.get('ap_mac') or '' for client in self.client_records], dtype=str)
+        self.clients['essid'] = np.array([client.get('essid') or '' for client in self.client_records], dtype=str)
+        self._client_by_mac = {client['mac']: position for position, client in enumerate(self.client_records)
+                               if client.get('mac')}
+        self._clients_by_ap = _positions_by_key(self.clients['ap_mac'])
+        self._clients_by_ssid = _positions_by_key(self.clients['essid'])
+        self._clients_by_channel = _positions_by_key(np.array(
+            [str(client['channel']) if client.get('channel') is not None else '' for client in self.client_records],
+            dtype=str,
+        ))
+        logger.debug(f"Network index built: {len(self.devices)} devices, {len(self.access_points)} APs, "
+                     f"{len(self.client_records)} clients")
+
+    @property
+    def wireless(self) -> np.ndarray:
+        # Boolean mask of the clients associated with an AP
+        return self.clients['ap_mac'] != ''
+
+    def device(self, mac: str):
+        return self.devices.get(mac)
+
+    def client(self, mac: str):
+        position = self._client_by_mac.get(mac)
+        return None if position is None else self.client_records[position]
+
+    def client_positions_by_ap(self) -> dict:
+        # Row positions in the client columns of each AP's clients, sorted by AP MAC
+        return self._clients_by_ap
+
+    def _records(self, positions) -> list:
+        return [self.client_records[position] for position in positions] if positions is not None else []
+
+    def clients_of_ap(self, ap_mac: str) -> list:
+        return self._records(self._clients_by_ap.get(ap_mac))
+
+    def clients_on_ssid(self, essid: str) -> list:
+        return self._records(self._clients_by_ssid.get(essid))
+
+    def clients_on_channel(self, channel: int) -> list:
+        return self._records(self._clients_by_channel.get(str(channel)))
+
+    def radios_on(self, radio: str, channel: int) -> list:
+        return self._radios_by_channel.get((radio, channel), [])
+
+    def scan(self, ap_mac: str):
+        ap = self.access_points.get(ap_mac)
+        return ap.scan if ap else None
+
+
+class Snapshot(dict):
+    """
+    Datasets of one collected snapshot; the NetworkIndex is built on first use and shared.
+    """
+    __slots__ = ('_index',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._index = None
+
+    # Every mutator drops the index so it is rebuilt from the new datasets on next use
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._index = None
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._index = None
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._index = None
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._index = None
+        return super().setdefault(key, default)
+
+    def pop(self, key, *default):
+        self._index = None
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self._index = None
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self._index = None
+
+    @property
+    def index(self) -> NetworkIndex:
+        if self._index is None:
+            self._index = NetworkIndex(self)
+        return self._index
+
+    def select(self, names, **datasets) -> 'Snapshot':
+        """
+        Returns the named datasets (those present) plus extra ones as a Snapshot sharing this
+        snapshot's index, which keeps describing every device and client of the site.
+        """
+        selection = Snapshot({name: self[name] for name in names if self.get(name) is not None}, **datasets)
+        selection._index = self.index
+        return selection
+
+
+def network_index(data: dict) -> NetworkIndex:
+    """
+    Returns the snapshot's shared index, building a new one for plain dicts.
+    """
+    return data.index if isinstance(data, Snapshot) else NetworkIndex(data)
@@ -0,0 +1,258 @@
+import json
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes for the models we run with; unknown models fall back to DEFAULT_CONTEXT_WINDOW
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# tiktoken encodings per model; None records that no encoding could be loaded (e.g. offline)
+_ENCODINGS = {}
+
+# Share of the context window the initial prompt may use; the rest is left for the chat rounds
+PROMPT_CONTEXT_SHARE = 0.5
+
+# Summary sections (dicts of tables) are allocated before the raw datasets, up to
+# SUMMARY_BUDGET_SHARE of the budget, and truncated by rows within each table rather than
+# by whole tables; they are worth more per token than the raw records they replace
+SUMMARY_SECTIONS = ('network_statistics', 'channel_plan')
+SUMMARY_BUDGET_SHARE = 0.5
+
+# Fields kept per dataset. A tuple lists leaf fields to keep; a dict maps a field to the
+# projection applied to its value (None keeps the value as is).
+FIELD_ALLOWLISTS = {
+    'device_config': {
+        'name': None, 'mac': None, 'model': None, 'type': None, 'version': None, 'ip': None,
+        'state': None, 'uptime': None, 'num_sta': None, 'satisfaction': None,
+        'radio_table': ('name', 'radio', 'channel', 'ht', 'tx_power_mode', 'tx_power',
+                        'min_rssi_enabled', 'min_rssi'),
+        'radio_table_stats': ('name', 'radio', 'channel', 'cu_total', 'cu_self_rx', 'cu_self_tx',
+                              'num_sta', 'satisfaction', 'tx_retries', 'tx_packets', 'tx_power'),
+    },
+    'performance_data': ('time', 'num_sta', 'wlan-num_sta', 'lan-num_sta', 'wlan_bytes',
+                         'wan-tx_bytes', 'wan-rx_bytes', 'latency_avg', 'wifi_tx_attempts', 'tx_retries'),
+    'wifi_scans': ('_id', 'name', 'enabled', 'security', 'wpa_mode', 'wpa3_support', 'wlan_band',
+                   'hide_ssid', 'is_guest', 'pmf_mode', 'fast_roaming_enabled', 'bss_transition',
+                   'uapsd_enabled', 'multicast_enhance_enabled', 'minrate_ng_data_rate_kbps',
+                   'minrate_na_data_rate_kbps'),
+    'rf_environment': None,
+    'client_devices': ('mac', 'hostname', 'name', 'ap_mac', 'essid', 'channel', 'radio', 'radio_proto',
+                       'signal', 'rssi', 'noise', 'satisfaction', 'tx_rate', 'rx_rate', 'tx_retries',
+                       'wifi_tx_attempts', 'tx_packets', 'uptime', 'is_wired'),
+    'historical_data': ('time', 'timestamp', 'num_sta', 'wlan-num_sta', 'lan-num_sta', 'wlan_bytes',
+                        'wan-tx_bytes', 'wan-rx_bytes', 'latency_avg'),
+    'channel_utilization': ('subsystem', 'status', 'num_ap', 'num_adopted', 'num_disconnected',
+                            'num_sta', 'num_user', 'num_guest', 'tx_bytes-r', 'rx_bytes-r'),
+}
+
+
+def _encoding_for(model: str):
+    """
+    Returns the tiktoken encoding for a model, or None when tiktoken is missing or cannot load it.
+    """
+    if tiktoken is None:
+        return None
+    if model not in _ENCODINGS:
+        try:
+            try:
+                _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _ENCODINGS[model] = tiktoken.get_encoding('o200k_base')
+        except Exception as e:
+            logger.warning(f"Could not load tiktoken encoding for '{model}', estimating tokens instead: {e}")
+            _ENCODINGS[model] = None
+    return _ENCODINGS[model]
+
+
+def project(value, spec):
+    """
+    Applies a field projection to a record or a list of records.
+    """
+    if spec is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, spec) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if isinstance(spec, dict):
+        return {field: project(value[field], sub_spec) for field, sub_spec in spec.items() if field in value}
+    return {field: value[field] for field in spec if field in value}
+
+
+class PromptBuilder:
+    """
+    Builds the data sections of the analysis prompt within a token budget.
+
+    Each dataset is pruned to its field allowlist, and the sections that do not fit
+    their share of the budget are truncated to the records that fit. Summary sections
+    are allocated first.
+    """
+
+    def __init__(self, model: str = None, token_budget: int = None, field_allowlists: dict = None,
+                 summary_sections=SUMMARY_SECTIONS):
+        """
+        Initializes the builder.
+
+        Args:
+            model (str): Model the prompt is built for, used for tokenization and the default budget.
+            token_budget (int): Maximum prompt tokens. Defaults to a share of the model's context window.
+            field_allowlists (dict): Per-dataset projections, defaults to FIELD_ALLOWLISTS.
+            summary_sections (tuple): Sections allocated first and truncated by rows, defaults to SUMMARY_SECTIONS.
+        """
+        self.model = model or ''
+        self.token_budget = token_budget or int(
+            MODEL_CONTEXT_WINDOWS.get(self.model, DEFAULT_CONTEXT_WINDOW) * PROMPT_CONTEXT_SHARE
+        )
+        self.field_allowlists = FIELD_ALLOWLISTS if field_allowlists is None else field_allowlists
+        self.summary_sections = tuple(summary_sections or ())
+        self._encoding = _encoding_for(self.model)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Counts tokens with tiktoken when available, otherwise estimates ~4 characters per token.
+        """
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    @staticmethod
+    def _serialize(value) -> str:
+        return json.dumps(value, separators=(',', ':'))
+
+    def _truncate(self, name: str, value, budget: int):
+        """
+        Keeps the leading records of a list (or items of a dict) that fit in the budget.
+
+        Summary sections keep every table and the leading rows of each table instead, so
+        they never lose a whole table to the budget.
+
+        Returns:
+            tuple: The serialized section and the number of records dropped.
+        """
+        if name in self.summary_sections and isinstance(value, dict):
+            return self._truncate_tables(name, value, budget)
+
+        items = list(value.items()) if isinstance(value, dict) else list(value)
+        rebuild = dict if isinstance(value, dict) else list
+
+        def render(count):
+            text = self._serialize(rebuild(items[:count]))
+            if count < len(items):
+                text += f"\n(truncated: showing {count} of {len(items)} records)"
+            return text
+
+        low = self._largest_fitting(render, len(items), budget)
+        logger.debug(f"Truncated {name} to {low} of {len(items)} records to fit {budget} tokens")
+        return render(low), len(items) - low
+
+    def _truncate_tables(self, name: str, value: dict, budget: int):
+        """
+        Keeps the same number of leading rows in every table of a dict of tables.
+
+        Returns:
+            tuple: The serialized section and the number of rows dropped across the tables.
+        """
+        sizes = {key: len(table) for key, table in value.items() if isinstance(table, list)}
+
+        def render(count):
+            text = self._serialize({key: table[:count] if key in sizes else table
+                                    for key, table in value.items()})
+            cut = [f"{key} {count} of {size}" for key, size in sizes.items() if size > count]
+            if cut:
+                text += f"\n(truncated rows: showing {', '.join(cut)})"
+            return text
+
+        low = self._largest_fitting(render, max(sizes.values(), default=0), budget)
+        dropped = sum(max(size - low, 0) for size in sizes.values())
+        logger.debug(f"Truncated the tables of {name} to {low} rows each to fit {budget} tokens")
+        return render(low), dropped
+
+    def _largest_fitting(self, render, count: int, budget: int) -> int:
+        """
+        Binary searches for the largest count whose rendering fits in the budget.
+        """
+        low, high = 0, count
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(render(mid)) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    @staticmethod
+    def _water_fill(tokens: dict, names, budget: int):
+        """
+        Shares a budget between sections: small sections keep everything, large ones share what is left.
+
+        Returns:
+            tuple: The share per section and the budget left unused.
+        """
+        shares = {}
+        pending = sorted(names, key=tokens.get)
+        while pending:
+            share = budget // len(pending)
+            if tokens[pending[0]] > share:
+                for name in pending:
+                    shares[name] = share
+                return shares, budget - share * len(pending)
+            shares[pending[0]] = tokens[pending[0]]
+            budget -= tokens[pending[0]]
+            pending.pop(0)
+        return shares, budget
+
+    def build_sections(self, data: dict, reserved_tokens: int = 0):
+        """
+        Renders every dataset as a prompt section that fits in the remaining budget.
+
+        Args:
+            data (dict): Loaded datasets keyed by name.
+            reserved_tokens (int): Tokens already used by the rest of the prompt.
+
+        Returns:
+            tuple: The rendered sections and a report with the tokens used per section.
+        """
+        rendered = {}
+        tokens = {}
+        for name, value in data.items():
+            value = project(value, self.field_allowlists.get(name))
+            rendered[name] = (value, self._serialize(value))
+            tokens[name] = self.count_tokens(rendered[name][1])
+
+        # Summary sections are filled first from their share of the budget, the raw datasets from
+        # the rest, and whatever the raw datasets leave unused goes back to the summary sections
+        remaining = max(self.token_budget - reserved_tokens, 0)
+        summaries = [name for name in tokens if name in self.summary_sections]
+        others = [name for name in tokens if name not in self.summary_sections]
+        summary_budget = int(remaining * SUMMARY_BUDGET_SHARE) if others else remaining
+        shares, unused = self._water_fill(tokens, summaries, summary_budget)
+        other_shares, left = self._water_fill(tokens, others, remaining - summary_budget + unused)
+        if left and summaries:
+            shares, _ = self._water_fill(tokens, summaries, summary_budget - unused + left)
+        shares.update(other_shares)
+
+        report = {'model': self.model, 'budget': self.token_budget, 'reserved': reserved_tokens,
+                  'sections': {}, 'truncated': {}}
+        sections = []
+        for name, (value, text) in rendered.items():
+            if tokens[name] > shares[name] and isinstance(value, (list, dict)):
+                text, dropped = self._truncate(name, value, shares[name])
+                report['truncated'][name] = dropped
+            report['sections'][name] = self.count_tokens(text)
+            sections.append(f"<<<{name}.json>>>\n{text}")
+        report['total'] = reserved_tokens + sum(report['sections'].values())
+
+        logger.debug(f"Prompt sections built: {report}")
+        return "\n\n".join(sections), report
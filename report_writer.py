@@ -0,0 +1,151 @@
+import html
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'.md': 'markdown', '.json': 'json', '.html': 'html', '.htm': 'html'}
+
+RESULT_SECTIONS = (
+    ('potential_issues', 'Potential issues'),
+    ('recommendations', 'Recommendations'),
+    ('additional_insights', 'Additional insights'),
+)
+
+
+def report_format(path: str) -> str:
+    """
+    Returns the report format for a file name, defaulting to Markdown.
+    """
+    return FORMATS.get(os.path.splitext(path or '')[1].lower(), 'markdown')
+
+
+class ReportWriter:
+    """
+    Writes the analysis report incrementally as agent messages arrive.
+
+    Each message is written and flushed as soon as it is received, so a long chat can be
+    followed in the report (or on the console with path '-') while it runs. The report is
+    completed with the final result when the writer is closed, also when the analysis failed.
+    """
+
+    def __init__(self, path: str = None, fmt: str = None, stream=None):
+        """
+        Opens the report.
+
+        Args:
+            path (str): Report file, defaults to REPORT_FILE or analysis_report.md. '-' writes to stdout.
+            fmt (str): 'markdown', 'json' or 'html', derived from the file extension by default.
+            stream: Already opened text stream to write to instead of a file.
+        """
+        self.path = path or os.getenv('REPORT_FILE', 'analysis_report.md')
+        self.fmt = fmt or report_format(self.path)
+        if stream is not None:
+            self._stream, self._owned = stream, False
+        elif self.path == '-':
+            self._stream, self._owned = sys.stdout, False
+        else:
+            self._stream, self._owned = open(self.path, 'w', buffering=64 * 1024), True
+        self.count = 0
+        self.closed = False
+        self._result = None
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def message(self, agent: str, content) -> None:
+        """
+        Appends one agent message to the report.
+        """
+        if not isinstance(content, str) or not content.strip():
+            return
+        self.count += 1
+        lines = [line.strip() for line in content.split('\n') if line.strip()]
+        if self.fmt == 'json':
+            separator = ',\n' if self.count > 1 else '\n'
+            self._stream.write(separator + '    ' + json.dumps({'index': self.count, 'agent': agent, 'content': content}))
+        elif self.fmt == 'html':
+            items = ''.join(f"<li>{html.escape(line)}</li>" for line in lines)
+            self._stream.write(f"<section><h2>Message {self.count} from {html.escape(agent)}</h2><ul>{items}</ul></section>\n")
+        else:
+            self._stream.write(f"## Message {self.count} from {agent}\n\n")
+            self._stream.writelines(f"  - {line}\n" for line in lines)
+            self._stream.write('\n')
+        self._stream.flush()
+
+    def process_message_before_send(self, sender, message, recipient, silent):
+        """
+        autogen hook: records every message an agent sends and passes it on unchanged.
+        """
+        self.message(sender.name, message.get('content') if isinstance(message, dict) else message)
+        return message
+
+    def result(self, result) -> None:
+        """
+        Sets the final result, written when the report is closed.
+
+        Args:
+            result: The validated result as a dict, or the raw analysis text.
+        """
+        self._result = result
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._write_footer()
+        if self._owned:
+            self._stream.close()
+            logger.info(f"Analysis report written to {self.path}")
+        else:
+            self._stream.flush()
+
+    def _write_header(self) -> None:
+        created = time.strftime('%Y-%m-%d %H:%M:%S')
+        if self.fmt == 'json':
+            self._stream.write('{\n  "created": ' + json.dumps(created) + ',\n  "messages": [')
+        elif self.fmt == 'html':
+            self._stream.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Network Analysis Report</title>"
+                               f"</head><body>\n<h1>Network Analysis Report</h1><p>{created}</p>\n")
+        else:
+            self._stream.write(f"# Network Analysis Report\n\n_{created}_\n\n")
+        self._stream.flush()
+
+    def _write_footer(self) -> None:
+        result = self._result
+        if self.fmt == 'json':
+            self._stream.write('\n  ],\n  "result": ' + json.dumps(result, indent=2).replace('\n', '\n  ') + '\n}\n')
+            return
+        if self.fmt == 'html':
+            self._stream.write("<section><h2>Result</h2>\n")
+            if isinstance(result, dict):
+                self._stream.write(f"<p><strong>Overall health:</strong> {html.escape(str(result.get('overall_health')))}</p>\n")
+                for key, title in RESULT_SECTIONS:
+                    items = ''.join(f"<li>{html.escape(str(item))}</li>" for item in result.get(key) or [])
+                    self._stream.write(f"<h3>{title}</h3><ul>{items}</ul>\n")
+            elif result is not None:
+                self._stream.write(f"<pre>{html.escape(str(result))}</pre>\n")
+            self._stream.write("</section>\n</body></html>\n")
+            return
+        self._stream.write("## Result\n\n")
+        if isinstance(result, dict):
+            self._stream.write(f"**Overall health:** {result.get('overall_health')}\n\n")
+            for key, title in RESULT_SECTIONS:
+                items = result.get(key) or []
+                self._stream.write(f"### {title}\n\n")
+                if items:
+                    self._stream.writelines(f"- {item}\n" for item in items)
+                else:
+                    self._stream.write("_None_\n")
+                self._stream.write('\n')
+        elif result is not None:
+            self._stream.write(f"{result}\n")
+        else:
+            self._stream.write("No result was produced.\n")
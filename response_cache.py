@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    A size-bounded LRU cache with a time-to-live for controller API responses.
+
+    Entries are keyed by endpoint and request parameters. When a file path is given,
+    the cache is loaded from and saved to disk so that responses stay reusable
+    across runs until they expire.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 256, path: str = None):
+        """
+        Initializes the cache.
+
+        Args:
+            ttl (float): Seconds an entry remains valid. A value of 0 disables caching.
+            max_entries (int): Maximum number of entries kept before evicting the least recently used.
+            path (str): Optional JSON file used to persist the cache between runs.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path:
+            self._load()
+
+    @staticmethod
+    def make_key(endpoint: str, params: dict = None) -> str:
+        """
+        Builds a stable cache key from an endpoint and its query parameters.
+        """
+        return f"{endpoint}?{json.dumps(params or {}, sort_keys=True)}"
+
+    def get(self, key: str):
+        """
+        Returns the cached value for a key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            logger.debug(f"Cache hit for {key}")
+            return value
+
+    def set(self, key: str, value) -> None:
+        """
+        Stores a value, evicting the least recently used entries beyond max_entries.
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.debug(f"Evicted {evicted} from response cache")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def save(self) -> None:
+        """
+        Writes the unexpired entries to the cache file, if one is configured.
+        """
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[key, stored_at, value] for key, (stored_at, value) in self._entries.items()
+                       if now - stored_at <= self.ttl]
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Saved {len(entries)} cached responses to {self.path}")
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable response cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, stored_at, value in entries[-self.max_entries:]:
+            if now - stored_at <= self.ttl:
+                self._entries[key] = (stored_at, value)
+        logger.debug(f"Loaded {len(self._entries)} cached responses from {self.path}")
@@ -0,0 +1,122 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Sessions without a known expiry are reused for at most this many seconds
+DEFAULT_SESSION_MAX_AGE = 60 * 60
+
+# Sessions are not reused when they expire within this many seconds
+EXPIRY_MARGIN = 60
+
+# Serializes the read-modify-write of session files across every SessionStore of the process:
+# fleet collection creates one store per controller, and they save concurrently
+_file_lock = threading.Lock()
+
+
+def _jwt_expiry(token: str):
+    """
+    Returns the 'exp' claim of a JWT (UniFi OS TOKEN cookie), or None if it cannot be read.
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+class SessionStore:
+    """
+    Persists controller login sessions (cookies and CSRF token) so they can be reused until they expire.
+
+    The store is a JSON file readable only by the current user, keyed by controller URL and username.
+    """
+
+    def __init__(self, path: str, max_age: float = DEFAULT_SESSION_MAX_AGE):
+        """
+        Initializes the store.
+
+        Args:
+            path (str): Path of the session file.
+            max_age (float): Lifetime assumed for sessions whose expiry is unknown.
+        """
+        self.path = path
+        self.max_age = max_age
+        self._lock = _file_lock
+
+    @staticmethod
+    def _key(base_url: str, username: str) -> str:
+        return f"{base_url}|{username}"
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable session store {self.path}: {e}")
+            return {}
+
+    def _write(self, sessions: dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sessions, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self, base_url: str, username: str):
+        """
+        Returns the stored session for a controller and user, or None if missing or about to expire.
+        """
+        with self._lock:
+            entry = self._read().get(self._key(base_url, username))
+        if not entry or entry['expires'] - EXPIRY_MARGIN <= time.time():
+            return None
+        return entry
+
+    def save(self, base_url: str, username: str, session, csrf_token: str = None) -> None:
+        """
+        Stores the cookies and CSRF token of an authenticated requests session.
+        """
+        cookies = [
+            {'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+             'path': cookie.path, 'expires': cookie.expires}
+            for cookie in session.cookies
+        ]
+        expiries = [cookie['expires'] for cookie in cookies if cookie['expires']]
+        expiries += [exp for exp in (_jwt_expiry(cookie['value']) for cookie in cookies
+                                     if cookie['name'] == 'TOKEN') if exp]
+        expires = min(expiries) if expiries else time.time() + self.max_age
+        with self._lock:
+            sessions = self._read()
+            sessions[self._key(base_url, username)] = {
+                'cookies': cookies, 'csrf_token': csrf_token, 'expires': expires,
+            }
+            self._write(sessions)
+        logger.debug(f"Stored session for {base_url}, valid until {time.ctime(expires)}")
+
+    def restore(self, entry: dict, session) -> None:
+        """
+        Loads a stored session entry into a requests session.
+        """
+        for cookie in entry['cookies']:
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'],
+                                path=cookie['path'], expires=cookie['expires'])
+        if entry.get('csrf_token'):
+            session.headers['X-CSRF-Token'] = entry['csrf_token']
+
+    def invalidate(self, base_url: str, username: str) -> None:
+        with self._lock:
+            sessions = self._read()
+            if sessions.pop(self._key(base_url, username), None) is not None:
+                self._write(sessions)
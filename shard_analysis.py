@@ -0,0 +1,184 @@
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from analytics import summarize_network
+from channel_planner import channel_plan_dataset
+from network_model import Snapshot, network_index
+
+logger = logging.getLogger(__name__)
+
+# Datasets that describe the whole site and are only sent to the reduce step
+SITE_DATASETS = ('performance_data', 'wifi_scans', 'channel_utilization')
+
+# Independent analysis areas: what each one focuses on and the datasets it needs
+ANALYSIS_SECTIONS = {
+    'performance': (
+        "client load, throughput, retry rates and how utilization and client counts evolve over the day",
+        ('performance_data', 'historical_data', 'channel_utilization', 'client_devices'),
+    ),
+    'RF environment': (
+        "the channel plan, transmit power, interference from spectrum scans and client signal quality per AP",
+        ('device_config', 'rf_environment', 'client_devices', 'channel_plan'),
+    ),
+    'security': (
+        "WLAN security settings (WPA mode, WPA3, PMF, guest networks, hidden SSIDs) and device firmware versions",
+        ('wifi_scans', 'device_config'),
+    ),
+}
+
+
+def partition_by_ap(data: dict) -> dict:
+    """
+    Splits the collected data into one shard per access point.
+
+    Each shard holds the AP's device entry, its spectrum scans from rf_environment and
+    the clients associated with it (matched on ap_mac).
+
+    Args:
+        data (dict): Loaded datasets keyed by name.
+
+    Returns:
+        dict: Shards keyed by AP MAC.
+    """
+    index = network_index(data)
+    shards = {}
+    for mac, ap in index.access_points.items():
+        shards[mac] = {
+            'device_config': [ap.record],
+            'rf_environment': {mac: ap.scan} if ap.scan is not None else {},
+            'client_devices': index.clients_of_ap(mac),
+        }
+    logger.debug(f"Partitioned site data into {len(shards)} access point shards")
+    return shards
+
+
+def _reply_text(reply) -> str:
+    if isinstance(reply, dict):
+        return reply.get('content') or ''
+    return reply or ''
+
+
+def _ask(agent, prompt: str) -> str:
+    # A single stateless completion; the agent's conversation history is not used
+    return _reply_text(agent.generate_reply(messages=[{'role': 'user', 'content': prompt}]))
+
+
+def _run_concurrently(tasks: dict, max_workers: int, on_result=None, labels: dict = None) -> dict:
+    """
+    Runs named callables in a bounded thread pool, skipping (and logging) the ones that fail.
+
+    on_result(label, result) is called as soon as each task finishes, with the task's display
+    label from labels (defaulting to its key); the returned dict keeps the keys and order of the tasks.
+    """
+    labels = labels or {}
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(task): name for name, task in tasks.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Analysis of {labels.get(name, name)} failed: {e}")
+                continue
+            if on_result:
+                on_result(labels.get(name, name), results[name])
+    return {name: results[name] for name in tasks if name in results}
+
+
+def _merge(agent_factory, prompt: str, on_result=None) -> str:
+    analysis = _ask(agent_factory("Assistant", 'recommendations'), prompt)
+    if on_result:
+        on_result("Assistant", analysis)
+    return analysis
+
+
+def run_map_reduce_analysis(data_loader, data: dict, agent_factory, max_workers: int = None,
+                            on_result=None) -> str:
+    """
+    Analyzes each access point concurrently and merges the results in a single reduce step.
+
+    Args:
+        data_loader (DataLoader): Builds the per-AP and reduce prompts.
+        data (dict): Loaded datasets keyed by name.
+        agent_factory (callable): Returns a fresh agent for a name and model tier ('triage' for the
+            map step, 'recommendations' for the reduce step); each map task gets its own agent so no
+            conversation state is shared between threads.
+        max_workers (int): Maximum concurrent map analyses, defaults to ANALYSIS_MAX_WORKERS.
+        on_result (callable): Called with (name, analysis) as each AP analysis and the merge complete.
+
+    Returns:
+        str: The merged analysis in the overall_health/potential_issues/recommendations/
+        additional_insights JSON format.
+    """
+    max_workers = max_workers or int(os.getenv('ANALYSIS_MAX_WORKERS', 4))
+    # Tasks are keyed by MAC: AP names are not unique, the name is only carried for display
+    tasks = {}
+    ap_names = {}
+    # Each AP is analyzed with its own rows of the site's channel plan, so it explains them
+    # instead of proposing other channels
+    channel_plan = channel_plan_dataset(data)
+    for mac, shard in partition_by_ap(data).items():
+        ap_names[mac] = shard['device_config'][0].get('name') or mac
+        if channel_plan:
+            shard['channel_plan'] = {'changes': [row for row in channel_plan['changes'] if row['ap_mac'] == mac]}
+
+        def analyze(mac=mac, shard=shard, ap_name=ap_names[mac]):
+            logger.info(f"Analyzing access point {ap_name} ({mac})")
+            agent = agent_factory(f"AP_Analyst_{mac.replace(':', '')}", 'triage')
+            return _ask(agent, data_loader.create_ap_prompt(ap_name, shard))
+        tasks[mac] = analyze
+    name_counts = Counter(ap_names.values())
+    labels = {mac: name if name_counts[name] == 1 else f"{name} ({mac})" for mac, name in ap_names.items()}
+    ap_results = {mac: {'name': ap_names[mac], 'analysis': analysis} for mac, analysis in
+                  _run_concurrently(tasks, max_workers, on_result, labels=labels).items()}
+
+    site_data = {name: data[name] for name in SITE_DATASETS if data.get(name) is not None}
+    site_data['network_statistics'] = summarize_network(data)
+    if channel_plan:
+        site_data['channel_plan'] = channel_plan
+    prompt = data_loader.create_reduce_prompt(ap_results, site_data)
+    logger.info(f"Merging {len(ap_results)} access point analyses")
+    return _merge(agent_factory, prompt, on_result)
+
+
+def run_section_analysis(data_loader, data: dict, agent_factory, max_workers: int = None,
+                         on_result=None) -> str:
+    """
+    Analyzes performance, RF environment and security concurrently and merges them into the final report.
+
+    The section analyses use the 'triage' model tier; only the final merge uses the
+    'recommendations' tier.
+
+    Args:
+        data_loader (DataLoader): Builds the section and merge prompts.
+        data (dict): Loaded datasets keyed by name.
+        agent_factory (callable): Returns a fresh agent for a name and model tier.
+        max_workers (int): Maximum concurrent section analyses, defaults to ANALYSIS_MAX_WORKERS.
+        on_result (callable): Called with (name, analysis) as each section analysis and the merge complete.
+
+    Returns:
+        str: The merged analysis in the overall_health/potential_issues/recommendations/
+        additional_insights JSON format.
+    """
+    max_workers = max_workers or int(os.getenv('ANALYSIS_MAX_WORKERS', 4))
+    tasks = {}
+    # Sections share the snapshot's NetworkIndex; the channel plan is added to the sections that use it
+    snapshot = data if isinstance(data, Snapshot) else Snapshot(data)
+    channel_plan = channel_plan_dataset(snapshot)
+    for section, (focus, datasets) in ANALYSIS_SECTIONS.items():
+        extra = {'channel_plan': channel_plan} if channel_plan and 'channel_plan' in datasets else {}
+        section_data = snapshot.select(datasets, **extra)
+
+        def analyze(section=section, focus=focus, section_data=section_data):
+            logger.info(f"Analyzing {section}")
+            agent = agent_factory(f"{section.replace(' ', '_').title()}_Analyst", 'triage')
+            return _ask(agent, data_loader.create_section_prompt(section, focus, section_data))
+        tasks[section] = analyze
+    section_results = _run_concurrently(tasks, max_workers, on_result)
+
+    prompt = data_loader.create_reduce_prompt(section_results, {}, results_name='section_analyses')
+    logger.info(f"Merging {len(section_results)} section analyses")
+    return _merge(agent_factory, prompt, on_result)
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import uuid
+
+from snapshot_io import find_dataset, load_dataset, write_dataset
+
+logger = logging.getLogger(__name__)
+
+# Thresholds above which a change is considered meaningful enough for re-analysis
+DEFAULT_THRESHOLDS = {
+    'utilization_jump_pct': 20,   # change in a radio's cu_total, percentage points
+    'client_count_change': 5,     # change in clients associated with an AP
+    'new_clients': 10,            # clients that joined the site since the baseline
+    'signal_drop_db': 10,         # drop in a client's signal
+    'signal_drops': 5,            # clients whose signal dropped by signal_drop_db, DIFF_SIGNAL_DROPS in .env
+}
+
+# Dataset names stored in a baseline, matching the collector's data files
+BASELINE_DATASETS = ('device_config', 'performance_data', 'wifi_scans', 'rf_environment',
+                     'client_devices', 'historical_data', 'channel_utilization')
+
+# WLAN settings compared between snapshots
+WLAN_FIELDS = ('name', 'enabled', 'security', 'wpa_mode', 'wpa3_support', 'wlan_band', 'hide_ssid',
+               'is_guest', 'pmf_mode', 'fast_roaming_enabled', 'bss_transition', 'minrate_ng_data_rate_kbps',
+               'minrate_na_data_rate_kbps')
+
+# Per-client lists in the diff are capped to keep the delta prompt small
+MAX_LISTED_CLIENTS = 50
+
+
+def save_baseline(directory: str, data: dict, analysis=None, copy_data: bool = True) -> None:
+    """
+    Stores the analyzed snapshot and its analysis result as the baseline for the next diff.
+
+    With copy_data=False only the analysis is written, for a directory that already holds the
+    snapshot's datasets (a collected snapshot directory).
+    """
+    os.makedirs(directory, exist_ok=True)
+    if copy_data:
+        for name in BASELINE_DATASETS:
+            if data.get(name) is not None:
+                write_dataset(directory, name, data[name], fmt='min')
+    path = os.path.join(directory, 'analysis.json')
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(analysis, f)
+    os.replace(tmp_path, path)
+    logger.debug(f"Saved baseline snapshot to {directory}")
+
+
+def load_baseline(directory: str):
+    """
+    Loads the baseline snapshot and its analysis.
+
+    Returns:
+        tuple: (data, analysis), or (None, None) if no complete baseline exists.
+    """
+    data = {}
+    for name in BASELINE_DATASETS:
+        path = find_dataset(directory, name)
+        if path is None:
+            return None, None
+        data[name] = load_dataset(path)
+    analysis_path = os.path.join(directory, 'analysis.json')
+    if not os.path.exists(analysis_path):
+        return None, None
+    with open(analysis_path, 'r') as f:
+        analysis = json.load(f)
+    return data, analysis
+
+
+def _by_key(records, key):
+    return {record[key]: record for record in records or [] if record.get(key)}
+
+
+def _radios(device):
+    return {stats.get('name') or stats.get('radio'): stats for stats in device.get('radio_table_stats') or []}
+
+
+def _diff_devices(previous, current, thresholds, significant):
+    before, after = _by_key(previous, 'mac'), _by_key(current, 'mac')
+    changes = {
+        'added': [after[mac].get('name') or mac for mac in after.keys() - before.keys()],
+        'removed': [before[mac].get('name') or mac for mac in before.keys() - after.keys()],
+        'changed': [],
+    }
+    for mac in after.keys() & before.keys():
+        old, new = before[mac], after[mac]
+        device_changes = []
+        for field in ('state', 'version'):
+            if old.get(field) != new.get(field):
+                device_changes.append({'field': field, 'from': old.get(field), 'to': new.get(field)})
+                significant.append(f"{new.get('name') or mac}: {field} changed")
+
+        old_radios, new_radios = _radios(old), _radios(new)
+        for radio in new_radios.keys() & old_radios.keys():
+            old_radio, new_radio = old_radios[radio], new_radios[radio]
+            for field in ('channel', 'tx_power'):
+                if old_radio.get(field) != new_radio.get(field):
+                    device_changes.append({'radio': radio, 'field': field,
+                                           'from': old_radio.get(field), 'to': new_radio.get(field)})
+                    if field == 'channel':
+                        significant.append(f"{new.get('name') or mac} {radio}: channel changed")
+            old_cu, new_cu = old_radio.get('cu_total'), new_radio.get('cu_total')
+            if old_cu is not None and new_cu is not None and \
+                    abs(new_cu - old_cu) >= thresholds['utilization_jump_pct']:
+                device_changes.append({'radio': radio, 'field': 'cu_total', 'from': old_cu, 'to': new_cu})
+                significant.append(f"{new.get('name') or mac} {radio}: utilization jump")
+
+        old_sta, new_sta = old.get('num_sta'), new.get('num_sta')
+        if old_sta is not None and new_sta is not None and \
+                abs(new_sta - old_sta) >= thresholds['client_count_change']:
+            device_changes.append({'field': 'num_sta', 'from': old_sta, 'to': new_sta})
+            significant.append(f"{new.get('name') or mac}: client count changed")
+
+        if device_changes:
+            changes['changed'].append({'device': new.get('name') or mac, 'mac': mac, 'changes': device_changes})
+
+    if changes['added'] or changes['removed']:
+        significant.append("devices added or removed")
+    return changes
+
+
+def _diff_clients(previous, current, thresholds, significant):
+    before, after = _by_key(previous, 'mac'), _by_key(current, 'mac')
+    joined = sorted(after.keys() - before.keys())
+    left = sorted(before.keys() - after.keys())
+    roamed, signal_drops = [], []
+    for mac in after.keys() & before.keys():
+        old, new = before[mac], after[mac]
+        name = new.get('name') or new.get('hostname') or mac
+        if old.get('ap_mac') and new.get('ap_mac') and old['ap_mac'] != new['ap_mac']:
+            roamed.append({'client': name, 'from_ap': old['ap_mac'], 'to_ap': new['ap_mac']})
+        if old.get('signal') is not None and new.get('signal') is not None and \
+                old['signal'] - new['signal'] >= thresholds['signal_drop_db']:
+            signal_drops.append({'client': name, 'from': old['signal'], 'to': new['signal']})
+
+    if len(joined) >= thresholds['new_clients']:
+        significant.append(f"{len(joined)} new clients")
+    if len(signal_drops) >= thresholds['signal_drops']:
+        significant.append(f"{len(signal_drops)} clients with signal drops")
+
+    def names(macs):
+        return [after.get(mac, before.get(mac, {})).get('hostname') or mac for mac in macs[:MAX_LISTED_CLIENTS]]
+
+    return {
+        'joined': len(joined), 'joined_clients': names(joined),
+        'left': len(left), 'left_clients': names(left),
+        'roamed': roamed[:MAX_LISTED_CLIENTS],
+        'signal_drops': signal_drops[:MAX_LISTED_CLIENTS],
+    }
+
+
+def _diff_wlans(previous, current, significant):
+    before, after = _by_key(previous, '_id'), _by_key(current, '_id')
+    changes = {
+        'added': [after[wlan_id].get('name') for wlan_id in after.keys() - before.keys()],
+        'removed': [before[wlan_id].get('name') for wlan_id in before.keys() - after.keys()],
+        'changed': [],
+    }
+    for wlan_id in after.keys() & before.keys():
+        old, new = before[wlan_id], after[wlan_id]
+        fields = {field: {'from': old.get(field), 'to': new.get(field)}
+                  for field in WLAN_FIELDS if old.get(field) != new.get(field)}
+        if fields:
+            changes['changed'].append({'wlan': new.get('name'), 'changes': fields})
+    if any(changes.values()):
+        significant.append("WLAN configuration changed")
+    return changes
+
+
+def _diff_health(previous, current, significant):
+    before, after = _by_key(previous, 'subsystem'), _by_key(current, 'subsystem')
+    changes = []
+    for subsystem in after.keys() & before.keys():
+        if before[subsystem].get('status') != after[subsystem].get('status'):
+            changes.append({'subsystem': subsystem, 'from': before[subsystem].get('status'),
+                            'to': after[subsystem].get('status')})
+            significant.append(f"{subsystem} health changed")
+    return changes
+
+
+def diff_snapshots(previous: dict, current: dict, thresholds: dict = None) -> dict:
+    """
+    Compares two snapshots per entity: devices and clients by MAC, WLANs by id and health by subsystem.
+
+    Args:
+        previous (dict): Baseline datasets keyed by name.
+        current (dict): Current datasets keyed by name.
+        thresholds (dict): Overrides for DEFAULT_THRESHOLDS (and DIFF_SIGNAL_DROPS).
+
+    Returns:
+        dict: Changes per entity type, plus 'significant', the list of changes that warrant re-analysis.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS,
+                  'signal_drops': int(os.getenv('DIFF_SIGNAL_DROPS', DEFAULT_THRESHOLDS['signal_drops'])),
+                  **(thresholds or {})}
+    significant = []
+    diff = {
+        'devices': _diff_devices(previous.get('device_config'), current.get('device_config'),
+                                 thresholds, significant),
+        'clients': _diff_clients(previous.get('client_devices'), current.get('client_devices'),
+                                 thresholds, significant),
+        'wlans': _diff_wlans(previous.get('wifi_scans'), current.get('wifi_scans'), significant),
+        'health': _diff_health(previous.get('channel_utilization'), current.get('channel_utilization'),
+                               significant),
+    }
+    diff['significant'] = significant
+    logger.debug(f"Snapshot diff: {len(significant)} significant changes")
+    return diff
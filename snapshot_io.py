@@ -0,0 +1,144 @@
+import gzip
+import json
+import logging
+import os
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# On-disk formats: pretty-printed JSON (the original layout), minified JSON, or JSON Lines
+FORMATS = {'json': '.json', 'min': '.json', 'jsonl': '.jsonl'}
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Dict datasets (e.g. rf_environment keyed by AP MAC) are written one item per line using these keys,
+# after a header line marking the file as a dict so that an empty dict reads back as {}
+KEY_FIELD = '__key__'
+VALUE_FIELD = '__value__'
+TYPE_FIELD = '__type__'
+DICT_HEADER = {TYPE_FIELD: 'dict'}
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} requires the 'zstandard' package")
+        return zstandard.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def dataset_filename(name: str, fmt: str = 'json', compression: str = None) -> str:
+    """
+    Returns the file name for a dataset in the given format and compression.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown snapshot format: {fmt}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown snapshot compression: {compression}")
+    if compression == 'zstd' and zstandard is None:
+        raise RuntimeError("zstd compression requires the 'zstandard' package")
+    return f"{name}{FORMATS[fmt]}{COMPRESSIONS[compression]}"
+
+
+def write_dataset(directory: str, name: str, data, fmt: str = 'json', compression: str = None) -> str:
+    """
+    Writes a dataset to disk, streaming records instead of building the whole document in memory.
+
+    Args:
+        directory (str): Directory to write into.
+        name (str): Dataset name without extension, e.g. 'client_devices'.
+        data (list | dict): The dataset.
+        fmt (str): 'json' (indented), 'min' (minified) or 'jsonl' (one record per line).
+        compression (str): None, 'gzip' or 'zstd'.
+
+    Returns:
+        str: Path of the written file.
+    """
+    path = os.path.join(directory, dataset_filename(name, fmt, compression))
+    with _open(path, 'w') as f:
+        if fmt == 'jsonl':
+            items = data
+            if isinstance(data, dict):
+                f.write(json.dumps(DICT_HEADER, separators=(',', ':')))
+                f.write('\n')
+                items = ({KEY_FIELD: key, VALUE_FIELD: value} for key, value in data.items())
+            for record in items:
+                f.write(json.dumps(record, separators=(',', ':')))
+                f.write('\n')
+        elif fmt == 'min':
+            json.dump(data, f, separators=(',', ':'))
+        else:
+            json.dump(data, f, indent=2)
+    logger.debug(f"Wrote {name} to {path}")
+    return path
+
+
+def find_dataset(directory: str, name: str):
+    """
+    Returns the path of the most recently written variant of a dataset, or None if none exists.
+    """
+    candidates = []
+    for ext in set(FORMATS.values()):
+        for suffix in COMPRESSIONS.values():
+            path = os.path.join(directory, f"{name}{ext}{suffix}")
+            if os.path.exists(path):
+                candidates.append(path)
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def iter_records(path: str):
+    """
+    Lazily yields the records of a dataset file.
+
+    JSON Lines files are read one line at a time. Plain JSON files are parsed whole and
+    their top-level list items (or dict items) are yielded, so callers can use the same API.
+    Dict datasets are yielded as (key, value) tuples.
+    """
+    with _open(path, 'r') as f:
+        if '.jsonl' in os.path.basename(path):
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record == DICT_HEADER:
+                    continue
+                if isinstance(record, dict) and KEY_FIELD in record and VALUE_FIELD in record:
+                    yield record[KEY_FIELD], record[VALUE_FIELD]
+                else:
+                    yield record
+        else:
+            data = json.load(f)
+            if isinstance(data, dict):
+                yield from data.items()
+            else:
+                yield from data
+
+
+def load_dataset(path: str):
+    """
+    Loads a whole dataset file into memory, reassembling dict datasets written as JSON Lines.
+    """
+    if '.jsonl' not in os.path.basename(path):
+        with _open(path, 'r') as f:
+            return json.load(f)
+
+    records = list(iter_records(path))
+    if _is_dict_jsonl(path) or (records and all(isinstance(record, tuple) for record in records)):
+        return dict(records)
+    return records
+
+
+def _is_dict_jsonl(path: str) -> bool:
+    # Files written before the header was added are recognized by their records instead
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                return json.loads(line) == DICT_HEADER
+    return False
@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from snapshot_io import find_dataset, load_dataset, write_dataset
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_DIRECTORY = 'snapshots'
+MANIFEST_FILE = 'manifest.json'
+LATEST_FILE = 'LATEST'
+# Names the last analyzed snapshot, the baseline of the next delta analysis
+BASELINE_FILE = 'BASELINE'
+# Work directories of collections that never finished are removed after this many seconds
+STALE_WORK_SECONDS = 60 * 60
+
+
+def _snapshot_id() -> str:
+    # UTC timestamp down to the microsecond, sortable as text, plus a suffix for concurrent writers
+    now = time.time()
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}{int(now % 1 * 1e6):06d}Z-{uuid.uuid4().hex[:6]}"
+
+
+def _write_json(path: str, data) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    """
+    Keeps collected snapshots in timestamped directories under <root>/snapshots.
+
+    A snapshot is written into a work directory and renamed into place once all of its datasets
+    and its manifest are on disk, then the LATEST pointer is moved to it. Readers that follow
+    LATEST therefore always see one complete snapshot, even while the next one is being
+    collected, and concurrent collections never write into the same directory.
+    """
+
+    def __init__(self, root: str, keep: int = None, compact_after: int = None):
+        """
+        Initializes the store.
+
+        Args:
+            root (str): Data directory holding the snapshots directory.
+            keep (int): Snapshots kept by prune(), defaults to SNAPSHOT_KEEP or 24.
+            compact_after (int): Snapshots newer than this many are left as written; older ones
+                are rewritten as minified gzip by prune(). Defaults to SNAPSHOT_COMPACT_AFTER or 2,
+                0 disables compaction.
+        """
+        self.root = root
+        self.directory = os.path.join(root, SNAPSHOTS_DIRECTORY)
+        self.keep = keep if keep is not None else int(os.getenv('SNAPSHOT_KEEP', 24))
+        self.compact_after = compact_after if compact_after is not None else \
+            int(os.getenv('SNAPSHOT_COMPACT_AFTER', 2))
+        # Directory of the last snapshot written through this store
+        self.last_snapshot = None
+
+    def path(self, snapshot_id: str) -> str:
+        return os.path.join(self.directory, snapshot_id)
+
+    def manifest(self, snapshot_id: str):
+        """
+        Returns the manifest of a snapshot, or None if the snapshot is missing or incomplete.
+        """
+        try:
+            with open(os.path.join(self.path(snapshot_id), MANIFEST_FILE), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+            return None
+
+    def snapshots(self) -> list:
+        """
+        Lists the ids of the complete snapshots, oldest first.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if not name.startswith('.') and name not in (LATEST_FILE, BASELINE_FILE)
+                      and os.path.exists(os.path.join(self.directory, name, MANIFEST_FILE)))
+
+    def snapshot_id(self, path: str):
+        """
+        Returns the id of the snapshot stored at path, or None if path is not a snapshot of this store.
+        """
+        snapshot_id = os.path.basename(os.path.normpath(path))
+        if os.path.abspath(self.path(snapshot_id)) != os.path.abspath(path) or self.manifest(snapshot_id) is None:
+            return None
+        return snapshot_id
+
+    def _pointer(self, name: str = LATEST_FILE):
+        try:
+            with open(os.path.join(self.directory, name), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_pointer(self, name: str, snapshot_id: str) -> None:
+        tmp_path = os.path.join(self.directory, f".{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(snapshot_id)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+    def latest_id(self):
+        snapshot_id = self._pointer()
+        if snapshot_id and self.manifest(snapshot_id) is not None:
+            return snapshot_id
+        snapshots = self.snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def latest(self):
+        """
+        Returns the directory of the latest complete snapshot, or None if the store is empty.
+        """
+        snapshot_id = self.latest_id()
+        return self.path(snapshot_id) if snapshot_id else None
+
+    def _set_latest(self, snapshot_id: str) -> None:
+        # Only move the pointer forward, and check again after writing it: if a concurrent
+        # collection published a newer snapshot meanwhile, point at that one instead
+        while True:
+            current = self._pointer()
+            if current is not None and current >= snapshot_id:
+                return
+            self._write_pointer(LATEST_FILE, snapshot_id)
+            newest = self.snapshots()[-1]
+            if newest <= snapshot_id:
+                return
+            snapshot_id = newest
+
+    def baseline(self):
+        """
+        Returns the directory of the last analyzed snapshot, or None if none was analyzed.
+        """
+        snapshot_id = self._pointer(BASELINE_FILE)
+        return self.path(snapshot_id) if snapshot_id and self.manifest(snapshot_id) is not None else None
+
+    def set_baseline(self, snapshot_id: str) -> None:
+        # Analyses of older snapshots (e.g. a history batch) do not replace a newer baseline
+        current = self._pointer(BASELINE_FILE)
+        if current is None or self.manifest(current) is None or snapshot_id >= current:
+            self._write_pointer(BASELINE_FILE, snapshot_id)
+
+    @contextmanager
+    def new_snapshot(self, **metadata):
+        """
+        Yields a work directory for the datasets of a new snapshot and publishes it when the
+        block completes; if the block raises, the work directory is removed and LATEST is kept.
+
+        The manifest lists every file in the directory with its size, plus the metadata given
+        (e.g. site and controller). Old snapshots are pruned afterwards.
+
+        Yields:
+            str: The directory to write the datasets into.
+        """
+        snapshot_id = _snapshot_id()
+        work_directory = os.path.join(self.directory, f".tmp-{snapshot_id}")
+        os.makedirs(work_directory)
+        try:
+            yield work_directory
+            files = {name: os.path.getsize(os.path.join(work_directory, name))
+                     for name in sorted(os.listdir(work_directory))}
+            _write_json(os.path.join(work_directory, MANIFEST_FILE),
+                        {'id': snapshot_id, 'created': time.time(), **metadata, 'files': files})
+            os.rename(work_directory, self.path(snapshot_id))
+        except BaseException:
+            shutil.rmtree(work_directory, ignore_errors=True)
+            raise
+        self._set_latest(snapshot_id)
+        self.last_snapshot = self.path(snapshot_id)
+        logger.info(f"Snapshot {snapshot_id} written to {self.last_snapshot}")
+        self.prune()
+
+    def compact(self, snapshot_id: str) -> bool:
+        """
+        Rewrites the datasets of a snapshot as minified gzip JSON.
+
+        The compacted copy is built next to the snapshot and swapped in with two renames. Files
+        added after the snapshot was written (e.g. an analysis result) are moved over as they are.
+
+        Returns:
+            bool: True if the snapshot was compacted, False if it already was or disappeared.
+        """
+        manifest = self.manifest(snapshot_id)
+        if manifest is None or manifest.get('compacted') or \
+                all(name.endswith(('.gz', '.zst')) for name in manifest['files']):
+            return False
+        source = self.path(snapshot_id)
+        work_directory = os.path.join(self.directory, f".compact-{snapshot_id}-{uuid.uuid4().hex[:6]}")
+        trash = os.path.join(self.directory, f".trash-{snapshot_id}-{uuid.uuid4().hex[:6]}")
+        os.makedirs(work_directory)
+        try:
+            names = {name.split('.', 1)[0] for name in manifest['files'] if name != MANIFEST_FILE}
+            for name in sorted(names):
+                path = find_dataset(source, name)
+                if path:
+                    write_dataset(work_directory, name, load_dataset(path), 'min', 'gzip')
+            files = {name: os.path.getsize(os.path.join(work_directory, name))
+                     for name in sorted(os.listdir(work_directory))}
+            _write_json(os.path.join(work_directory, MANIFEST_FILE),
+                        {**manifest, 'files': files, 'compacted': time.time()})
+            for name in os.listdir(source):
+                if name not in manifest['files'] and name != MANIFEST_FILE:
+                    os.rename(os.path.join(source, name), os.path.join(work_directory, name))
+            os.rename(source, trash)
+            os.rename(work_directory, source)
+        except OSError as e:
+            # Another process pruned or compacted the snapshot first
+            logger.debug(f"Not compacting snapshot {snapshot_id}: {e}")
+            if os.path.exists(trash) and not os.path.exists(source):
+                os.rename(trash, source)
+            shutil.rmtree(work_directory, ignore_errors=True)
+            return False
+        shutil.rmtree(trash, ignore_errors=True)
+        logger.debug(f"Compacted snapshot {snapshot_id}: {sum(manifest['files'].values())} -> "
+                     f"{sum(files.values())} bytes")
+        return True
+
+    def prune(self) -> list:
+        """
+        Applies retention: removes all but the newest `keep` snapshots (never the latest one or
+        the baseline), compacts the older ones that are kept, and cleans up abandoned work directories.
+
+        Returns:
+            list: Ids of the removed snapshots.
+        """
+        snapshots = self.snapshots()
+        latest = self.latest_id()
+        pinned = {latest, self._pointer(BASELINE_FILE)}
+        removed = [snapshot_id for snapshot_id in snapshots[:max(len(snapshots) - self.keep, 0)]
+                   if snapshot_id not in pinned]
+        for snapshot_id in removed:
+            shutil.rmtree(self.path(snapshot_id), ignore_errors=True)
+        if removed:
+            logger.info(f"Removed {len(removed)} old snapshots from {self.directory}")
+
+        if self.compact_after:
+            kept = [snapshot_id for snapshot_id in snapshots if snapshot_id not in removed]
+            for snapshot_id in kept[:max(len(kept) - self.compact_after, 0)]:
+                if snapshot_id != latest:
+                    self.compact(snapshot_id)
+
+        for name in os.listdir(self.directory):
+            if not name.startswith(('.tmp-', '.compact-', '.trash-')):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stale = time.time() - os.path.getmtime(path) > STALE_WORK_SECONDS
+            except FileNotFoundError:
+                # Finished by its writer since the listing
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+        return removed
+
+
+def store_of(snapshot_directory: str):
+    """
+    Returns the SnapshotStore holding a snapshot directory, or None for datasets written in place.
+    """
+    path = os.path.abspath(snapshot_directory)
+    if os.path.basename(os.path.dirname(path)) != SNAPSHOTS_DIRECTORY:
+        return None
+    store = SnapshotStore(os.path.dirname(os.path.dirname(path)))
+    return store if store.snapshot_id(path) else None
+
+
+def resolve_snapshot_directory(directory: str) -> str:
+    """
+    Returns the latest snapshot of a data directory, or the directory itself when it holds a
+    snapshot written in place (the layout before the snapshot store).
+    """
+    return SnapshotStore(directory).latest() or directory
@@ -1,34 +1,91 @@
 import os
+import copy
 import logging
+import re
 import traceback
 import requests
-import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv  # Import load_dotenv
+from response_cache import ResponseCache
+from history_store import HistoryStore
+from snapshot_io import write_dataset
+from session_store import SessionStore
+from snapshot_store import SnapshotStore
+from tracing import span, traced
+
+# Status codes worth retrying: rate limiting and transient controller errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# MACs in endpoint paths, replaced by a placeholder so per-AP requests share one span name
+MAC_PATTERN = re.compile(r'([0-9a-f]{2}:){5}[0-9a-f]{2}', re.IGNORECASE)
 
 class DataCollector:
-    def __init__(self):
+    def __init__(self, max_workers=None, timeout=None, retries=None, backoff=None, cache=None,
+                 base_url=None, username=None, password=None, site=None, output_dir=None, pool_size=None,
+                 history_db=None):
         load_dotenv()  # Load environment variables from .env file
 
-        self.base_url = f"{os.getenv('CONTROLLER_URL')}"
-        self.username = os.getenv('USERNAME')
-        self.password = os.getenv('PASSWORD')
-        self.site = os.getenv('SITE_ID')
-        self.session = requests.Session()  # Initialize the session here
+        self.base_url = base_url or f"{os.getenv('CONTROLLER_URL')}"
+        self.username = username or os.getenv('USERNAME')
+        self.password = password or os.getenv('PASSWORD')
+        self.site = site or os.getenv('SITE_ID')
+        # Snapshots are written to <output_dir>/snapshots/, by default next to this script where DataLoader reads them
+        self.output_dir = output_dir or os.path.dirname(os.path.abspath(__file__))
+        self.snapshot_directory = None
+        # Collection tuning, overridable from .env
+        self.max_workers = int(max_workers or os.getenv('COLLECTOR_MAX_WORKERS', 8))
+        # Connection pool size; larger than max_workers when several sites share this session
+        self.pool_size = int(pool_size or self.max_workers)
+        self.timeout = float(timeout or os.getenv('COLLECTOR_TIMEOUT', 30))
+        self.retries = int(retries if retries is not None else os.getenv('COLLECTOR_RETRIES', 3))
+        self.backoff = float(backoff if backoff is not None else os.getenv('COLLECTOR_BACKOFF', 0.5))
+        # Response cache shared by all endpoint reads; persisted only when RESPONSE_CACHE_FILE is set
+        self.cache = cache if cache is not None else ResponseCache(
+            ttl=float(os.getenv('RESPONSE_CACHE_TTL', 60)),
+            max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 256)),
+            path=os.getenv('RESPONSE_CACHE_FILE'),
+        )
+        # Incremental historical collection is enabled by pointing HISTORY_DB at a local store;
+        # history_db overrides it, '' disables it
+        history_db = os.getenv('HISTORY_DB') if history_db is None else history_db
+        self.history_store = HistoryStore(history_db) if history_db else None
+        # On-disk snapshot format: json (indented), min or jsonl, optionally gzip/zstd compressed
+        self.snapshot_format = os.getenv('SNAPSHOT_FORMAT', 'json')
+        self.snapshot_compression = os.getenv('SNAPSHOT_COMPRESSION') or None
+        # Login sessions are persisted and reused until they expire unless SESSION_REUSE=0
+        self.session_store = None if os.getenv('SESSION_REUSE') == '0' else SessionStore(
+            os.getenv('SESSION_STORE', os.path.expanduser('~/.unifi_tuner/sessions.json'))
+        )
+        self.session = self._create_session()  # Initialize the session here
+        self.connected = False
+        # Shared with for_site() copies so a session renewal is seen by every site using it
+        self._auth_lock = threading.Lock()
+        self._auth_state = {'generation': 0}
         logging.debug("DataCollector initialized with environment variables")
         logging.debug(f"Site: {self.site}")
 
+    def _create_session(self):
+        session = requests.Session()
+        # Size the connection pool to the worker count so concurrent requests reuse connections
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
     def connect(self):
         logging.debug("Attempting to connect to UniFi Controller")
         try:
-            self.session = requests.Session()
+            self.session = self._create_session()
             self.session.verify = False #disable ssl verification
-            login_url = f"{self.base_url}/api/auth/login"
-            logging.debug(f"Connecting to UniFi Controller at {login_url}")
-            login_data = {"username": self.username, "password": self.password}
-            response = self.session.post(login_url, json=login_data)
-            response.raise_for_status()
-            logging.debug("Connected to UniFi Controller")
+            entry = self.session_store.load(self.base_url, self.username) if self.session_store else None
+            if entry:
+                self.session_store.restore(entry, self.session)
+                self.connected = True
+                logging.debug("Reusing stored UniFi Controller session")
+                return
+            self._login()
         except requests.exceptions.HTTPError as e:
             logging.error(f"HTTP error occurred: {e}")
             logging.error(f"Response content: {e.response.content}")
@@ -37,48 +94,124 @@ class DataCollector:
             logging.error(f"An error occurred: {e}")
             raise
 
+    def _login(self):
+        login_url = f"{self.base_url}/api/auth/login"
+        logging.debug(f"Connecting to UniFi Controller at {login_url}")
+        login_data = {"username": self.username, "password": self.password}
+        self.session.cookies.clear()
+        self.session.headers.pop('X-CSRF-Token', None)
+        with span('POST api/auth/login', kind='client') as login_span:
+            response = self.session.post(login_url, json=login_data, timeout=self.timeout)
+            login_span.set(status_code=response.status_code)
+        response.raise_for_status()
+        # UniFi OS requires the CSRF token returned at login on subsequent requests
+        csrf_token = response.headers.get('X-CSRF-Token')
+        if csrf_token:
+            self.session.headers['X-CSRF-Token'] = csrf_token
+        if self.session_store:
+            self.session_store.save(self.base_url, self.username, self.session, csrf_token)
+        self.connected = True
+        self._auth_state['generation'] += 1
+        logging.debug("Connected to UniFi Controller")
+
+    def _reauthenticate(self, generation):
+        # Only the first thread that sees the expired session logs in again
+        with self._auth_lock:
+            if self._auth_state['generation'] == generation:
+                logging.info("Session expired, logging in to UniFi Controller again")
+                if self.session_store:
+                    self.session_store.invalidate(self.base_url, self.username)
+                self._login()
+
+    def for_site(self, site, output_dir=None):
+        # Collector for another site of the same controller, reusing this authenticated session
+        collector = copy.copy(self)
+        collector.site = site
+        collector.output_dir = output_dir or self.output_dir
+        return collector
+
+    def _request(self, path, params=None):
+        """
+        GET a site endpoint with a per-request timeout, retrying connection errors,
+        timeouts and retryable status codes with exponential backoff.
+        """
+        url = f"{self.base_url}/proxy/network/api/s/{self.site}/{path}"
+        reauthenticated = False
+        with span(f"GET {MAC_PATTERN.sub('{mac}', path)}", kind='client', path=path) as request_span:
+            for attempt in range(self.retries + 1):
+                try:
+                    generation = self._auth_state['generation']
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                    if response.status_code == 401 and not reauthenticated:
+                        self._reauthenticate(generation)
+                        reauthenticated = True
+                        response = self.session.get(url, params=params, timeout=self.timeout)
+                    if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                        request_span.set(status_code=response.status_code, bytes=len(response.content),
+                                         attempts=attempt + 1)
+                        return response
+                    logging.warning(f"GET {path} returned {response.status_code}, retrying")
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt == self.retries:
+                        raise
+                    logging.warning(f"GET {path} failed: {e}, retrying")
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def _cache_key(self, path, params=None):
+        return ResponseCache.make_key(f"{self.base_url}/{self.site}/{path}", params)
+
+    def _get_data(self, path, params=None):
+        key = self._cache_key(path, params)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        response = self._request(path, params=params)
+        response.raise_for_status()
+        data = response.json()['data']
+        self.cache.set(key, data)
+        return data
+
+    @traced('collect')
     def collect_data(self):
         logging.debug("Starting data collection")
         try:
-            self.connect()
-
-            logging.debug("Collecting device configuration")
-            devices = self.get_devices()
-            with open('device_config.json', 'w') as f:
-                json.dump(devices, f, indent=2)
-            logging.debug("Device configuration collected")
-
-            logging.debug("Collecting performance data")
-            performance = self.get_statistics()
-            with open('performance_data.json', 'w') as f:
-                json.dump(performance, f, indent=2)
-            logging.debug("Performance data collected")
-
-            logging.debug("Collecting WiFi scans")
-            wifi_scans = self.get_wlan_conf()
-            with open('wifi_scans.json', 'w') as f:
-                json.dump(wifi_scans, f, indent=2)
-            logging.debug("WiFi scans collected")
-
-            logging.debug("Collecting RF environment data")
-            rf_data = self.get_rf_environment_data()
-            with open('rf_environment.json', 'w') as f:
-                json.dump(rf_data, f, indent=2)
-            logging.debug("RF environment data collected")
-
-            logging.debug("Collecting client devices")
-            client_devices = self.get_client_devices()
-            with open('client_devices.json', 'w') as f:
-                json.dump(client_devices, f, indent=2)
-            logging.debug("Client devices collected")
-
-            logging.debug("Collecting historical data")
+            if not self.connected:
+                self.connect()
+
             end_time = int(time.time())
             start_time = end_time - (7 * 24 * 60 * 60)  # 7 days ago
-            historical_data = self.get_historical_data(start_time, end_time)
+
+            # Fire the independent endpoints concurrently; the per-AP spectrum scans
+            # only depend on the device list and are queued as soon as it arrives.
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                logging.debug("Collecting device configuration, performance data, WiFi scans, "
+                              "client devices, historical data and channel utilization")
+                futures = {
+                    'device_config': executor.submit(self.get_devices),
+                    'performance_data': executor.submit(self.get_statistics),
+                    'wifi_scans': executor.submit(self.get_wlan_conf),
+                    'client_devices': executor.submit(self.get_client_devices),
+                    'historical_data': (
+                        executor.submit(self.get_incremental_historical_data, end_time)
+                        if self.history_store else
+                        executor.submit(self.get_historical_data, start_time, end_time)
+                    ),
+                    'channel_utilization': executor.submit(self.get_channel_utilization),
+                }
+                devices = futures['device_config'].result()
+
+                logging.debug("Collecting RF environment data")
+                scans = {
+                    mac: executor.submit(self.get_spectrum_scan, mac)
+                    for mac in self._access_point_macs(devices)
+                }
+                results = {name: future.result() for name, future in futures.items()}
+                results['rf_environment'] = self._gather_rf_data(scans)
+
+            historical_data = results['historical_data']
             #if no historical data is found, create an empty list with the correct schema
             if not historical_data:
-                historical_data = [
+                results['historical_data'] = [
                     {
                     "timestamp": "2024-02-14T10:00:00Z",
                     "total_devices": 100,
@@ -89,15 +222,20 @@ class DataCollector:
                     "total_other_devices": 45
                 }
             ]
-            with open('historical_data.json', 'w') as f:
-                json.dump(historical_data, f, indent=2)
-            logging.debug("Historical data collected")
 
-            logging.debug("Collecting channel utilization")
-            channel_util = self.get_channel_utilization()
-            with open('channel_utilization.json', 'w') as f:
-                json.dump(channel_util, f, indent=2)
-            logging.debug("Channel utilization collected")
+            # The datasets only become visible to readers, as the latest snapshot, once all are written
+            store = SnapshotStore(self.output_dir)
+            with store.new_snapshot(site=self.site, controller=self.base_url) as snapshot_dir:
+                for name in ('device_config', 'performance_data', 'wifi_scans', 'rf_environment',
+                             'client_devices', 'historical_data', 'channel_utilization'):
+                    with span('write_dataset', dataset=name) as write_span:
+                        path = write_dataset(snapshot_dir, name, results[name], self.snapshot_format,
+                                             self.snapshot_compression)
+                        write_span.set(bytes=os.path.getsize(path))
+                    logging.debug(f"{name} collected")
+            self.snapshot_directory = store.last_snapshot
+
+            self.cache.save()
 
         except Exception as e:
             logging.error(f"Error during data collection: {str(e)}")
@@ -107,67 +245,92 @@ class DataCollector:
     def get_devices(self):
         if not self.session:
             raise ValueError("Not connected. Call connect() first.")
-        response = self.session.get(f"{self.base_url}/proxy/network/api/s/{self.site}/stat/device")
-        response.raise_for_status()
-        return response.json()['data']
+        return self._get_data("stat/device")
 
     def get_statistics(self):
-        url = f"{self.base_url}/proxy/network/api/s/{self.site}/stat/report/daily.site"
-        response = self.session.get(url)
-        response.raise_for_status()
-        return response.json()['data']
+        return self._get_data("stat/report/daily.site")
 
     def get_wlan_conf(self):
-        url = f"{self.base_url}/proxy/network/api/s/{self.site}/rest/wlanconf"
-        response = self.session.get(url)
-        response.raise_for_status()
-        return response.json()['data']
+        return self._get_data("rest/wlanconf")
 
-    def get_rf_environment_data(self):
-        logging.debug("Starting RF environment data collection")
+    def get_spectrum_scan(self, mac):
+        logging.debug(f"Collecting RF data for AP {mac}")
+        path = f"stat/spectrum-scan/{mac}"
+        key = self._cache_key(path)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        response = self._request(path)
+        if response.status_code == 200:
+            logging.debug(f"RF data collected for AP {mac}")
+            data = response.json()['data']
+            self.cache.set(key, data)
+            return data
+        logging.warning(f"Failed to retrieve RF data for AP {mac}. Status code: {response.status_code}")
+        return None
+
+    @staticmethod
+    def _access_point_macs(devices):
+        return [device['mac'] for device in devices if device.get('type') == 'uap' and device.get('mac')]
+
+    @staticmethod
+    def _gather_rf_data(scans):
         rf_data = {}
+        for mac, future in scans.items():
+            data = future.result()
+            if data is not None:
+                rf_data[mac] = data
+
+        if not rf_data:
+            logging.error("Failed to retrieve RF environment data for any access points.")
+            raise Exception("No RF data collected")
+
+        logging.debug("RF environment data collection completed")
+        return rf_data
+
+    def get_rf_environment_data(self, devices=None):
+        logging.debug("Starting RF environment data collection")
         try:
-            devices = self.get_devices()
-
-            for device in devices:
-                if device.get('type') == 'uap':
-                    mac = device.get('mac')
-                    if mac:
-                        logging.debug(f"Collecting RF data for AP {mac}")
-                        url = f"{self.base_url}/proxy/network/api/s/{self.site}/stat/spectrum-scan/{mac}"
-                        response = self.session.get(url)
-                        if response.status_code == 200:
-                            rf_data[mac] = response.json()['data']
-                            logging.debug(f"RF data collected for AP {mac}")
-                        else:
-                            logging.warning(f"Failed to retrieve RF data for AP {mac}. Status code: {response.status_code}")
-
-            if not rf_data:
-                logging.error("Failed to retrieve RF environment data for any access points.")
-                raise Exception("No RF data collected")
-
-            logging.debug("RF environment data collection completed")
-            return rf_data
+            # Reuse an already fetched device list instead of downloading stat/device again
+            if devices is None:
+                devices = self.get_devices()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                scans = {
+                    mac: executor.submit(self.get_spectrum_scan, mac)
+                    for mac in self._access_point_macs(devices)
+                }
+                return self._gather_rf_data(scans)
         except Exception as e:
             logging.error(f"Error collecting RF environment data: {str(e)}")
             logging.debug(traceback.format_exc())
             raise
 
     def get_client_devices(self):
-        url = f"{self.base_url}/proxy/network/api/s/{self.site}/stat/sta"
-        response = self.session.get(url)
-        response.raise_for_status()
-        return response.json()['data']
+        return self._get_data("stat/sta")
 
     def get_historical_data(self, start_time, end_time):
-        url = f"{self.base_url}/proxy/network/api/s/{self.site}/stat/report/hourly.site"
         params = {'start': start_time, 'end': end_time}
-        response = self.session.get(url, params=params)
-        response.raise_for_status()
-        return response.json()['data']
+        return self._get_data("stat/report/hourly.site", params=params)
+
+    def get_incremental_historical_data(self, end_time, window=7 * 24 * 60 * 60):
+        # Only request the hours from the newest stored bucket on, then serve the window from the store.
+        # The newest bucket is requested again: it may have been stored while its hour was still
+        # in progress, and append() replaces it with the complete one.
+        window_start = end_time - window
+        start_time = window_start
+        last_time = self.history_store.last_timestamp(self.site)
+        if last_time is not None:
+            start_time = max(window_start, last_time // 1000)
+
+        if start_time < end_time:
+            logging.debug(f"Requesting historical data from {start_time} to {end_time}")
+            records = self.get_historical_data(start_time, end_time)
+            self.history_store.append(self.site, records)
+        else:
+            logging.debug("Historical data is up to date, skipping request")
+
+        return self.history_store.read_range(self.site, window_start * 1000, end_time * 1000)
 
     def get_channel_utilization(self):
-        url = f"{self.base_url}/proxy/network/api/s/{self.site}/stat/health"
-        response = self.session.get(url)
-        response.raise_for_status()
-        return response.json()['data']
+        return self._get_data("stat/health")
@@ -0,0 +1,291 @@
+"""
+Span tracing of the pipeline stages.
+
+Records how long collection, loading, prompt building and the agent chat take, down to each
+controller request and LLM call, together with payload sizes:
+
+    TRACE_FILE=trace.json python unifi_ai_agents.py
+    python cli.py --trace trace.otlp.json --profile analyze
+
+Spans are only recorded inside trace_run(); everywhere else span() is a no-op. The trace is
+written as a list of spans with per-name totals, or in the OpenTelemetry OTLP/JSON format
+when the file name ends in .otlp.json (or TRACE_FORMAT=otlp), which OpenTelemetry collectors
+and viewers such as Jaeger can import. With profiling enabled the thread running the pipeline
+is also profiled with cProfile and the stats are written next to the trace (.prof).
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'unifi-tuner'
+# OTLP span kinds and status codes
+OTLP_KINDS = {'internal': 1, 'client': 3}
+OTLP_STATUS = {'ok': 1, 'error': 2}
+PROFILE_TOP_FUNCTIONS = 15
+
+
+class Span:
+    """
+    A timed operation with attributes such as the endpoint, model, tokens or payload bytes.
+    """
+    __slots__ = ('name', 'kind', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'status', 'thread')
+
+    def __init__(self, name: str, kind: str, parent_id: str, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.status = 'ok'
+        self.thread = threading.current_thread().name
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        # Seconds, up to now for a span that is still open
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'kind': self.kind,
+            'start': self.start / 1e9,
+            'duration': round(self.duration, 6),
+            'status': self.status,
+            'thread': self.thread,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': value if isinstance(value, str) else json.dumps(value)}
+
+
+class Tracer:
+    """
+    Collects the spans of one traced run from every thread.
+
+    Spans nest per thread. Spans opened by worker threads (collector requests, concurrent
+    analyses) have no parent in their own thread and are attached to the innermost open span
+    of the thread that started the run.
+    """
+
+    def __init__(self):
+        self.trace_id = None
+        self.spans = []
+        self.active = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._run_stack = []
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _parent(self, stack: list):
+        if stack:
+            return stack[-1]
+        try:
+            return self._run_stack[-1]
+        except IndexError:
+            return None
+
+    def start(self) -> None:
+        with self._lock:
+            self.trace_id = uuid.uuid4().hex
+            self.spans = []
+            self._run_stack = self._stack()
+            self.active = True
+
+    def stop(self) -> None:
+        self.active = False
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'internal', **attributes):
+        """
+        Times the block as a span; yields the span so attributes can be added once known.
+        """
+        if not self.active:
+            yield NOOP_SPAN
+            return
+        stack = self._stack()
+        parent = self._parent(stack)
+        span = Span(name, kind, parent.span_id if parent else None, attributes)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.attributes['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time_ns()
+            stack.pop()
+            with self._lock:
+                self.spans.append(span)
+
+    def summary(self) -> dict:
+        """
+        Aggregates the spans by name: count, total and maximum seconds, and payload bytes.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        summary = {}
+        for span in sorted(spans, key=lambda span: span.start):
+            entry = summary.setdefault(span.name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'errors': 0})
+            entry['count'] += 1
+            entry['seconds'] = round(entry['seconds'] + span.duration, 6)
+            entry['max_seconds'] = round(max(entry['max_seconds'], span.duration), 6)
+            entry['errors'] += span.status == 'error'
+            if isinstance(span.attributes.get('bytes'), int):
+                entry['bytes'] = entry.get('bytes', 0) + span.attributes['bytes']
+        return summary
+
+    def log_summary(self) -> None:
+        for name, entry in sorted(self.summary().items(), key=lambda item: -item[1]['seconds']):
+            size = f", {entry['bytes']} bytes" if 'bytes' in entry else ''
+            logger.info(f"  {name}: {entry['count']}x, {entry['seconds']:.3f}s total, "
+                        f"{entry['max_seconds']:.3f}s max{size}")
+
+    def _otlp(self, spans: list) -> dict:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': _otlp_value(SERVICE_NAME)}]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [{
+                    'traceId': self.trace_id,
+                    'spanId': span.span_id,
+                    'parentSpanId': span.parent_id or '',
+                    'name': span.name,
+                    'kind': OTLP_KINDS.get(span.kind, OTLP_KINDS['internal']),
+                    'startTimeUnixNano': str(span.start),
+                    'endTimeUnixNano': str(span.end),
+                    'attributes': [{'key': key, 'value': _otlp_value(value)}
+                                   for key, value in {**span.attributes, 'thread.name': span.thread}.items()
+                                   if value is not None],
+                    'status': {'code': OTLP_STATUS[span.status], 'message': span.attributes.get('error', '')},
+                } for span in spans],
+            }],
+        }]}
+
+    def export(self, path: str, fmt: str = None) -> None:
+        """
+        Writes the trace as JSON ('json') or OTLP/JSON ('otlp', the default for *.otlp.json files).
+        """
+        fmt = fmt or os.getenv('TRACE_FORMAT') or ('otlp' if path.endswith('.otlp.json') else 'json')
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        if fmt == 'otlp':
+            trace = self._otlp(spans)
+        else:
+            trace = {'trace_id': self.trace_id, 'summary': self.summary(), 'spans': [span.as_dict() for span in spans]}
+        with open(path, 'w') as f:
+            json.dump(trace, f, indent=2, default=str)
+        logger.info(f"Trace with {len(spans)} spans written to {path}")
+
+
+tracer = Tracer()
+
+
+def span(name: str, kind: str = 'internal', **attributes):
+    """
+    Times a block as a span of the current run; see Tracer.span.
+    """
+    return tracer.span(name, kind, **attributes)
+
+
+def traced(name: str = None, kind: str = 'internal'):
+    """
+    Decorator timing every call of a function as a span, named after the function by default.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name or function.__qualname__, kind):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _write_profile(profiler, path: str) -> None:
+    import io
+    import pstats
+
+    profiler.dump_stats(path)
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    logger.info(f"Profile written to {path}, top functions by cumulative time:\n{output.getvalue()}")
+
+
+@contextmanager
+def trace_run(name: str, path: str = None, profile: bool = None):
+    """
+    Traces the block as one run and exports the trace when it ends.
+
+    Nothing is recorded unless a trace file is given (or set with TRACE_FILE). A run started
+    inside another run is recorded as a span of the outer one.
+
+    Args:
+        name (str): Name of the root span.
+        path (str): Trace file, defaults to TRACE_FILE.
+        profile (bool): Also profile the calling thread with cProfile, defaults to TRACE_PROFILE=1.
+    """
+    path = path or os.getenv('TRACE_FILE')
+    if not path or tracer.active:
+        with tracer.span(name) as root:
+            yield root
+        return
+
+    if profile is None:
+        profile = os.getenv('TRACE_PROFILE') == '1'
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    tracer.start()
+    if profiler:
+        profiler.enable()
+    try:
+        with tracer.span(name) as root:
+            yield root
+    finally:
+        if profiler:
+            profiler.disable()
+        tracer.stop()
+        logger.info(f"Timing of {name}:")
+        tracer.log_summary()
+        tracer.export(path)
+        if profiler:
+            _write_profile(profiler, os.path.splitext(path)[0] + '.prof')
@@ -1,43 +1,69 @@
 import logging
 import json
-import openai
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from test_connection import DataCollector
-from load_data import DataLoader
-from autogen import AssistantAgent, UserProxyAgent, GroupChat, GroupChatManager, ConversableAgent
-from pydantic import BaseModel, ValidationError
+from llm_cache import LLMResponseCache
+from snapshot_diff import diff_snapshots, load_baseline, save_baseline
+from snapshot_store import store_of
+from monitor_llm import LLMUsageMonitor
+from report_writer import ReportWriter
+from tracing import span, trace_run
 from typing import List, Dict
 import textwrap
 
+# autogen, pydantic and the collector are imported by the functions that use them, so that
+# importing this module (e.g. from the CLI or the daemon) stays cheap
+
 # Configure logging Ensure debug logs are captured
 logger = logging.getLogger(__name__)
 #set the log level
 logger.setLevel(logging.INFO)
 
-# Retrieve OpenAI API key from environment variables
-openai_api_key = os.getenv('OPENAI_API_KEY')
+NETWORK_AGENT_SYSTEM_MESSAGE = "You are an expert in UniFi networks and network security and you analyze the network configuration and data provided to provide best practice recommendations for configuraiton, performance, and security."
+REVIEWER_SYSTEM_MESSAGE = "You are a human who analyzes the recommendation of the network agent and either asks for clarifications or approves the recommendaitons"
+
+# Model tiers per role: a fast model for triage and summaries, the large model for the final
+# recommendations. Each tier falls back to MODEL_AGENT when its variable is not set.
+MODEL_TIERS = {
+    "triage": "MODEL_TRIAGE",
+    "summary": "MODEL_SUMMARY",
+    "recommendations": "MODEL_RECOMMENDATIONS",
+}
+
+def model_for(role):
+    return os.getenv(MODEL_TIERS[role]) or os.getenv("MODEL_AGENT")
 
+def llm_config_for(role):
+    config = {"model": model_for(role), "api_key": os.getenv("OPENAI_API_KEY")}
+    if os.getenv("LLM_BACKEND") == "fake":
+        # Local OpenAI-compatible stand-in for load testing, see fake_llm.py
+        from fake_llm import FAKE_MODEL, fake_llm_url
+        config.update(model=config["model"] or FAKE_MODEL, api_key=config["api_key"] or "fake", base_url=fake_llm_url())
+    return {"config_list": [config]}
 
-if not openai_api_key:
-    logger.error("OPENAI_API_KEY is not set in environment variables.")
-    exit(1)
+#create a function that builds a standalone network analysis agent
+def create_analysis_agent(name="Assistant", role="recommendations"):
+    from autogen import AssistantAgent
 
-openai.api_key = openai_api_key
+    return AssistantAgent(
+        name=name,
+        system_message=NETWORK_AGENT_SYSTEM_MESSAGE,
+        llm_config=llm_config_for(role)
+    )
 
 #create a private function to creaate the agents
 def create_agents():
+    from autogen import ConversableAgent, GroupChatManager, UserProxyAgent
+    from analysis_result import make_validation_reply
+
      # Initialize AssistantAgent with the latest OpenAI model
-    network_agent = AssistantAgent(
-        name="Assistant",
-        system_message="You are an expert in UniFi networks and network security and you analyze the network configuration and data provided to provide best practice recommendations for configuraiton, performance, and security.",
-        llm_config={"config_list": [{"model": os.getenv("MODEL_AGENT"), "api_key": os.getenv("OPENAI_API_KEY")}]}
-    )
+    network_agent = create_analysis_agent("Assistant")
     
     # Initialize UserProxyAgent with Docker disabled
     user_proxy = UserProxyAgent(
         name="User",
-        system_message="You are a human who analyzes the recommendation of the network agent and either asks for clarifications or approves the recommendaitons",
+        system_message=REVIEWER_SYSTEM_MESSAGE,
         llm_config=False,
         is_termination_msg=lambda msg: msg.get("content") is not None and "TERMINATE" in msg["content"],
         human_input_mode="NEVER",
@@ -46,15 +72,59 @@ def create_agents():
             # You can add other configurations here if necessary
         },
     )
+    # Check each analysis as soon as the group chat returns it: a valid result ends the chat,
+    # a malformed one gets a targeted repair prompt instead of another full round
+    user_proxy.register_reply(GroupChatManager, make_validation_reply(), position=0, config={"count": 0})
     
     human_agent = ConversableAgent(
         name="Human_Agent",
-        system_message="You are a human who analyzes the recommendation of the network agent and either asks for clarifications or approves the recommendaitons",
-        llm_config={"config_list": [{"model": os.getenv("MODEL_AGENT"), "api_key": os.getenv("OPENAI_API_KEY")}]},
+        system_message=REVIEWER_SYSTEM_MESSAGE,
+        llm_config=llm_config_for("triage"),
         human_input_mode="ALWAYS"
     )
     return network_agent, user_proxy, human_agent
 
+
+def create_group_chat():
+    """
+    Creates the agents of the groupchat analysis mode and the manager running their chat.
+
+    Returns:
+        tuple: The user proxy that starts the chat and the GroupChatManager.
+    """
+    from autogen import GroupChat, GroupChatManager
+
+    logging.info("Creating agents")
+    network_agent, user_proxy, human_agent = create_agents()
+    logging.info("Agents created successfully")
+
+    logger.info("AssistantAgent: Initialized successfully.")
+    logger.info("UserProxyAgent: Initialized successfully.")
+
+    # Initialize GroupChat with agents and configuration. Speakers take turns in list order
+    # (User hands over to the Assistant), so no LLM call is spent on speaker selection.
+    group_chat = GroupChat(
+        agents=[user_proxy, network_agent, human_agent],
+        messages=[],
+        max_round=2,
+        speaker_selection_method="round_robin",
+        allow_repeat_speaker=False,
+    )
+    logger.info("GroupChat: Initialized successfully.")
+
+    # The manager's model writes the reflection_with_llm summary, so it uses the summary tier
+    group_chat_manager = GroupChatManager(
+        groupchat=group_chat,
+        llm_config=llm_config_for("summary")
+    )
+    logger.info("GroupChatManager: Initialized successfully.")
+    return user_proxy, group_chat_manager
+
+
+@contextmanager
+def new_group_chat():
+    yield create_group_chat()
+
 #create a private function that calls the DataCollector class and returns the data
 
 def _format_analysis_result(chat_history):
@@ -67,82 +137,225 @@ def _format_analysis_result(chat_history):
     Returns:
         str: A formatted string representation of the analysis with bullet points.
     """
-    formatted_output = "=== Network Analysis Report ===\n\n"
-    
+    lines = ["=== Network Analysis Report ===", ""]
     for idx, message in enumerate(chat_history, start=1):
         agent_name = message.get('agent', 'Unknown Agent')
         content = message.get('content', '')
-        formatted_output += f"--- Message {idx} from {agent_name} ---\n"
-        # Split content into lines and format each line as a bullet point
-        for line in content.split('\n'):
-            if line.strip():  # Avoid empty lines
-                formatted_output += f"  - {line.strip()}\n"
-        formatted_output += "\n"
-    
-    formatted_output += "===============================\n"
-    return formatted_output
+        lines.append(f"--- Message {idx} from {agent_name} ---")
+        # Split content into lines and format each line as a bullet point, skipping empty lines
+        lines.extend(f"  - {line.strip()}" for line in content.split('\n') if line.strip())
+        lines.append("")
+    lines.append("===============================")
+    return "\n".join(lines) + "\n"
+
 
 
+def print_recommendations_to_file(recommendations, path="recommendations.txt"):
+    # Accepts the analysis result dict, a list of recommendations or a single block of text
+    if isinstance(recommendations, dict):
+        recommendations = recommendations.get("recommendations") or []
+    elif isinstance(recommendations, str):
+        recommendations = [recommendations]
+    with open(path, "w") as file:
+        file.writelines(f"{recommendation}\n" for recommendation in recommendations)
 
-def print_recommendations_to_file(recommendations):
-    with open("recommendations.txt", "w") as file:
-        for recommendation in recommendations:
-            file.write(recommendation + "\n")
+
+def check_llm_config():
+    # The fake backend (LLM_BACKEND=fake) runs without an API key
+    if not os.getenv("OPENAI_API_KEY") and os.getenv("LLM_BACKEND") != "fake":
+        logger.error("OPENAI_API_KEY is not set in environment variables.")
+        exit(1)
 
 
 def main():
+    from test_connection import DataCollector
+    from load_data import DataLoader
+
     logger.info("Starting UniFi AI Agents workflow.")
+    check_llm_config()
 
-    data_collector = DataCollector()
-    
-    
+    # Stages, controller requests and LLM calls are traced to TRACE_FILE when it is set
+    with trace_run("workflow"):
+        data_collector = DataCollector()
 
-    try:
-        logging.info("Starting data collection")
-        data_collector.collect_data()
-        logging.info("Data collection completed successfully")
-    except Exception as e:
-        logging.error(f"Error during data collection: {str(e)}")
-        return f"Data collection failed: {str(e)}"
+        try:
+            logging.info("Starting data collection")
+            data_collector.collect_data()
+            logging.info("Data collection completed successfully")
+        except Exception as e:
+            logging.error(f"Error during data collection: {str(e)}")
+            return f"Data collection failed: {str(e)}"
 
-    logging.info("Creating agents")
-    network_agent, user_proxy, human_agent = create_agents()
-    logging.info("Agents created successfully")
-    
-    #load all the unifi data and configuration into a single prompt string
-    data_loader = DataLoader()
-   
-    prompt = data_loader.generate_prompt()
+        #load all the unifi data and configuration into a single prompt string
+        data_loader = DataLoader()
+        data = data_loader.load_all_data()
+        result = analyze(data_loader, data)
+    print_recommendations_to_file(result)
+    return result
 
-    # [Existing code to set up llm_prompt]
 
-    logger.info("AssistantAgent: Initialized successfully.")
-    logger.info("UserProxyAgent: Initialized successfully.")
+def analyze(data_loader, data):
+    # Record tokens, latency and cost of every LLM call made during the analysis
+    monitor = LLMUsageMonitor()
+    # Messages are streamed into the report as they arrive; the result completes it
+    with monitor.instrument(), ReportWriter() as report, span("analysis"):
+        result = run_analysis(data_loader, data, report)
+        report.result(result)
+    monitor.log_summary()
+    monitor.write_report(os.getenv("LLM_USAGE_REPORT", "llm_usage.json"))
+    return result
 
-    # Initialize GroupChat with agents and configuration
-    group_chat = GroupChat(
-        agents=[network_agent, user_proxy, human_agent],
-        messages=[],
-        max_round=2
-    )
-    logger.info("GroupChat: Initialized successfully.")
 
-    group_chat_manager = GroupChatManager(
-        groupchat=group_chat,
-        llm_config={"config_list": [{"model": os.getenv("MODEL_AGENT"), "api_key": os.getenv("OPENAI_API_KEY")}]}
-    )
-    logger.info("GroupChatManager: Initialized successfully.")
+def _baseline_store(data_loader):
+    # A collected snapshot is its own baseline: it keeps its analysis and the store's BASELINE
+    # pointer names it. BASELINE_DIR, or datasets written in place, keep a copy under baseline/.
+    if os.getenv("BASELINE_DIR"):
+        return None
+    return store_of(data_loader.snapshot_directory)
 
-    analysis_result = user_proxy.initiate_chat(
-        group_chat_manager, 
-        message=prompt, 
-        summary_method="reflection_with_llm",
-        max_turns=6,
-        speaker_selection_method="round_robin",
-        allow_repeat_speaker=False,
+
+def _baseline_dir(data_loader):
+    return os.getenv("BASELINE_DIR", os.path.join(data_loader.data_directory, "baseline"))
+
+
+def load_previous_baseline(data_loader):
+    """
+    Returns the data and analysis of the last analyzed snapshot, or (None, None).
+    """
+    store = _baseline_store(data_loader)
+    if store is None:
+        return load_baseline(_baseline_dir(data_loader))
+    baseline_dir = store.baseline()
+    return load_baseline(baseline_dir) if baseline_dir else (None, None)
+
+
+def save_analyzed_baseline(data_loader, data, analysis):
+    """
+    Records the analyzed snapshot and its analysis as the baseline of the next delta analysis.
+    """
+    store = _baseline_store(data_loader)
+    if store is None:
+        save_baseline(_baseline_dir(data_loader), data, analysis)
+        return
+    save_baseline(data_loader.snapshot_directory, data, analysis, copy_data=False)
+    store.set_baseline(store.snapshot_id(data_loader.snapshot_directory))
+
+
+def run_analysis(data_loader, data, report=None, agents=None):
+    # agents, e.g. a batch_analysis.AgentPool, supplies reused agents instead of new ones per run
+    from analysis_result import find_analysis_result, validate_with_repair
+    from shard_analysis import _ask, run_map_reduce_analysis, run_section_analysis
+
+    prompt = None
+    analysis_mode = os.getenv("ANALYSIS_MODE", "groupchat")
+    agent_factory = agents.analysis_agent if agents else create_analysis_agent
+    group_chat = agents.group_chat if agents else new_group_chat
+
+    # Delta mode: only send what changed since the last analyzed snapshot
+    if os.getenv("DELTA_ANALYSIS") == "1":
+        baseline, previous_analysis = load_previous_baseline(data_loader)
+        if baseline is not None:
+            diff = diff_snapshots(baseline, data)
+            if not diff["significant"]:
+                logger.info("No significant network changes since the previous analysis.")
+                return _reuse_result(data_loader, data, previous_analysis, "delta")
+            logger.info(f"Re-analyzing changes: {', '.join(diff['significant'])}")
+            prompt = data_loader.create_delta_prompt(diff, previous_analysis)
+            analysis_mode = "groupchat"
+
+    # The group chat sends the full prompt; mapreduce and sections build their own prompts
+    # from the datasets, so their requests are identified by the datasets instead
+    if prompt is None and analysis_mode not in ("mapreduce", "sections"):
+        prompt = data_loader.create_prompt(data)
+
+    # Reuse the previous result when an equivalent request was already analyzed
+    llm_cache = None if os.getenv("LLM_CACHE_BYPASS") == "1" else LLMResponseCache()
+    models = ",".join(model_for(role) or "" for role in MODEL_TIERS)
+    cache_key = LLMResponseCache.make_key(
+        models,
+        [analysis_mode, NETWORK_AGENT_SYSTEM_MESSAGE, REVIEWER_SYSTEM_MESSAGE, _prompt_settings()],
+        prompt if prompt is not None else json.dumps(data, sort_keys=True, separators=(",", ":")),
     )
+    cached = llm_cache.get(cache_key) if llm_cache else None
+    if cached is not None:
+        logger.info("Using cached analysis result, skipping the LLM round trip.")
+        return _reuse_result(data_loader, data, cached["summary"], analysis_mode)
+
+    # Large sites: analyze each access point concurrently, then merge into one report.
+    # Sections: analyze performance, RF and security concurrently, then merge.
+    if analysis_mode in ("mapreduce", "sections"):
+        run = run_map_reduce_analysis if analysis_mode == "mapreduce" else run_section_analysis
+        with span(analysis_mode):
+            analysis = run(data_loader, data, agent_factory, on_result=report.message if report else None)
+        logger.info(f"{analysis_mode} analysis completed:\n{analysis}")
+        repair_agent = agent_factory("Repair_Agent", "summary")
+        with span("validate"):
+            result = validate_with_repair(analysis, lambda repair: _ask(repair_agent, repair))
+        analysis = _typed_result(data_loader, result, analysis_mode) or analysis
+        if llm_cache:
+            llm_cache.set(cache_key, {"summary": analysis, "chat_history": []}, models)
+        save_analyzed_baseline(data_loader, data, analysis)
+        return analysis
+
+    # [Existing code to set up llm_prompt]
+
+    with group_chat() as (user_proxy, group_chat_manager):
+        if report:
+            for agent in group_chat_manager.groupchat.agents:
+                if agent is not user_proxy:
+                    agent.register_hook("process_message_before_send", report.process_message_before_send)
+
+        with span("chat", mode=analysis_mode):
+            analysis_result = user_proxy.initiate_chat(
+                group_chat_manager,
+                message=prompt,
+                summary_method="reflection_with_llm",
+                max_turns=6,
+            )
+    result = find_analysis_result(analysis_result.chat_history)
+    if result is None:
+        logger.error("The group chat did not produce a valid analysis result.")
+    analysis = _typed_result(data_loader, result, analysis_mode) or analysis_result.summary
+    if llm_cache:
+        llm_cache.set(
+            cache_key,
+            {"summary": analysis, "chat_history": analysis_result.chat_history},
+            models,
+        )
     #this needs work to format the output to be human readable
     #formatted_output = _format_analysis_result(analysis_result.chat_history)
+    save_analyzed_baseline(data_loader, data, analysis)
+    return analysis
+
+
+def _prompt_settings():
+    # Settings that change the prompts built from the same datasets
+    return {name: os.getenv(name) for name in
+            ("PROMPT_AGGREGATES", "PROMPT_TOKEN_BUDGET", "CHANNEL_PLAN", "CHANNEL_PLAN_DFS")}
+
+
+def _reuse_result(data_loader, data, analysis, analysis_mode):
+    # A reused result (unchanged snapshot or cache hit) is saved with the new snapshot, so its
+    # report can be rendered, and the snapshot becomes the baseline of the next delta analysis
+    from analysis_result import AnalysisResult
+
+    if isinstance(analysis, dict):
+        try:
+            _typed_result(data_loader, AnalysisResult.model_validate(analysis), analysis_mode)
+        except ValueError as e:
+            logger.warning(f"Reused analysis result is not valid, not saving it with the snapshot: {e}")
+    save_analyzed_baseline(data_loader, data, analysis)
+    return analysis
+
+
+def _typed_result(data_loader, result, analysis_mode):
+    # Persist a validated result in the analyzed snapshot's directory and return it as a plain dict
+    from analysis_result import save_analysis_result
+
+    if result is None:
+        return None
+    save_analysis_result(data_loader.snapshot_directory, result, mode=analysis_mode)
+    return result.model_dump()
     
 
 if __name__ == "__main__":